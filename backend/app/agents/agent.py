@@ -4,21 +4,50 @@ execution flow using LangGraph.
 """
 
 import asyncio
-import json
+import logging
 import operator
-from typing import Annotated, TypedDict, Union
+from typing import (
+    Annotated,
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+    TypedDict,
+    Union
+)
 
-from langchain.memory import ConversationBufferMemory
-from langchain_community.utilities import WikipediaAPIWrapper
-from langgraph.graph import END, StateGraph
+from langchain_core.callbacks.manager import adispatch_custom_event
+from langchain_core.documents import Document
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
 from pydantic import BaseModel, Field, ValidationError
 
+from backend.app.agents import budget
+from backend.app.agents.answer_store import get_answer_store, log_interaction
 from backend.app.agents.rag_memory import (
+    PrefetchedRetriever,
     generate_response,
-    initialize_rag_chat_chain
+    initialize_rag_chat_chain,
+    is_self_contained
+)
+from backend.app.agents.supervisor_parser import (
+    SupervisorOutputError,
+    SupervisorStreamParser
 )
+from backend.app.agents.topic_gate import TOPIC_REFUSAL, get_topic_gate
+from backend.app.config.settings import get_settings
 from backend.app.utils import get_model
 
+logger = logging.getLogger(__name__)
+
+# Characters of an unparseable supervisor response kept in the logs.
+RESPONSE_PREVIEW_CHARS = 500
+# Custom event carrying the answer text parsed from the supervisor output.
+SUPERVISOR_ANSWER_EVENT = "supervisor_answer"
+
 
 class FinalAnswer(BaseModel):
     """Final Answer: The response is of high quality and ready for the user."""
@@ -65,10 +94,83 @@ class GraphState(TypedDict):
     """
 
     user_question: str
+    retrieved_documents: Optional[List[Document]]
     rag_answer: str
     supervisor_decision: SupervisorDecision
     final_answer: str
     revision_count: Annotated[int, operator.add]
+    deadline: float
+    degradations: Annotated[List[str], operator.add]
+    trace: Annotated[Dict[str, Any], operator.or_]
+    memory: Optional[Any]
+    session_id: str
+    wikipedia_search: Optional[asyncio.Task]
+
+
+SUPERVISOR_SYSTEM_PROMPT = """
+Tu rol es ser un Supervisor de Calidad de IA. Analiza la respuesta
+del RAG y decide el siguiente paso. Debes responder **SOLO** con
+un objeto JSON que contenga dos campos: "type" y "data", en ese
+orden.
+
+El campo "type" debe ser uno de los siguientes strings:
+- "FinalAnswer" (si la respuesta del RAG es excelente y está
+   lista para el usuario)
+- "CorrectAndRefine" (si la respuesta del RAG es correcta pero
+  necesita mejoras de estilo o claridad)
+- "ComplementWithWikipedia" (si la respuesta del RAG es buena
+  pero se beneficiaría de contexto adicional de Wikipedia)
+
+El campo "data" debe ser un JSON que corresponda al tipo elegido:
+
+Si "type" es "FinalAnswer":
+{
+    "answer": "La respuesta final, clara y bien formada, para ser
+              mostrada directamente al usuario."
+}
+
+Si "type" es "CorrectAndRefine":
+{
+    "reasoning": "Explicación concisa de por qué la respuesta
+                 necesita ser refinada.",
+    "corrected_answer": "La versión mejorada y corregida de la
+                        respuesta."
+}
+
+Si "type" es "ComplementWithWikipedia":
+{
+    "search_query": "La consulta de búsqueda optimizada para
+                    Wikipedia (ej. 'Economic Order Quantity').",
+    "reasoning": "Explicación de por qué se necesita contexto
+                 adicional y qué se va a buscar."
+}
+
+**Ejemplo de respuesta JSON:**
+```json
+{
+    "type": "FinalAnswer",
+    "data": {
+        "answer": "El Just-in-Time es una filosofía de producción
+                  que busca eliminar el desperdicio..."
+    }
+}
+```
+
+La pregunta original y la respuesta del RAG a evaluar llegan en el
+siguiente mensaje.
+"""
+
+MERGE_SYSTEM_PROMPT = """
+Combina la respuesta original con el contexto
+de Wikipedia de forma natural.
+"""
+
+
+def _response_preview(content: str) -> dict:
+    return {
+        "response_preview": content[:RESPONSE_PREVIEW_CHARS],
+        "response_chars": len(content),
+    }
 
 
 class RefinementAgent:
@@ -78,114 +180,95 @@ class RefinementAgent:
 
     def __init__(self):
         """
-        Initializes the RefinementAgent by loading the language model (LLM).
+        Initializes the RefinementAgent by loading the language models (LLM)
+        for the supervision and the Wikipedia merge steps.
         """
-        self.llm = get_model()
+        self.supervisor_llm = get_model("supervise")
+        self.merge_llm = get_model("merge")
 
     def _create_supervisor_prompt(
         self,
         user_question: str,
         rag_answer: str
-    ) -> str:
+    ) -> List[BaseMessage]:
         """
         Create the prompt for the LLM supervisor, instructing it to
-        return a structured decision in JSON format.
+        return a structured decision in JSON format. The instructions
+        are a static system message so Azure OpenAI can cache them.
 
         Args:
             user_question (str): User message.
             rag_answer (str): RAG response.
 
         Returns:
-            str: Prompt well-formated for a language model.
-        """
-        return f"""
-        Tu rol es ser un Supervisor de Calidad de IA. Analiza la respuesta
-        del RAG y decide el siguiente paso. Debes responder **SOLO** con
-        un objeto JSON que contenga dos campos: "type" y "data".
-
-        El campo "type" debe ser uno de los siguientes strings:
-        - "FinalAnswer" (si la respuesta del RAG es excelente y está
-           lista para el usuario)
-        - "CorrectAndRefine" (si la respuesta del RAG es correcta pero
-          necesita mejoras de estilo o claridad)
-        - "ComplementWithWikipedia" (si la respuesta del RAG es buena
-          pero se beneficiaría de contexto adicional de Wikipedia)
-
-        El campo "data" debe ser un JSON que corresponda al tipo elegido:
-
-        Si "type" es "FinalAnswer":
-        {{
-            "answer": "La respuesta final, clara y bien formada, para ser
-                      mostrada directamente al usuario."
-        }}
-
-        Si "type" es "CorrectAndRefine":
-        {{
-            "reasoning": "Explicación concisa de por qué la respuesta
-                         necesita ser refinada.",
-            "corrected_answer": "La versión mejorada y corregida de la
-                                respuesta."
-        }}
-
-        Si "type" es "ComplementWithWikipedia":
-        {{
-            "reasoning": "Explicación de por qué se necesita contexto
-                         adicional y qué se va a buscar.",
-            "search_query": "La consulta de búsqueda optimizada para
-                            Wikipedia (ej. 'Economic Order Quantity')."
-        }}
-
-        **Ejemplo de respuesta JSON:**
-        ```json
-        {{
-            "type": "FinalAnswer",
-            "data": {{
-                "answer": "El Just-in-Time es una filosofía de producción
-                          que busca eliminar el desperdicio..."
-            }}
-        }}
-        ```
-
-        **Pregunta Original:** "{user_question}"
-        **Respuesta del RAG:** "{rag_answer}"
-
-        Tu respuesta JSON:
+            List[BaseMessage]: Messages well-formated for a language model.
         """
+        return [
+            SystemMessage(content=SUPERVISOR_SYSTEM_PROMPT),
+            HumanMessage(
+                content=(
+                    f'**Pregunta Original:** "{user_question}"\n'
+                    f'**Respuesta del RAG:** "{rag_answer}"\n\n'
+                    "Tu respuesta JSON:"
+                )
+            ),
+        ]
 
     async def review_answer(
-        self, user_question: str, rag_answer: str
+        self,
+        user_question: str,
+        rag_answer: str,
+        on_answer_delta: Optional[Callable[[str], Awaitable[None]]] = None,
+        on_search_query: Optional[Callable[[str], None]] = None
     ) -> SupervisorDecision:
         """
         Reviews the answer generated by the RAG agent and
         decides the action to follow, eather approve, refine
         or complement with Wikipedia.
 
+        The decision is parsed while the supervisor streams it, so the
+        next step can start before the completion ends: the text of the
+        approved or corrected answer is passed on as it arrives, and the
+        Wikipedia query as soon as it is complete.
+
         Args:
             user_question (str): User message.
             rag_answer (str): RAG response.
+            on_answer_delta (Callable, optional): Awaited with every new
+                piece of the answer text.
+            on_search_query (Callable, optional): Called with the
+                Wikipedia query once it is complete.
 
         Returns:
             SupervisorDecision: FinalAnswer, CorrectAndRefine
                                 or ComplementWithWikipedia.
+
+        Raises:
+            SupervisorOutputError: If the output is not a valid decision.
         """
         prompt = self._create_supervisor_prompt(user_question, rag_answer)
 
-        llm_response = await self.llm.ainvoke(prompt)
-        response_content = llm_response.content.strip()
-
-        if (
-            response_content.startswith("```json")
-            and response_content.endswith("```")
-        ):
-            response_content = response_content[
-                len("```json"):-len("```")
-            ].strip()
-
+        parser = SupervisorStreamParser()
+        search_query = None
+        async for chunk in self.supervisor_llm.astream(prompt):
+            delta = parser.feed(chunk.content)
+            if delta and on_answer_delta is not None:
+                await on_answer_delta(delta)
+            if (
+                search_query is None
+                and parser.decision_type == "ComplementWithWikipedia"
+                and parser.search_query
+            ):
+                search_query = parser.search_query
+                if on_search_query is not None:
+                    on_search_query(search_query)
+
+        response_content = "".join(parser.text)
         try:
-            parsed_json = json.loads(response_content)
+            parsed_json = parser.result()
 
             response_type = parsed_json.get("type")
-            response_data = parsed_json.get("data")
+            response_data = parsed_json["data"]
 
             if response_type == "FinalAnswer":
                 return FinalAnswer(**response_data)
@@ -193,52 +276,15 @@ class RefinementAgent:
                 return CorrectAndRefine(**response_data)
             elif response_type == "ComplementWithWikipedia":
                 return ComplementWithWikipedia(**response_data)
-            else:
-                print(
-                    f"Advertencia:"
-                    f"Tipo de decisión no reconocido: {response_type}."
-                    f"Devolviendo respuesta original."
-                )
-                return FinalAnswer(
-                    answer=f"""Hubo un problema al procesar la respuesta.
-                    Tipo de decisión no reconocido: {response_type}.
-                    Respuesta original: {rag_answer}
-                    """
-                )
-
-        except json.JSONDecodeError:
-            print(
-                f"Error: Respuesta de LLM no es un JSON válido."
-                f"Respuesta: {response_content}"
-            )
-            return FinalAnswer(
-                answer=f"""Hubo un problema al procesar la respuesta.
-                El LLM no devolvió un JSON válido.
-                Respuesta original: {rag_answer}
-                """
-            )
-        except ValidationError as e:
-            print(
-                f"Error validación Pydantic: {e}."
-                f"Respuesta: {response_content}"
+            raise SupervisorOutputError(
+                f"Tipo de decisión no reconocido: {response_type}."
             )
-            return FinalAnswer(
-                answer=f"""Hubo un problema al procesar la respuesta.
-                Error de validación: {e}.
-                Respuesta original: {rag_answer}
-                """
-            )
-        except Exception as e:
-            print(
-                f"Error inesperado al procesar la respuesta del LLM: {e}."
-                f"Respuesta: {response_content}"
-            )
-            return FinalAnswer(
-                answer=f"""Hubo un problema al procesar la respuesta.
-                Error: {e}.
-                Respuesta original: {rag_answer}
-                """
+        except (SupervisorOutputError, ValidationError) as e:
+            logger.warning(
+                f"Salida del supervisor no válida: {e}",
+                extra=_response_preview(response_content),
             )
+            raise SupervisorOutputError(str(e)) from e
 
     async def combine_with_wikipedia(
         self, original_answer: str, wiki_context: str
@@ -254,82 +300,291 @@ class RefinementAgent:
         Returns:
             str: The final enriched answer.
         """
-        prompt = f"""
-        Combina la respuesta original con el contexto
-        de Wikipedia de forma natural.
-
-        Respuesta Original: "{original_answer}"
-        Contexto Wikipedia: "{wiki_context}"
-        Respuesta Combinada:
-        """
-        response = await self.llm.ainvoke(prompt)
+        prompt = [
+            SystemMessage(content=MERGE_SYSTEM_PROMPT),
+            HumanMessage(
+                content=(
+                    f'Respuesta Original: "{original_answer}"\n'
+                    f'Contexto Wikipedia: "{wiki_context}"\n'
+                    "Respuesta Combinada:"
+                )
+            ),
+        ]
+        response = await self.merge_llm.ainvoke(prompt)
         return response.content
 
 
-refinement_agent = RefinementAgent()
+async def search_wikipedia(query: str) -> str:
+    """
+    Look up a query in Wikipedia.
+
+    Args:
+        query (str): Search query.
+
+    Returns:
+        str: Content of the best matching page.
+    """
+    from langchain_community.utilities import WikipediaAPIWrapper
+
+    wiki_tool = WikipediaAPIWrapper(
+        top_k_results=1,
+        doc_content_chars_max=2500
+    )
+    return await asyncio.to_thread(wiki_tool.run, query)
+
+
+def _discard(task: Optional[asyncio.Task]):
+    if task is None:
+        return
+    task.cancel()
+    if task.done() and not task.cancelled():
+        # Retrieve it, so an error doesn't surface as never retrieved.
+        task.exception()
+
+
+_refinement_agent = None
+
+
+def get_refinement_agent() -> RefinementAgent:
+    """
+    Obtains the shared RefinementAgent, creating its model clients on
+    first use instead of at import time.
+
+    Returns:
+        RefinementAgent: The shared refinement agent.
+    """
+    global _refinement_agent
+    if _refinement_agent is None:
+        _refinement_agent = RefinementAgent()
+    return _refinement_agent
 
 
 async def call_rag_agent(state: GraphState) -> dict:
-    """Node that invokes the RAG agent to get the initial response."""
-    print("--- Nodo: Call RAG Agent ---")
+    """
+    Node that invokes the RAG agent to get the initial response, using
+    the conversation memory of the session when there is one. If the
+    budget runs out, it falls back to a cached answer for the question.
+    """
+    logger.info(
+        "Nodo: call_rag_agent",
+        extra={"node": "call_rag_agent", "sampled": True},
+    )
+    from langchain.memory import ConversationBufferMemory
+
     user_question = state["user_question"]
-    memory = ConversationBufferMemory(
+    memory = state.get("memory") or ConversationBufferMemory(
         memory_key="chat_history",
         return_messages=True
     )
-    rag_chain = initialize_rag_chat_chain(memory)
-    response = await generate_response(
-        rag_chain,
-        user_question,
-        "langgraph_session"
-    )
-    return {"rag_answer": response, "revision_count": 1}
+    retriever = None
+    if state.get("retrieved_documents") is not None:
+        retriever = PrefetchedRetriever(
+            documents=state["retrieved_documents"]
+        )
+    rag_chain = initialize_rag_chat_chain(memory, retriever)
+    trace = {}
+    try:
+        response = await asyncio.wait_for(
+            generate_response(
+                rag_chain,
+                user_question,
+                state.get("session_id") or "langgraph_session",
+                trace
+            ),
+            timeout=budget.remaining(state) or 0.001,
+        )
+    except asyncio.TimeoutError:
+        cached_answer = None
+        if _is_cacheable(user_question, state.get("memory")):
+            cached_answer = budget.answer_cache.get(user_question)
+        if cached_answer is not None:
+            logger.info(
+                "Presupuesto agotado: respuesta en caché.",
+                extra={"node": "call_rag_agent", "sampled": True},
+            )
+            return {
+                "rag_answer": cached_answer,
+                "revision_count": 1,
+                "degradations": [budget.CACHED_ANSWER],
+            }
+        logger.info(
+            "Presupuesto agotado: sin respuesta disponible.",
+            extra={"node": "call_rag_agent", "sampled": True},
+        )
+        return {
+            "rag_answer": budget.BUDGET_EXHAUSTED_ANSWER,
+            "revision_count": 1,
+            "degradations": [budget.NO_ANSWER],
+        }
+    return {"rag_answer": response, "revision_count": 1, "trace": trace}
 
 
 async def call_supervisor_agent(state: GraphState) -> dict:
-    """Node that invokes the supervisor agent to evaluate the RAG response."""
-    print("--- Nodo: Call Supervisor Agent ---")
+    """
+    Node that invokes the supervisor agent to evaluate the RAG response.
+    The RAG answer is approved as is when the budget left is too short
+    for a review, when the review does not finish in time or when its
+    output is malformed.
+
+    The review is routed while it streams: the answer text is sent to
+    the client as a draft and the Wikipedia search starts as soon as
+    the supervisor has written its query.
+    """
+    logger.info(
+        "Nodo: call_supervisor_agent",
+        extra={"node": "call_supervisor_agent", "sampled": True},
+    )
+    settings = get_settings()
     user_question = state["user_question"]
     rag_answer = state["rag_answer"]
-    decision = await refinement_agent.review_answer(user_question, rag_answer)
-    print(f"   -> Decisión: {type(decision).__name__}")
-    return {"supervisor_decision": decision}
+
+    if state.get("degradations"):
+        return {"supervisor_decision": FinalAnswer(answer=rag_answer)}
+
+    time_left = budget.remaining(state)
+    if time_left < settings.SUPERVISOR_MIN_BUDGET_SECONDS:
+        logger.info(
+            f"Presupuesto insuficiente ({time_left:.1f} s).",
+            extra={"node": "call_supervisor_agent", "sampled": True},
+        )
+        return {
+            "supervisor_decision": FinalAnswer(answer=rag_answer),
+            "degradations": [budget.SKIP_SUPERVISOR],
+        }
+
+    search = None
+
+    async def stream_answer(delta: str):
+        await adispatch_custom_event(
+            SUPERVISOR_ANSWER_EVENT, {"content": delta}
+        )
+
+    def start_search(query: str):
+        nonlocal search
+        logger.info(
+            f"Buscando en Wikipedia: '{query}'",
+            extra={"node": "call_supervisor_agent", "sampled": True},
+        )
+        search = asyncio.ensure_future(search_wikipedia(query))
+
+    try:
+        decision = await asyncio.wait_for(
+            get_refinement_agent().review_answer(
+                user_question,
+                rag_answer,
+                on_answer_delta=stream_answer,
+                on_search_query=start_search,
+            ),
+            timeout=time_left,
+        )
+    except asyncio.TimeoutError:
+        _discard(search)
+        logger.info(
+            "Supervisor sin respuesta a tiempo.",
+            extra={"node": "call_supervisor_agent", "sampled": True},
+        )
+        return {
+            "supervisor_decision": FinalAnswer(answer=rag_answer),
+            "degradations": [budget.SUPERVISOR_TIMEOUT],
+        }
+    except SupervisorOutputError:
+        _discard(search)
+        return {
+            "supervisor_decision": FinalAnswer(answer=rag_answer),
+            "degradations": [budget.SUPERVISOR_MALFORMED],
+        }
+    except BaseException:
+        _discard(search)
+        raise
+
+    if not isinstance(decision, ComplementWithWikipedia):
+        _discard(search)
+        search = None
+    logger.info(
+        f"Decisión: {type(decision).__name__}",
+        extra={
+            "node": "call_supervisor_agent",
+            "decision": type(decision).__name__,
+            "sampled": True,
+        },
+    )
+    return {"supervisor_decision": decision, "wikipedia_search": search}
 
 
 async def enrich_with_wikipedia(state: GraphState) -> dict:
-    """Node that enriches the response with information from Wikipedia."""
-    print("--- Nodo: Enrich with Wikipedia ---")
+    """
+    Node that enriches the response with information from Wikipedia.
+    The RAG answer is returned instead when the budget left is too short
+    for the lookup and the merge, or when they do not finish in time.
+    """
+    logger.info(
+        "Nodo: enrich_with_wikipedia",
+        extra={"node": "enrich_with_wikipedia", "sampled": True},
+    )
+    settings = get_settings()
     decision = state["supervisor_decision"]
     rag_answer = state["rag_answer"]
+    search = state.get("wikipedia_search")
+
+    time_left = budget.remaining(state)
+    if time_left < settings.ENRICHMENT_MIN_BUDGET_SECONDS:
+        _discard(search)
+        logger.info(
+            f"Presupuesto insuficiente ({time_left:.1f} s).",
+            extra={"node": "enrich_with_wikipedia", "sampled": True},
+        )
+        return {
+            "final_answer": rag_answer,
+            "degradations": [budget.SKIP_ENRICHMENT],
+        }
+
+    async def enrich() -> str:
+        if search is not None:
+            # Started by the supervisor node while it was streaming.
+            wiki_context = await search
+        else:
+            logger.info(
+                f"Buscando en Wikipedia: '{decision.search_query}'",
+                extra={"node": "enrich_with_wikipedia", "sampled": True},
+            )
+            wiki_context = await search_wikipedia(decision.search_query)
 
-    print(f"   -> Buscando en Wikipedia: '{decision.search_query}'")
-    wiki_tool = WikipediaAPIWrapper(
-        top_k_results=1,
-        doc_content_chars_max=2500
-    )
-    wiki_context = await asyncio.to_thread(
-        wiki_tool.run,
-        decision.search_query
-    )
+        logger.info(
+            "Combinando respuestas...",
+            extra={"node": "enrich_with_wikipedia", "sampled": True},
+        )
+        return await get_refinement_agent().combine_with_wikipedia(
+            rag_answer, wiki_context
+        )
 
-    print("   -> Combinando respuestas...")
-    final_answer = await refinement_agent.combine_with_wikipedia(
-        rag_answer, wiki_context
-    )
+    try:
+        final_answer = await asyncio.wait_for(enrich(), timeout=time_left)
+    except asyncio.TimeoutError:
+        _discard(search)
+        logger.info(
+            "Enriquecimiento sin respuesta a tiempo.",
+            extra={"node": "enrich_with_wikipedia", "sampled": True},
+        )
+        return {
+            "final_answer": rag_answer,
+            "degradations": [budget.ENRICHMENT_TIMEOUT],
+        }
     return {"final_answer": final_answer}
 
 
 async def prepare_final_response(state: GraphState) -> dict:
     """Node that prepares the final response when Wikipedia is not required."""
-    print("--- Nodo: Prepare Final Response ---")
     decision = state["supervisor_decision"]
     if isinstance(decision, FinalAnswer):
-        print("   -> Acción: Aprobar respuesta.")
+        logger.info(
+            "Acción: Aprobar respuesta.",
+            extra={"node": "prepare_final_response", "sampled": True},
+        )
         return {"final_answer": decision.answer}
     elif isinstance(decision, CorrectAndRefine):
-        print(
-            f"   -> Acción: Aplicar refinamiento."
-            f"Razón: {decision.reasoning}"
+        logger.info(
+            f"Acción: Aplicar refinamiento. Razón: {decision.reasoning}",
+            extra={"node": "prepare_final_response", "sampled": True},
         )
         return {"final_answer": decision.corrected_answer}
     return {}
@@ -337,18 +592,21 @@ async def prepare_final_response(state: GraphState) -> dict:
 
 def route_decision(state: GraphState) -> str:
     """Routing that decides the next step based on the supervisor's decision"""
-    print("--- Router: Route Decision ---")
     decision = state["supervisor_decision"]
     if isinstance(decision, ComplementWithWikipedia):
-        print("   -> Ruta: a enrich_with_wikipedia")
-        return "enrich_with_wikipedia"
+        route = "enrich_with_wikipedia"
     else:
-        print("   -> Ruta: a prepare_final_response")
-        return "prepare_final_response"
+        route = "prepare_final_response"
+    logger.info(
+        f"Ruta: a {route}", extra={"route": route, "sampled": True}
+    )
+    return route
 
 
 def build_graph():
     """Construct and compile the LangGraph workflow."""
+    from langgraph.graph import END, StateGraph
+
     workflow = StateGraph(GraphState)
 
     workflow.add_node("call_rag_agent", call_rag_agent)
@@ -372,22 +630,328 @@ def build_graph():
     return workflow.compile()
 
 
-async def process_user_question(user_question: str) -> str:
+_graph = None
+
+
+def get_graph():
     """
-    Process the user's question through the LangGraph flow
-    and return the final answer.
+    Obtains the compiled LangGraph workflow, compiling it only once.
+
+    Returns:
+        CompiledStateGraph: The compiled workflow.
+    """
+    global _graph
+    if _graph is None:
+        _graph = build_graph()
+    return _graph
+
+
+def _graph_inputs(
+    user_question: str,
+    retrieved_documents: Optional[List[Document]] = None,
+    budget_seconds: Optional[float] = None,
+    memory: Optional[Any] = None,
+    session_id: Optional[str] = None,
+    deadline: Optional[float] = None
+) -> dict:
+    if deadline is None:
+        deadline = budget.new_deadline(budget_seconds)
+    return {
+        "user_question": user_question,
+        "retrieved_documents": retrieved_documents,
+        "deadline": deadline,
+        "degradations": [],
+        "trace": {},
+        "memory": memory,
+        "session_id": session_id or "langgraph_session",
+        "wikipedia_search": None,
+    }
+
+
+async def _is_off_topic(user_question: str, deadline: float) -> bool:
+    """
+    Check the topic of the question within the request budget, letting
+    it through when the check can't finish in time.
+    """
+    settings = get_settings()
+    if not settings.TOPIC_GATE_ENABLED:
+        return False
+    timeout = min(
+        settings.TOPIC_GATE_TIMEOUT_SECONDS,
+        budget.remaining({"deadline": deadline}),
+    )
+    if timeout <= 0:
+        return False
+    return await get_topic_gate().is_off_topic(user_question, timeout)
+
+
+def _chat_history(memory: Optional[Any]) -> List[BaseMessage]:
+    if memory is None:
+        return []
+    return memory.load_memory_variables({}).get(memory.memory_key, [])
+
+
+def _is_cacheable(user_question: str, memory: Optional[Any]) -> bool:
+    """Answers to follow-ups depend on the history, so aren't cached."""
+    return not _chat_history(memory) or is_self_contained(user_question)
+
+
+def _remember(memory: Optional[Any], user_question: str, answer: str):
+    """Save the turn with the answer the user received."""
+    if memory is not None:
+        memory.save_context({"question": user_question}, {"answer": answer})
+
+
+async def answer_without_graph(
+    user_question: str,
+    chat_history: Optional[List[BaseMessage]] = None,
+    deadline: Optional[float] = None
+) -> Optional[Tuple[str, str]]:
+    """
+    Answer the question without running the graph: with its precomputed
+    answer, or with a refusal when it is clearly off topic. Follow-ups
+    rely on the history, so only standalone questions are answered here.
 
     Args:
         user_question (str): User's question.
+        chat_history (List[BaseMessage], optional): Conversation so far.
+        deadline (float, optional): Deadline of the request. Defaults to
+            a new one from `REQUEST_BUDGET_SECONDS`.
 
     Returns:
-        str: Final answer generated by the chatbot.
+        Tuple[str, str], optional: The answer and its source
+            ("precomputed" or "gated"), or None.
     """
-    print("🚀 Iniciando el flujo con LangGraph...")
-    app = build_graph()
+    if chat_history and not is_self_contained(user_question):
+        return None
+    if deadline is None:
+        deadline = budget.new_deadline()
+    precomputed_answer = get_answer_store().lookup(user_question)
+    if precomputed_answer is not None:
+        logger.info("⚡ Respuesta precalculada.")
+        return precomputed_answer, "precomputed"
+    if await _is_off_topic(user_question, deadline):
+        return TOPIC_REFUSAL, "gated"
+    return None
+
+
+def _record_run(user_question: str, final_state: dict):
+    degradations = final_state.get("degradations", [])
+    budget.degradation_metrics.record(degradations)
+    fields = {
+        "trace": final_state.get("trace", {}),
+        "degradations": degradations,
+    }
+    if degradations:
+        logger.warning(
+            f"Flujo completado con degradaciones: {', '.join(degradations)}",
+            extra=fields,
+        )
+    else:
+        logger.info("Flujo completado.", extra=fields)
+        if _is_cacheable(user_question, final_state.get("memory")):
+            budget.answer_cache.put(
+                user_question, final_state["final_answer"]
+            )
+
 
-    inputs = {"user_question": user_question}
+async def run_user_question(
+    user_question: str,
+    retrieved_documents: Optional[List[Document]] = None,
+    budget_seconds: Optional[float] = None,
+    memory: Optional[Any] = None,
+    deadline: Optional[float] = None
+) -> dict:
+    """
+    Run the user's question through the LangGraph flow and return the
+    final state, with the answer and the degradation paths taken.
 
-    final_state = await app.ainvoke(inputs)
+    Every node respects the latency budget of the request: when it runs
+    short the flow skips the enrichment, approves the RAG answer without
+    review or serves a cached answer, and records the path taken.
 
+    Args:
+        user_question (str): User's question.
+        retrieved_documents (List[Document], optional): Documents already
+            retrieved for the question. If None, the RAG node queries
+            Azure Cognitive Search itself.
+        budget_seconds (float, optional): Latency budget of the request.
+            Defaults to `REQUEST_BUDGET_SECONDS`.
+        memory (ConversationBufferMemory, optional): Conversation memory
+            of the session, read by the RAG node.
+        deadline (float, optional): Deadline of a request that started
+            earlier, used instead of a new one from `budget_seconds`.
+
+    Returns:
+        dict: Final state of the graph.
+    """
+    logger.info(
+        "🚀 Iniciando el flujo con LangGraph...", extra={"sampled": True}
+    )
+    app = get_graph()
+
+    final_state = await app.ainvoke(
+        _graph_inputs(
+            user_question,
+            retrieved_documents,
+            budget_seconds,
+            memory,
+            deadline=deadline,
+        )
+    )
+    _record_run(user_question, final_state)
+    return final_state
+
+
+async def process_user_question(
+    user_question: str,
+    retrieved_documents: Optional[List[Document]] = None,
+    budget_seconds: Optional[float] = None,
+    memory: Optional[Any] = None
+) -> str:
+    """
+    Answer the user's question, serving the precomputed answer when the
+    question is one of the most frequent ones, a templated refusal when
+    it is clearly off topic and running the LangGraph flow otherwise.
+
+    Args:
+        user_question (str): User's question.
+        retrieved_documents (List[Document], optional): Documents already
+            retrieved for the question. If None, the RAG node queries
+            Azure Cognitive Search itself.
+        budget_seconds (float, optional): Latency budget of the request.
+            Defaults to `REQUEST_BUDGET_SECONDS`.
+        memory (ConversationBufferMemory, optional): Conversation memory
+            of the session, updated with the final answer.
+
+    Returns:
+        str: Final answer generated by the chatbot.
+    """
+    deadline = budget.new_deadline(budget_seconds)
+    shortcut = await answer_without_graph(
+        user_question, _chat_history(memory), deadline
+    )
+    if shortcut is not None:
+        answer, source = shortcut
+        _remember(memory, user_question, answer)
+        log_interaction(user_question, source)
+        return answer
+
+    final_state = await run_user_question(
+        user_question,
+        retrieved_documents,
+        memory=memory,
+        deadline=deadline,
+    )
+    _remember(memory, user_question, final_state["final_answer"])
+    log_interaction(user_question, "graph")
     return final_state["final_answer"]
+
+
+GRAPH_STAGES = (
+    "call_rag_agent",
+    "call_supervisor_agent",
+    "enrich_with_wikipedia",
+    "prepare_final_response",
+)
+STREAMED_ROLES = {"answer", "merge"}
+
+
+async def stream_user_question(
+    user_question: str,
+    memory: Optional[Any] = None,
+    session_id: Optional[str] = None,
+    budget_seconds: Optional[float] = None,
+    retrieved_documents: Optional[List[Document]] = None
+) -> AsyncIterator[dict]:
+    """
+    Answer the user's question like `process_user_question`, yielding
+    the progress of the LangGraph flow as it happens.
+
+    The answer tokens are streamed as the RAG model, the supervisor and
+    the merge model produce them. Each stage streams a new draft that
+    replaces the previous one; the "answer" event carries the final
+    text.
+
+    Args:
+        user_question (str): User's question.
+        memory (ConversationBufferMemory, optional): Conversation memory
+            of the session, updated with the new turn.
+        session_id (str, optional): Session ID used in the logs.
+        budget_seconds (float, optional): Latency budget of the request.
+            Defaults to `REQUEST_BUDGET_SECONDS`.
+        retrieved_documents (List[Document], optional): Documents already
+            retrieved for the question. If None, the RAG node queries
+            Azure Cognitive Search itself.
+
+    Yields:
+        dict: Events with a "type": "stage" (a node "start"s or "end"s),
+              "token" (a chunk of the draft answer) and finally "answer".
+    """
+    deadline = budget.new_deadline(budget_seconds)
+    shortcut = await answer_without_graph(
+        user_question, _chat_history(memory), deadline
+    )
+    if shortcut is not None:
+        answer, source = shortcut
+        _remember(memory, user_question, answer)
+        log_interaction(user_question, source)
+        yield {"type": "answer", "response": answer, "source": source}
+        return
+
+    logger.info(
+        "🚀 Iniciando el flujo con LangGraph (streaming)...",
+        extra={"sampled": True},
+    )
+    app = get_graph()
+    final_state = None
+    async for event in app.astream_events(
+        _graph_inputs(
+            user_question,
+            retrieved_documents=retrieved_documents,
+            memory=memory,
+            session_id=session_id,
+            deadline=deadline,
+        ),
+        version="v2",
+    ):
+        kind = event["event"]
+        node = event.get("metadata", {}).get("langgraph_node")
+        if (
+            kind in ("on_chain_start", "on_chain_end")
+            and event["name"] in GRAPH_STAGES
+            and node == event["name"]
+        ):
+            yield {
+                "type": "stage",
+                "stage": node,
+                "status": "start" if kind == "on_chain_start" else "end",
+            }
+        elif (
+            kind == "on_chat_model_stream"
+            and STREAMED_ROLES.intersection(event.get("tags", []))
+        ):
+            content = event["data"]["chunk"].content
+            if content:
+                yield {"type": "token", "stage": node, "content": content}
+        elif (
+            kind == "on_custom_event"
+            and event["name"] == SUPERVISOR_ANSWER_EVENT
+        ):
+            yield {
+                "type": "token",
+                "stage": node,
+                "content": event["data"]["content"],
+            }
+        elif kind == "on_chain_end" and not event.get("parent_ids"):
+            final_state = event["data"]["output"]
+
+    _record_run(user_question, final_state)
+    _remember(memory, user_question, final_state["final_answer"])
+    log_interaction(user_question, "graph")
+    yield {
+        "type": "answer",
+        "response": final_state["final_answer"],
+        "source": "graph",
+        "degradations": final_state.get("degradations", []),
+    }
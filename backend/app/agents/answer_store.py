@@ -0,0 +1,562 @@
+"""
+Store of precomputed answers for the most frequent questions. An offline
+job mines the question log, answers the most asked questions through the
+full LangGraph flow and keeps the reviewed answers in a SQLite store,
+which is looked up before running the graph.
+
+The job publishes the store to the Blob Storage container of the index
+registry, and every instance downloads it in the background when it
+changes, so all instances serve the same answers without running the
+graph for them.
+
+Every answer is tied to the knowledge base index it was generated from,
+so it stops being served as soon as a new index version is activated.
+
+Usage:
+    python -m backend.app.agents.answer_store --top 50 --min-count 3
+    python -m backend.app.agents.answer_store --log-path logs/*.jsonl
+"""
+
+import argparse
+import asyncio
+import glob
+import json
+import logging
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import unicodedata
+from collections import Counter, defaultdict
+from contextlib import closing
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from backend.app.config.settings import get_settings
+from backend.app.knowledge_base.index_registry import get_active_index_name
+from backend.app.structured_logging import INTERACTION_LOGGER
+
+logger = logging.getLogger(__name__)
+interaction_logger = logging.getLogger(INTERACTION_LOGGER)
+
+# Blob of the published store, next to the index registry.
+ANSWER_STORE_BLOB = "answer_store.db"
+
+STOPWORDS = {
+    "a", "al", "como", "con", "cual", "cuales", "de", "del", "el", "en",
+    "es", "la", "las", "lo", "los", "me", "mi", "o", "para", "por", "que",
+    "se", "son", "su", "un", "una", "y",
+}
+
+# Personal data users may type in a question, removed before logging.
+REDACTIONS = (
+    (re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+"), "<email>"),
+    (re.compile(r"\+?\d(?:[\s.-]?\d){5,}"), "<número>"),
+)
+
+
+def question_key(question: str) -> str:
+    """
+    Normalize a question into the key shared by its rephrasings: no
+    accents, case, punctuation or function words.
+
+    Args:
+        question (str): User question.
+
+    Returns:
+        str: Normalized key, empty if nothing meaningful remains.
+    """
+    text = unicodedata.normalize("NFKD", question)
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    words = re.sub(r"[^\w\s]", " ", text.lower()).split()
+    return " ".join(word for word in words if word not in STOPWORDS)
+
+
+def redact(question: str) -> str:
+    """Replace the email addresses and long numbers of a question."""
+    for pattern, placeholder in REDACTIONS:
+        question = pattern.sub(placeholder, question)
+    return question
+
+
+def log_interaction(user_question: str, source: str):
+    """
+    Queue a question for the interaction log mined by the offline job.
+    The logging thread writes it, so the caller never waits on the disk.
+
+    Args:
+        user_question (str): User question, logged redacted.
+        source (str): How it was answered ("graph", "precomputed" or
+                      "gated").
+    """
+    if not get_settings().INTERACTION_LOG_PATH:
+        return
+    record = {
+        "user_question": redact(user_question),
+        "source": source,
+        "date_processed": datetime.now(timezone.utc).isoformat(),
+    }
+    interaction_logger.info(json.dumps(record, ensure_ascii=False))
+
+
+def interaction_log_files(log_path: str) -> List[str]:
+    """
+    Files of the interaction log: those of every serving worker and
+    their rotated backups.
+
+    Args:
+        log_path (str): `INTERACTION_LOG_PATH`.
+
+    Returns:
+        List[str]: Existing log files.
+    """
+    root, extension = os.path.splitext(log_path)
+    return sorted(glob.glob(f"{glob.escape(root)}*{extension}*"))
+
+
+def mine_frequent_questions(
+    log_paths: List[str],
+    top_n: int,
+    min_count: int = 1
+) -> List[dict]:
+    """
+    Group the logged questions by key and return the most frequent
+    groups, each represented by its most common phrasing.
+
+    Args:
+        log_paths (List[str]): Interaction logs (JSON lines with
+                               "user_question"), of one or several
+                               instances, each read with its rotated and
+                               per-worker files.
+        top_n (int): Maximum number of groups.
+        min_count (int): Minimum number of occurrences of a group.
+
+    Returns:
+        List[dict]: "key", "question" and "count" of each group, most
+                    frequent first.
+    """
+    phrasings: Dict[str, Counter] = defaultdict(Counter)
+    files = sorted({
+        path for log_path in log_paths
+        for path in interaction_log_files(log_path)
+    })
+    for path in files:
+        with open(path, encoding="utf-8") as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                    question = record["user_question"].strip()
+                except (ValueError, KeyError, AttributeError, TypeError):
+                    continue
+                # Off-topic questions are refused, never worth
+                # precomputing.
+                if record.get("source") == "gated":
+                    continue
+                key = question_key(question)
+                if key:
+                    phrasings[key][question] += 1
+
+    groups = [
+        {
+            "key": key,
+            "question": counter.most_common(1)[0][0],
+            "count": sum(counter.values()),
+        }
+        for key, counter in phrasings.items()
+    ]
+    groups = [group for group in groups if group["count"] >= min_count]
+    groups.sort(key=lambda group: group["count"], reverse=True)
+    return groups[:top_n]
+
+
+class AnswerStore:
+    """
+    SQLite store of precomputed answers indexed by question key. Lookups
+    are served from an in-memory snapshot of the table, reloaded when the
+    database file changes.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._mtime: Optional[int] = None
+        self._answers: Dict[str, dict] = {}
+
+    def _connect(self) -> sqlite3.Connection:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        connection = sqlite3.connect(self.path)
+        connection.row_factory = sqlite3.Row
+        # Reads go through a memory map, so the serving workers share the
+        # pages of the store in the OS cache instead of copying them.
+        connection.execute("PRAGMA mmap_size = 67108864")
+        connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS answers (
+                question_key TEXT PRIMARY KEY,
+                question TEXT NOT NULL,
+                answer TEXT NOT NULL,
+                kb_version TEXT NOT NULL,
+                frequency INTEGER NOT NULL,
+                created_at TEXT NOT NULL
+            )
+            """
+        )
+        return connection
+
+    def _reload(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime == self._mtime:
+            return
+        with closing(self._connect()) as connection:
+            rows = connection.execute("SELECT * FROM answers").fetchall()
+        self._answers = {row["question_key"]: dict(row) for row in rows}
+        self._mtime = mtime
+
+    def load(self):
+        """
+        Read the store into memory. Unlike the lookups, it doesn't read
+        the active knowledge base version, so it needs no connection.
+        """
+        with self._lock:
+            self._reload()
+
+    def lookup(self, question: str) -> Optional[str]:
+        """
+        Find the precomputed answer of a question, if it was generated
+        from the active knowledge base version.
+
+        Args:
+            question (str): User question.
+
+        Returns:
+            str: The stored answer, or None.
+        """
+        key = question_key(question)
+        kb_version = get_active_index_name()
+        with self._lock:
+            self._reload()
+            entry = self._answers.get(key)
+            if entry is not None and entry["kb_version"] == kb_version:
+                self.hits += 1
+                return entry["answer"]
+            self.misses += 1
+            return None
+
+    def is_fresh(self, key: str, kb_version: str) -> bool:
+        with self._lock:
+            self._reload()
+            entry = self._answers.get(key)
+            return entry is not None and entry["kb_version"] == kb_version
+
+    def put(
+        self,
+        key: str,
+        question: str,
+        answer: str,
+        kb_version: str,
+        frequency: int
+    ):
+        with self._lock, closing(self._connect()) as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    key, question, answer, kb_version, frequency,
+                    datetime.now(timezone.utc).isoformat(),
+                ),
+            )
+            connection.commit()
+
+    def retain(self, keys: List[str]):
+        """Delete the answers of every question not in `keys`."""
+        with self._lock, closing(self._connect()) as connection:
+            connection.execute(
+                "DELETE FROM answers WHERE question_key NOT IN "
+                f"({', '.join('?' for _ in keys)})",
+                keys,
+            )
+            connection.commit()
+
+    def stats(self) -> dict:
+        kb_version = get_active_index_name()
+        with self._lock:
+            self._reload()
+            return {
+                "entries": len(self._answers),
+                "fresh_entries": sum(
+                    entry["kb_version"] == kb_version
+                    for entry in self._answers.values()
+                ),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+def _shared_container():
+    from azure.storage.blob import ContainerClient
+
+    settings = get_settings()
+    return ContainerClient.from_connection_string(
+        conn_str=settings.AZURE_STORAGE_CONN_STRING,
+        container_name=settings.KB_REGISTRY_CONTAINER,
+    )
+
+
+def download_answer_store(
+    path: str,
+    etag: Optional[str] = None
+) -> Optional[str]:
+    """
+    Replace the local store with the published one, atomically so the
+    serving workers never read a partial file.
+
+    Args:
+        path (str): Local store (`ANSWER_STORE_PATH`).
+        etag (str, optional): ETag of the local copy; nothing is
+                              downloaded while the blob still matches.
+
+    Returns:
+        str: ETag of the local copy, None if nothing was published.
+    """
+    from azure.core.exceptions import ResourceNotFoundError
+
+    blob = _shared_container().get_blob_client(ANSWER_STORE_BLOB)
+    try:
+        published = blob.get_blob_properties().etag
+        if published == etag:
+            return etag
+        downloader = blob.download_blob()
+        data = downloader.readall()
+    except ResourceNotFoundError:
+        return None
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    descriptor, temporary_path = tempfile.mkstemp(dir=directory)
+    with os.fdopen(descriptor, "wb") as file:
+        file.write(data)
+    os.replace(temporary_path, path)
+    return downloader.properties.etag
+
+
+def publish_answer_store(path: str):
+    """
+    Upload the local store so every instance downloads it.
+
+    Args:
+        path (str): Local store built by the offline job.
+    """
+    from azure.core.exceptions import ResourceExistsError
+
+    container = _shared_container()
+    try:
+        container.create_container()
+    except ResourceExistsError:
+        pass
+    with open(path, "rb") as file:
+        container.upload_blob(ANSWER_STORE_BLOB, file, overwrite=True)
+
+
+class AnswerStoreSync:
+    """
+    Keeps the local store of an instance in sync with the published one,
+    checking the blob every `poll_seconds` from a background thread.
+    """
+
+    def __init__(self, path: str, poll_seconds: float):
+        self.path = path
+        self.poll_seconds = poll_seconds
+        self.etag: Optional[str] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def sync(self):
+        try:
+            etag = download_answer_store(self.path, self.etag)
+        except Exception as e:
+            # Keep serving the last downloaded answers.
+            logger.warning(f"⚠️ No se pudo descargar las respuestas: {e}")
+            return
+        if etag != self.etag:
+            self.etag = etag
+            logger.info("🗂️ Respuestas precalculadas actualizadas")
+
+    def _loop(self):
+        while True:
+            self.sync()
+            if self._stop.wait(self.poll_seconds):
+                return
+
+    def start(self):
+        if self._thread is None and self.poll_seconds > 0:
+            self._thread = threading.Thread(
+                target=self._loop, name="answer-store-sync", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+
+_answer_store = None
+_answer_store_sync = None
+
+
+def get_answer_store() -> AnswerStore:
+    """
+    Obtains the global store of precomputed answers.
+
+    Returns:
+        AnswerStore: The shared answer store.
+    """
+    global _answer_store
+    if _answer_store is None:
+        _answer_store = AnswerStore(get_settings().ANSWER_STORE_PATH)
+    return _answer_store
+
+
+def get_answer_store_sync() -> Optional[AnswerStoreSync]:
+    """
+    Obtains the sync of the published store. Only the first serving
+    worker of an instance downloads it, its siblings read the same local
+    file; with a file registry there is nothing published.
+
+    Returns:
+        AnswerStoreSync: The shared sync, or None.
+    """
+    global _answer_store_sync
+    settings = get_settings()
+    if (
+        settings.KB_REGISTRY_BACKEND == "file"
+        or settings.SERVE_WORKER_INDEX != 0
+    ):
+        return None
+    if _answer_store_sync is None:
+        _answer_store_sync = AnswerStoreSync(
+            settings.ANSWER_STORE_PATH, settings.KB_REGISTRY_POLL_SECONDS
+        )
+    return _answer_store_sync
+
+
+async def precompute_answers(
+    top_n: Optional[int] = None,
+    min_count: Optional[int] = None,
+    force: bool = False,
+    max_concurrency: Optional[int] = None,
+    log_paths: Optional[List[str]] = None
+) -> dict:
+    """
+    Answer the most frequent logged questions through the full LangGraph
+    flow and store the answers that went through the supervisor review
+    without any degradation. Answers already generated from the active
+    knowledge base version are kept unless `force` is set.
+
+    Args:
+        top_n (int, optional): Number of question groups to answer.
+                               Defaults to `ANSWER_STORE_TOP_N`.
+        min_count (int, optional): Minimum occurrences of a group.
+                                   Defaults to `ANSWER_STORE_MIN_COUNT`.
+        force (bool): Regenerate the fresh answers too.
+        max_concurrency (int, optional): Graph runs in flight at the same
+                                         time. Defaults to
+                                         `BATCH_MAX_CONCURRENCY`.
+        log_paths (List[str], optional): Interaction logs to mine.
+                                         Defaults to the local
+                                         `INTERACTION_LOG_PATH`.
+
+    Returns:
+        dict: Number of groups "stored", "kept" and "rejected".
+    """
+    from backend.app.agents.agent import run_user_question
+
+    settings = get_settings()
+    store = get_answer_store()
+    kb_version = get_active_index_name()
+    log_paths = log_paths or [settings.INTERACTION_LOG_PATH]
+    if not any(interaction_log_files(path) for path in log_paths):
+        print("⚠️ No hay registro de interacciones para analizar.")
+        return {"stored": 0, "kept": 0, "rejected": 0}
+    groups = mine_frequent_questions(
+        log_paths,
+        top_n or settings.ANSWER_STORE_TOP_N,
+        min_count or settings.ANSWER_STORE_MIN_COUNT,
+    )
+    semaphore = asyncio.Semaphore(
+        max_concurrency or settings.BATCH_MAX_CONCURRENCY
+    )
+    summary = Counter(stored=0, kept=0, rejected=0)
+
+    async def precompute(group: dict):
+        if not force and store.is_fresh(group["key"], kb_version):
+            summary["kept"] += 1
+            return
+        async with semaphore:
+            try:
+                final_state = await run_user_question(group["question"])
+            except Exception as e:
+                print(f"❌ Error al responder '{group['question']}': {e}")
+                summary["rejected"] += 1
+                return
+        if final_state.get("degradations"):
+            summary["rejected"] += 1
+            return
+        store.put(
+            group["key"],
+            group["question"],
+            final_state["final_answer"],
+            kb_version,
+            group["count"],
+        )
+        summary["stored"] += 1
+
+    print(f"🗂️ Precalculando respuestas para {len(groups)} preguntas...")
+    await asyncio.gather(*(precompute(group) for group in groups))
+    store.retain([group["key"] for group in groups])
+    print(
+        f"✅ Respuestas precalculadas: {summary['stored']} nuevas, "
+        f"{summary['kept']} vigentes, {summary['rejected']} descartadas."
+    )
+    return dict(summary)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Precompute the answers of the most frequent questions."
+    )
+    parser.add_argument("--top", type=int, default=None)
+    parser.add_argument("--min-count", type=int, default=None)
+    parser.add_argument("--concurrency", type=int, default=None)
+    parser.add_argument("--force", action="store_true",
+                        help="Regenerate the answers that are still fresh.")
+    parser.add_argument("--log-path", action="append", default=None,
+                        help="Interaction log to mine, e.g. one collected "
+                             "from each instance. Can be repeated.")
+    args = parser.parse_args()
+
+    settings = get_settings()
+    shared = settings.KB_REGISTRY_BACKEND != "file"
+    if shared:
+        # Start from the published answers, to keep the fresh ones.
+        download_answer_store(settings.ANSWER_STORE_PATH)
+    asyncio.run(
+        precompute_answers(
+            args.top,
+            args.min_count,
+            args.force,
+            args.concurrency,
+            args.log_path,
+        )
+    )
+    if shared:
+        publish_answer_store(settings.ANSWER_STORE_PATH)
+        print("📤 Respuestas publicadas para todas las instancias.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+This module answers batches of questions through the LangGraph flow.
+Precomputed and off-topic questions are answered first, without any
+retrieval; the rest share one retriever and run the compiled graph with
+bounded concurrency.
+"""
+
+import asyncio
+import logging
+from typing import AsyncIterator, Dict, List, Optional
+
+from langchain_core.documents import Document
+
+from backend.app.agents.agent import answer_without_graph, run_user_question
+from backend.app.agents.answer_store import log_interaction
+from backend.app.config.settings import get_settings
+from backend.app.utils import get_retriever
+
+logger = logging.getLogger(__name__)
+
+
+async def batch_retrieve(
+    questions: List[str],
+    max_concurrency: Optional[int] = None
+) -> Dict[str, List[Document]]:
+    """
+    Run the searches of all the questions concurrently over one shared
+    retriever, the same one and with the same search mode as a single
+    question.
+
+    Args:
+        questions (List[str]): Unique questions to retrieve documents for.
+        max_concurrency (int, optional): Maximum number of searches in
+                                         flight at the same time.
+
+    Returns:
+        Dict[str, List[Document]]: Retrieved documents for each question.
+    """
+    settings = get_settings()
+    semaphore = asyncio.Semaphore(
+        max_concurrency or settings.BATCH_MAX_CONCURRENCY
+    )
+    retriever = get_retriever()
+
+    async def bounded_search(question: str) -> List[Document]:
+        async with semaphore:
+            return await retriever.ainvoke(question)
+
+    documents = await asyncio.gather(
+        *(bounded_search(question) for question in questions)
+    )
+    return dict(zip(questions, documents))
+
+
+async def process_user_questions(
+    questions: List[str],
+    max_concurrency: Optional[int] = None
+) -> AsyncIterator[dict]:
+    """
+    Process a batch of questions through the LangGraph flow, yielding
+    each result as soon as it is ready.
+
+    Duplicate questions are answered once and reported for every
+    position they appear in. Precomputed and off-topic questions are
+    answered first and skip the retrieval. An error in one question is
+    reported in its result and does not stop the rest of the batch.
+
+    Args:
+        questions (List[str]): User questions.
+        max_concurrency (int, optional): Maximum number of graph runs
+                                         in flight at the same time.
+
+    Yields:
+        dict: Result with the question "index", the "question" and
+              either the "response" or the "error".
+    """
+    settings = get_settings()
+    max_concurrency = max_concurrency or settings.BATCH_MAX_CONCURRENCY
+
+    positions: Dict[str, List[int]] = {}
+    for index, question in enumerate(questions):
+        positions.setdefault(question.strip(), []).append(index)
+    unique_questions = list(positions)
+
+    logger.info(
+        f"📦 Procesando lote de {len(questions)} preguntas "
+        f"({len(unique_questions)} únicas)..."
+    )
+
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def shortcut(question: str):
+        async with semaphore:
+            try:
+                return question, await answer_without_graph(question)
+            except Exception as e:
+                logger.warning(f"Error al revisar '{question}': {e}")
+                return question, None
+
+    graph_questions = []
+    for question, result in await asyncio.gather(
+        *(shortcut(question) for question in unique_questions)
+    ):
+        if result is None:
+            graph_questions.append(question)
+            continue
+        answer, source = result
+        log_interaction(question, source)
+        for index in positions[question]:
+            yield {"index": index, "question": question, "response": answer}
+    if not graph_questions:
+        return
+
+    try:
+        retrieved = await batch_retrieve(graph_questions, max_concurrency)
+    except Exception as e:
+        logger.warning(
+            f"Error en la recuperación por lotes, cada pregunta "
+            f"consultará el índice por separado: {e}"
+        )
+        retrieved = {}
+
+    async def answer(question: str) -> dict:
+        async with semaphore:
+            try:
+                final_state = await run_user_question(
+                    question, retrieved.get(question)
+                )
+                log_interaction(question, "graph")
+                return {
+                    "question": question,
+                    "response": final_state["final_answer"],
+                }
+            except Exception as e:
+                return {"question": question, "error": str(e)}
+
+    tasks = [
+        asyncio.create_task(answer(question))
+        for question in graph_questions
+    ]
+    try:
+        for task in asyncio.as_completed(tasks):
+            result = await task
+            for index in positions[result["question"]]:
+                yield {"index": index, **result}
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,138 @@
+"""
+Latency budget helpers for the LangGraph flow: the remaining time of a
+request, the cache of recent answers used as a last resort, and the
+counters of the degradation paths taken.
+"""
+
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Dict, List, Optional
+
+from backend.app.config.settings import get_settings
+
+SKIP_ENRICHMENT = "skip_enrichment"
+ENRICHMENT_TIMEOUT = "enrichment_timeout"
+SKIP_SUPERVISOR = "skip_supervisor"
+SUPERVISOR_TIMEOUT = "supervisor_timeout"
+SUPERVISOR_MALFORMED = "supervisor_malformed"
+CACHED_ANSWER = "cached_answer"
+NO_ANSWER = "no_answer"
+
+BUDGET_EXHAUSTED_ANSWER = (
+    "⏳ Lo siento, en este momento no pude preparar una respuesta a tiempo. "
+    "Por favor, intenta nuevamente en unos segundos."
+)
+
+
+def new_deadline(budget_seconds: Optional[float] = None) -> float:
+    """
+    Compute the deadline of a request from its latency budget.
+
+    Args:
+        budget_seconds (float, optional): Budget of the request. Defaults
+                                          to `REQUEST_BUDGET_SECONDS`.
+
+    Returns:
+        float: Deadline as a `time.monotonic()` timestamp.
+    """
+    if budget_seconds is None:
+        budget_seconds = get_settings().REQUEST_BUDGET_SECONDS
+    return time.monotonic() + budget_seconds
+
+
+def remaining(state: dict) -> float:
+    """
+    Seconds left before the request deadline, minus the reserve kept to
+    assemble and send the response.
+
+    Args:
+        state (dict): Graph state carrying the "deadline".
+
+    Returns:
+        float: Remaining usable seconds, never negative.
+    """
+    settings = get_settings()
+    deadline = state.get("deadline")
+    if deadline is None:
+        return float("inf")
+    return max(
+        deadline - time.monotonic() - settings.BUDGET_RESERVE_SECONDS, 0.0
+    )
+
+
+def _normalize(question: str) -> str:
+    return re.sub(r"\s+", " ", question.strip().lower())
+
+
+class AnswerCache:
+    """
+    Bounded LRU cache of the last answers produced by the full flow,
+    served when the budget is too short to generate a new one. Answers
+    are keyed by the question text alone, so only questions that don't
+    depend on the conversation may be stored or looked up.
+    """
+
+    def __init__(self, max_size: int = 256):
+        self.max_size = max_size
+        self._answers: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, question: str) -> Optional[str]:
+        key = _normalize(question)
+        with self._lock:
+            answer = self._answers.get(key)
+            if answer is not None:
+                self._answers.move_to_end(key)
+            return answer
+
+    def put(self, question: str, answer: str):
+        if self.max_size <= 0:
+            return
+        key = _normalize(question)
+        with self._lock:
+            self._answers[key] = answer
+            self._answers.move_to_end(key)
+            while len(self._answers) > self.max_size:
+                self._answers.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._answers.clear()
+
+
+class DegradationMetrics:
+    """
+    Counts the requests served by the graph, how many of them took a
+    degradation path, and which paths were taken.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.degraded_requests = 0
+        self.paths: Counter = Counter()
+
+    def record(self, degradations: List[str]):
+        with self._lock:
+            self.requests += 1
+            if degradations:
+                self.degraded_requests += 1
+            self.paths.update(degradations)
+
+    def as_dict(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "degraded_requests": self.degraded_requests,
+                "degraded_ratio": (
+                    round(self.degraded_requests / self.requests, 4)
+                    if self.requests else None
+                ),
+                "paths": dict(self.paths),
+            }
+
+
+answer_cache = AnswerCache(get_settings().ANSWER_CACHE_SIZE)
+degradation_metrics = DegradationMetrics()
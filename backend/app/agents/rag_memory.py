@@ -4,102 +4,380 @@ conversational agent. It initializes a conversational chain with memory,
 generates responses based on user questions.
 """
 
+import asyncio
+import itertools
+import logging
+import re
+import time
+from collections import Counter
 from datetime import datetime, timezone
+from typing import TYPE_CHECKING, List, Optional, Tuple
 
-import openai
-from langchain.chains import ConversationalRetrievalChain
-from langchain.memory import ConversationBufferMemory
-from langchain.prompts import PromptTemplate
-from langchain_community.callbacks.manager import get_openai_callback
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.messages import BaseMessage
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.retrievers import BaseRetriever
 
 from backend.app.config.settings import get_settings
+from backend.app.knowledge_base.chunking import chunk_token_count
 from backend.app.utils import get_model, get_retriever
 
+if TYPE_CHECKING:
+    from langchain.memory import ConversationBufferMemory
+
 settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# The instructions go in a static system message ahead of the retrieved
+# context and the question, so every call shares the same prompt prefix
+# and Azure OpenAI prompt caching can reuse it.
+RAG_SYSTEM_PROMPT: str = """
+Eres un asistente llamado "Ingenierin", diseñado para atender las
+consultas de estudiantes de una fundación dedicada a la formación
+de profesionales emprendedores en tiendas, minimarkets
+y pequeños negocios.
+
+Tu propósito es brindar orientación clara, útil y específica sobre
+temas de logística, gestión de inventario, bodegaje y reabastecimiento,
+**utilizando la información proporcionada en el contexto para
+fundamentar tus respuestas.**
+
+Ten en cuenta estas instrucciones para responder:
+1.  Utiliza un lenguaje formal pero cercano y amigable, adecuado para
+    un entorno educativo y práctico.
+2.  **Incluye emojis relevantes y variados** para hacer las respuestas
+    más visuales, atractivas y comprensibles. No abuses, pero úsalos
+    estratégicamente.
+3.  **Formatea tu respuesta de manera clara y organizada, utilizando
+    Markdown** (negritas, cursivas, listas numeradas o con guiones,
+    encabezados si es necesario) para mejorar la legibilidad y
+    priorizar la utilidad práctica para el estudiante.
+4.  **Añade saltos de línea y espacios** para que el texto no se vea
+    "apelmazado" y sea fácil de escanear.
+5.  **Siempre explica brevemente cómo la información del contexto te
+    ayudó a formular la respuesta, si es aplicable.**
+6.  **Nunca pidas aclaraciones sobre la pregunta del usuario.**
+    Si la información en el contexto no es suficiente para una
+    respuesta completa, utiliza tu mejor juicio para proporcionar la
+    orientación más útil posible basada en lo que sí tienes,
+    **sin inventar datos.**
+7.  Limita tus respuestas exclusivamente a temas relacionados con
+    logística, finanzas, inventario, bodegaje y reabastecimiento.
+    Si la consulta está fuera de estos temas, informa amablemente
+    que no puedes responderla, pero sé breve.
+
+El contexto recuperado de la base de conocimiento y la pregunta del
+estudiante llegan en el siguiente mensaje.
+"""
 
 
-def initialize_rag_chat_chain(memory: ConversationBufferMemory):
+class PrefetchedRetriever(BaseRetriever):
     """
-    Initialize a custome retrieval-augmented generation (RAG)
-    conversational chain for a virtual assistant.
+    Retriever that returns documents fetched beforehand, so a batch of
+    questions can share a single embedding and search round trip.
+    """
+
+    documents: List[Document]
+
+    def _get_relevant_documents(
+        self,
+        query: str,
+        *,
+        run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        return self.documents
+
+
+CONDENSE_ALWAYS = "always"
+CONDENSE_HEURISTIC = "heuristic"
+CONDENSE_PARALLEL = "parallel"
+
+CONDENSE_SYSTEM_PROMPT: str = """
+Dada la siguiente conversación y una pregunta de seguimiento, reformula
+la pregunta de seguimiento para que sea una pregunta independiente, en
+su idioma original. Responde solo con la pregunta reformulada.
+"""
+
+# Words that point back to earlier turns ("¿y eso?", "explica lo
+# anterior", "¿y el segundo?"), so the question can't be searched alone.
+FOLLOW_UP_PATTERN = re.compile(
+    r"^\s*¿?\s*(y|pero|entonces|además|tambi[eé]n)\b"
+    r"|\b(eso|esto|esa|ese|esos|esas|aquel|aquello|ello|dicho|dicha"
+    r"|lo anterior|lo mismo|el anterior|la anterior|el primero|el segundo"
+    r"|la primera|la segunda|el último|la última|mencionaste|dijiste"
+    r"|explicaste|otro ejemplo|más detalle|m[aá]s sobre)\b",
+    re.IGNORECASE,
+)
+
+condensation_metrics: Counter = Counter()
+
+
+def is_self_contained(question: str) -> bool:
+    """
+    Cheap local check of whether a question can be searched without the
+    chat history: it is not too short and has no words referring back
+    to earlier turns.
 
     Args:
-        memory (ConversationBufferMemory): Object to save conversation history
+        question (str): User's message.
 
     Returns:
-        ConversationalRetrievalChain: The RAG chain configured and ready to use
-    """
-    template: str = """
-        Eres un asistente llamado "Ingenierin", diseñado para atender las
-        consultas de estudiantes de una fundación dedicada a la formación
-        de profesionales emprendedores en tiendas, minimarkets
-        y pequeños negocios.
-
-        Tu propósito es brindar orientación clara, útil y específica sobre
-        temas de logística, gestión de inventario, bodegaje y reabastecimiento,
-        **utilizando la información proporcionada en el contexto para
-        fundamentar tus respuestas.**
-
-        Ten en cuenta estas instrucciones para responder:
-        1.  Utiliza un lenguaje formal pero cercano y amigable, adecuado para
-            un entorno educativo y práctico.
-        2.  **Incluye emojis relevantes y variados** para hacer las respuestas
-            más visuales, atractivas y comprensibles. No abuses, pero úsalos
-            estratégicamente.
-        3.  **Formatea tu respuesta de manera clara y organizada, utilizando
-            Markdown** (negritas, cursivas, listas numeradas o con guiones,
-            encabezados si es necesario) para mejorar la legibilidad y
-            priorizar la utilidad práctica para el estudiante.
-        4.  **Añade saltos de línea y espacios** para que el texto no se vea
-            "apelmazado" y sea fácil de escanear.
-        5.  **Siempre explica brevemente cómo la información del contexto te
-            ayudó a formular la respuesta, si es aplicable.**
-        6.  **Nunca pidas aclaraciones sobre la pregunta del usuario.**
-            Si la información en el contexto no es suficiente para una
-            respuesta completa, utiliza tu mejor juicio para proporcionar la
-            orientación más útil posible basada en lo que sí tienes,
-            **sin inventar datos.**
-        7.  Limita tus respuestas exclusivamente a temas relacionados con
-            logística, finanzas, inventario, bodegaje y reabastecimiento.
-            Si la consulta está fuera de estos temas, informa amablemente
-            que no puedes responderla, pero sé breve.
-
-        {context}
-
-        Pregunta: {question}
-        Respuesta:
+        bool: True if the question doesn't need to be condensed.
     """
+    if len(re.findall(r"\w+", question)) <= 3:
+        return False
+    return FOLLOW_UP_PATTERN.search(question) is None
 
-    prompt: PromptTemplate = PromptTemplate(
-        template=template, input_variables=["context", "question"]
-    )
 
-    llm = get_model()
+def _format_chat_history(messages: List[BaseMessage]) -> str:
+    roles = {"human": "Estudiante", "ai": "Asistente"}
+    return "\n".join(
+        f"{roles.get(message.type, message.type)}: {message.content}"
+        for message in messages
+        if message.content
+    )
 
-    retriever = get_retriever()
 
-    rag_chain = ConversationalRetrievalChain.from_llm(
-        llm=llm,
-        memory=memory,
-        retriever=retriever,
-        combine_docs_chain_kwargs={"prompt": prompt},
+def _contextual_query(question: str, chat_history: List[BaseMessage]) -> str:
+    """Search query built from the last student turn and the follow-up."""
+    previous = next(
+        (
+            message.content for message in reversed(chat_history)
+            if message.type == "human" and message.content
+        ),
+        "",
     )
+    return f"{previous} {question}".strip()
+
 
-    return rag_chain
+def _merge_documents(*document_lists: List[Document]) -> List[Document]:
+    """Interleave several result lists, dropping repeated chunks."""
+    merged, seen = [], set()
+    for documents in itertools.zip_longest(*document_lists):
+        for document in documents:
+            if document is None or document.page_content in seen:
+                continue
+            seen.add(document.page_content)
+            merged.append(document)
+    return merged
+
+
+def pack_context(
+    documents: List[Document],
+    max_tokens: int
+) -> Tuple[List[Document], int]:
+    """
+    Keep the retrieved chunks, in rank order, that fit in the context
+    budget. The sizes come from the token counts stored at indexing
+    time, so nothing is tokenized here. The best chunk is always kept.
+
+    Args:
+        documents (List[Document]): Retrieved chunks, best first.
+        max_tokens (int): Context budget in tokens, 0 for no limit.
+
+    Returns:
+        Tuple[List[Document], int]: The chunks kept and their tokens.
+    """
+    packed, used = [], 0
+    for document in documents:
+        tokens = chunk_token_count(document)
+        if packed and max_tokens and used + tokens > max_tokens:
+            continue
+        packed.append(document)
+        used += tokens
+    return packed, used
+
+
+class RagChatChain:
+    """
+    Conversational RAG chain: condenses follow-up questions with the
+    configured strategy, retrieves the context and answers with the RAG
+    prompt. The memory is only read: the caller saves the turn with the
+    answer the user finally receives.
+
+    Strategies:
+        always: rewrite every follow-up question with the condense model
+                before retrieving (the ConversationalRetrievalChain flow).
+        heuristic: skip the rewrite when the question is self-contained.
+        parallel: search the raw question and the question preceded by
+                  the previous student turn while the rewrite runs,
+                  merge both result sets and answer the rewritten
+                  question, so nothing waits for the rewrite.
+    """
+
+    def __init__(
+        self,
+        memory: "ConversationBufferMemory",
+        retriever: BaseRetriever,
+        strategy: str = CONDENSE_HEURISTIC
+    ):
+        from langchain.chains.combine_documents import (
+            create_stuff_documents_chain
+        )
+
+        self.memory = memory
+        self.retriever = retriever
+        self.strategy = strategy
+        self.answer_chain = create_stuff_documents_chain(
+            get_model("answer"),
+            ChatPromptTemplate.from_messages([
+                ("system", RAG_SYSTEM_PROMPT),
+                ("human", "{context}\n\nPregunta: {question}\nRespuesta:"),
+            ]),
+        )
+        self.condense_chain = ChatPromptTemplate.from_messages([
+            ("system", CONDENSE_SYSTEM_PROMPT),
+            (
+                "human",
+                "Conversación:\n{chat_history}\n\n"
+                "Pregunta de seguimiento: {question}\n"
+                "Pregunta independiente:"
+            ),
+        ]) | get_model("condense")
+
+    async def _condense(
+        self,
+        question: str,
+        chat_history: List[BaseMessage],
+        config: dict
+    ) -> str:
+        response = await self.condense_chain.ainvoke(
+            {
+                "chat_history": _format_chat_history(chat_history),
+                "question": question,
+            },
+            config=config,
+        )
+        return response.content.strip() or question
+
+    async def ainvoke(self, input: dict, config: Optional[dict] = None):
+        """
+        Answer a question using the conversation in memory.
+
+        Args:
+            input (dict): Dictionary with the user's "question".
+            config (dict, optional): LangChain run configuration.
+
+        Returns:
+            dict: The "answer", the "source_documents" used and a "trace"
+                  with the condensation strategy applied and its timings.
+        """
+        question = input["question"]
+        chat_history = self.memory.load_memory_variables({}).get(
+            self.memory.memory_key, []
+        )
+
+        if not chat_history:
+            condensation = "none"
+        elif (
+            self.strategy == CONDENSE_HEURISTIC
+            and is_self_contained(question)
+        ):
+            condensation = "skipped"
+        else:
+            condensation = self.strategy
+
+        config = dict(config or {})
+        config["metadata"] = {
+            **config.get("metadata", {}),
+            "condensation": condensation,
+        }
+        trace = {"condensation": condensation}
+
+        started = time.perf_counter()
+        standalone_question = question
+        if condensation in (CONDENSE_ALWAYS, CONDENSE_HEURISTIC):
+            standalone_question = await self._condense(
+                question, chat_history, config
+            )
+            trace["condense_ms"] = round(
+                (time.perf_counter() - started) * 1000, 1
+            )
+            documents = await self.retriever.ainvoke(
+                standalone_question, config=config
+            )
+        elif condensation == CONDENSE_PARALLEL:
+            (
+                contextual_documents,
+                raw_documents,
+                standalone_question,
+            ) = await asyncio.gather(
+                self.retriever.ainvoke(
+                    _contextual_query(question, chat_history), config=config
+                ),
+                self.retriever.ainvoke(question, config=config),
+                self._condense(question, chat_history, config),
+            )
+            trace["condense_ms"] = round(
+                (time.perf_counter() - started) * 1000, 1
+            )
+            documents = _merge_documents(contextual_documents, raw_documents)
+        else:
+            documents = await self.retriever.ainvoke(question, config=config)
+        trace["retrieval_ms"] = round(
+            (time.perf_counter() - started) * 1000, 1
+        )
+        if standalone_question != question:
+            trace["standalone_question"] = standalone_question
+        documents, trace["context_tokens"] = pack_context(
+            documents, settings.RAG_CONTEXT_MAX_TOKENS
+        )
+
+        answer = await self.answer_chain.ainvoke(
+            {"context": documents, "question": standalone_question},
+            config=config,
+        )
+        condensation_metrics[condensation] += 1
+
+        return {
+            "answer": answer,
+            "source_documents": documents,
+            "trace": trace,
+        }
+
+
+def initialize_rag_chat_chain(
+    memory: "ConversationBufferMemory",
+    retriever: Optional[BaseRetriever] = None
+) -> RagChatChain:
+    """
+    Initialize a custome retrieval-augmented generation (RAG)
+    conversational chain for a virtual assistant.
+
+    Args:
+        memory (ConversationBufferMemory): Object to save conversation history
+        retriever (BaseRetriever, optional): Retriever to use instead of
+                                             the Azure Cognitive Search one.
+
+    Returns:
+        RagChatChain: The RAG chain configured and ready to use
+    """
+    if retriever is None:
+        retriever = get_retriever()
+
+    return RagChatChain(
+        memory,
+        retriever,
+        strategy=settings.RAG_CONDENSE_STRATEGY,
+    )
 
 
 async def generate_response(
     rag_chain,
     user_question: str,
-    session_id: str
+    session_id: str,
+    trace: Optional[dict] = None
 ) -> str:
     """
     Generate the model's respionse based on the user's question.
 
     Args:
-        rag_chain (ConversationalRetrievalChain): RAG chain.
+        rag_chain (RagChatChain): RAG chain.
         user_question (str): User's message.
         session_id (str): Session ID.
+        trace (dict, optional): Per-request trace, updated with the
+                                condensation strategy and timings.
 
     Returns:
         str: The model's response to the user's question.
@@ -108,18 +386,22 @@ async def generate_response(
         Exception: If an error occurs while communicating with the
                    OpenAI API or generating the response.
     """
+    import openai
+
     try:
         response = await rag_chain.ainvoke(
             input={"question": user_question}
         )
+        if trace is not None:
+            trace.update(response.get("trace", {}))
         return response.get("answer")
     except openai.APIError as e:
-        print(
+        logger.error(
             f"Error generating response for session {session_id}: {e}"
         )
         raise Exception(f"Error communicating with OpenAI API: {e.args[0]}")
     except Exception as e:
-        print(
+        logger.exception(
             f"Error generating response for session {session_id}: {e}"
         )
         raise Exception(f"Error al generar la respuesta: {str(e)}")
@@ -134,15 +416,18 @@ async def generate_logs(
     Generate logs related to the interaction.
 
     Args:
-        rag_chain (ConversationalRetrievalChain): RAG chain.
+        rag_chain (RagChatChain): RAG chain.
         user_question (str): User's message.
         session_id (str): Session ID.
 
     Returns:
         dict: Dictionary containing logs with session ID,
-        token usage, cost, user question, model's answer,
-        and date processed.
+        token usage (including prompt tokens served from cache), cost,
+        user question, model's answer, and date processed.
     """
+    import openai
+    from langchain_community.callbacks.manager import get_openai_callback
+
     try:
         with get_openai_callback() as cb:
             response = await rag_chain.ainvoke(
@@ -153,6 +438,7 @@ async def generate_logs(
                 "session_id": session_id,
                 "total_tokens": cb.total_tokens,
                 "prompt_tokens": cb.prompt_tokens,
+                "prompt_tokens_cached": cb.prompt_tokens_cached,
                 "completion_tokens": cb.completion_tokens,
                 "total_cost_usd": cb.total_cost,
                 "user_question": user_question,
@@ -161,12 +447,12 @@ async def generate_logs(
             }
         return logs
     except openai.APIError as e:
-        print(
+        logger.error(
             f"Error generating logs for session {session_id}: {e}"
         )
         raise Exception(f"Error communicating with OpenAI API: {e.args[0]}")
     except Exception as e:
-        print(
+        logger.exception(
             f"Error generating logs for session {session_id}: {e}"
         )
         raise Exception(f"Error al generar los logs: {str(e)}")
@@ -0,0 +1,172 @@
+"""
+Incremental parser of the supervisor output. The supervisor answers
+with a JSON object whose "type" decides the route of the graph, so the
+output is parsed while it streams: the decision type, the Wikipedia
+search query and the text of the answer field are available as soon as
+their tokens arrive, before the completion ends.
+"""
+
+import json
+from typing import Dict, List, Optional
+
+# Field of "data" holding the answer shown to the user, per decision.
+ANSWER_FIELDS = {
+    "FinalAnswer": "answer",
+    "CorrectAndRefine": "corrected_answer",
+}
+CODE_FENCE = "```"
+
+
+class SupervisorOutputError(ValueError):
+    """The supervisor output is not a valid decision."""
+
+
+def _decode_escape(escape: str) -> Optional[str]:
+    """Decode a JSON string escape, or return None while incomplete."""
+    if len(escape) < 2 or (escape[1] == "u" and len(escape) < 6):
+        return None
+    return json.loads(f'"{escape}"')
+
+
+class SupervisorStreamParser:
+    """
+    Tracks the structure of the supervisor JSON chunk by chunk and keeps
+    the decoded value of every string found at the top level or inside
+    "data". Text outside the top-level object, such as a ```json code
+    fence, is ignored.
+    """
+
+    def __init__(self):
+        self.text: List[str] = []
+        self.values: Dict[str, List[str]] = {}
+        self.complete: Dict[str, str] = {}
+        self._stack: List[dict] = []
+        self._string: Optional[List[str]] = None
+        self._string_is_key = False
+        self._escape: Optional[str] = None
+        self._emitted = 0
+        self._closed = False
+
+    @property
+    def decision_type(self) -> Optional[str]:
+        return self.complete.get("type")
+
+    @property
+    def search_query(self) -> Optional[str]:
+        return self.complete.get("data.search_query")
+
+    def _path(self) -> Optional[str]:
+        keys = [level["key"] for level in self._stack]
+        if None in keys or len(keys) > 2:
+            return None
+        if len(keys) == 2 and keys[0] != "data":
+            return None
+        return ".".join(keys)
+
+    def _start_string(self):
+        top = self._stack[-1]
+        self._string_is_key = top["object"] and top["expect_key"]
+        if self._string_is_key:
+            self._string = []
+            return
+        path = self._path()
+        self._string = [] if path is None else self.values.setdefault(
+            path, []
+        )
+
+    def _end_string(self):
+        top = self._stack[-1]
+        if self._string_is_key:
+            top["key"] = "".join(self._string)
+        else:
+            path = self._path()
+            if path is not None:
+                self.complete[path] = "".join(self._string)
+        self._string = None
+
+    def _feed_char(self, char: str):
+        if self._string is not None:
+            if self._escape is not None:
+                self._escape += char
+                decoded = _decode_escape(self._escape)
+                if decoded is not None:
+                    self._string.append(decoded)
+                    self._escape = None
+            elif char == "\\":
+                self._escape = char
+            elif char == '"':
+                self._end_string()
+            else:
+                self._string.append(char)
+            return
+
+        if self._closed or (not self._stack and char != "{"):
+            return
+        if char in "{[":
+            self._stack.append({
+                "object": char == "{", "key": None, "expect_key": True,
+            })
+        elif char in "}]":
+            self._stack.pop()
+            self._closed = not self._stack
+        elif char == '"':
+            self._start_string()
+        elif char == ":":
+            self._stack[-1]["expect_key"] = False
+        elif char == ",":
+            self._stack[-1].update(key=None, expect_key=True)
+
+    def feed(self, chunk: str) -> str:
+        """
+        Parse the next chunk of the output.
+
+        Args:
+            chunk (str): Text streamed by the supervisor model.
+
+        Returns:
+            str: New text of the answer field of the decision, empty
+                 while the decision type or the field are not known yet.
+        """
+        self.text.append(chunk)
+        try:
+            for char in chunk:
+                self._feed_char(char)
+        except (ValueError, IndexError):
+            # Broken escapes or brackets: the final parse reports it.
+            self._closed = True
+            self._string = None
+            return ""
+
+        field = ANSWER_FIELDS.get(self.decision_type)
+        answer = self.values.get(f"data.{field}")
+        if answer is None or len(answer) <= self._emitted:
+            return ""
+        delta = "".join(answer[self._emitted:])
+        self._emitted = len(answer)
+        return delta
+
+    def result(self) -> dict:
+        """
+        Parse the whole output once the stream has ended.
+
+        Returns:
+            dict: The decision, with its "type" and "data".
+
+        Raises:
+            SupervisorOutputError: If the output is not a JSON object
+                                   with a "type" and a "data" object.
+        """
+        content = "".join(self.text).strip()
+        if content.startswith(CODE_FENCE) and content.endswith(CODE_FENCE):
+            content = content[len(CODE_FENCE):-len(CODE_FENCE)]
+            if content.startswith("json"):
+                content = content[len("json"):]
+        try:
+            parsed = json.loads(content)
+        except json.JSONDecodeError as e:
+            raise SupervisorOutputError(f"JSON no válido: {e}") from e
+        if not isinstance(parsed, dict) or not isinstance(
+            parsed.get("data"), dict
+        ):
+            raise SupervisorOutputError("Falta el objeto 'data'.")
+        return parsed
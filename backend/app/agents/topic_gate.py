@@ -0,0 +1,453 @@
+"""
+Topic gate in front of the LangGraph flow. A question is embedded and
+compared with the centroids of a few example questions per topic; when
+its nearest centroid is an off-topic one and no domain topic reaches
+`TOPIC_GATE_THRESHOLD`, it gets a templated refusal without any
+retrieval or model call.
+
+The centroids are computed once from the examples below and saved to
+`TOPIC_GATE_CENTROIDS_PATH`, tied to the embedding deployment and the
+examples they came from.
+
+Usage:
+    python -m backend.app.agents.topic_gate --build
+    python -m backend.app.agents.topic_gate --check "¿Qué es el mundial?"
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, NamedTuple, Optional
+
+from backend.app.config.settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+# Questions the assistant answers. Greetings and questions about the
+# assistant itself are in scope: they must never be refused.
+DOMAIN_TOPICS: Dict[str, List[str]] = {
+    "logistica": [
+        "¿Qué es la logística de distribución?",
+        "¿Cómo organizo las rutas de entrega de mi minimarket?",
+        "¿Qué es la cadena de suministro?",
+        "¿Cómo elijo un proveedor de transporte?",
+        "¿Qué es la logística inversa?",
+        "¿Cuánto cuesta el despacho a domicilio de mis productos?",
+    ],
+    "inventario": [
+        "¿Qué es el stock de seguridad?",
+        "¿Cómo calculo la rotación de inventario?",
+        "¿Qué es el método FIFO?",
+        "¿Cómo hago un inventario físico en mi tienda?",
+        "¿Qué es el análisis ABC de productos?",
+        "¿Cómo evito quiebres de stock?",
+    ],
+    "bodegaje": [
+        "¿Cómo ordeno la bodega de mi negocio?",
+        "¿Qué productos debo poner cerca de la entrada de la bodega?",
+        "¿Cómo almaceno productos perecibles?",
+        "¿Qué es el layout de un almacén?",
+        "¿Cómo controlo las mermas en bodega?",
+    ],
+    "reabastecimiento": [
+        "¿Cuándo debo volver a pedir mercadería?",
+        "¿Qué es el punto de reorden?",
+        "¿Qué es la cantidad económica de pedido?",
+        "¿Cada cuánto tiempo le compro a mis proveedores?",
+        "¿Cómo calculo cuánto pedir de cada producto?",
+    ],
+    "finanzas": [
+        "¿Cómo calculo el margen de ganancia de un producto?",
+        "¿Qué es el flujo de caja de un negocio?",
+        "¿Cómo fijo el precio de venta en mi almacén?",
+        "¿Cuánto capital de trabajo necesita mi tienda?",
+        "¿Qué es el costo de mantener inventario?",
+        "¿Cómo separo las finanzas personales de las del negocio?",
+    ],
+    "conversacion": [
+        "Hola",
+        "Buenos días, ¿cómo estás?",
+        "Gracias por la ayuda",
+        "¿Quién eres?",
+        "¿Qué puedes hacer por mí?",
+        "No entendí, ¿me lo puedes explicar de nuevo?",
+    ],
+}
+
+OFF_TOPICS: Dict[str, List[str]] = {
+    "deportes": [
+        "¿Quién ganó el último mundial de fútbol?",
+        "¿Cuántos títulos tiene el Real Madrid?",
+        "¿Quién es el mejor tenista de la historia?",
+        "¿Cuándo son los próximos Juegos Olímpicos?",
+    ],
+    "entretenimiento": [
+        "Recomiéndame una película de terror",
+        "¿Cuál es la mejor serie de Netflix?",
+        "Cuéntame un chiste",
+        "¿Quién canta esta canción?",
+    ],
+    "politica": [
+        "¿Quién va a ganar las próximas elecciones?",
+        "¿Qué opinas del presidente?",
+        "¿Cuál es el mejor partido político?",
+        "¿Qué es la democracia?",
+    ],
+    "salud": [
+        "¿Qué remedio tomo para el dolor de cabeza?",
+        "¿Cuántas calorías tiene una manzana?",
+        "¿Qué ejercicios sirven para bajar de peso?",
+        "¿Cuáles son los síntomas de la gripe?",
+    ],
+    "tecnologia": [
+        "¿Cómo programo una página web en Python?",
+        "¿Qué celular me recomiendas comprar?",
+        "¿Cómo arreglo mi computador que no enciende?",
+        "Escríbeme un código en JavaScript",
+    ],
+    "cultura_general": [
+        "¿Cuál es la capital de Australia?",
+        "¿Quién pintó la Mona Lisa?",
+        "¿Cómo se hace una torta de chocolate?",
+        "Escríbeme un poema de amor",
+        "¿Qué tiempo va a hacer mañana?",
+    ],
+}
+
+# Seconds the gate stays open after the centroids failed to load.
+LOAD_RETRY_SECONDS = 60
+
+TOPIC_REFUSAL = (
+    "🙏 Lo siento, solo puedo ayudarte con temas de logística, finanzas, "
+    "inventario, bodegaje y reabastecimiento para tu negocio. "
+    "¿Tienes alguna pregunta sobre estos temas?"
+)
+
+
+class TopicVerdict(NamedTuple):
+    off_topic: bool
+    topic: str
+    similarity: float
+    domain_similarity: float
+
+
+def examples_fingerprint() -> str:
+    """Fingerprint of the embedding deployment and the topic examples."""
+    settings = get_settings()
+    payload = json.dumps(
+        [settings.AZURE_EMBEDDING_DEPLOYMENT, DOMAIN_TOPICS, OFF_TOPICS],
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+async def build_centroids(
+    embeddings_client=None
+) -> Dict[str, List[float]]:
+    """
+    Embed the examples and average them into one unit vector per topic.
+
+    Args:
+        embeddings_client (AzureOpenAIEmbeddings, optional): Client to
+                                                            embed with.
+
+    Returns:
+        Dict[str, List[float]]: Centroid of every domain and off topic.
+    """
+    import numpy as np
+
+    from backend.app.knowledge_base.embeddings import (
+        create_embeddings_client
+    )
+
+    embeddings_client = embeddings_client or create_embeddings_client()
+    topics = {**DOMAIN_TOPICS, **OFF_TOPICS}
+    texts = [text for examples in topics.values() for text in examples]
+    vectors = np.array(await embeddings_client.aembed_documents(texts))
+
+    centroids = {}
+    start = 0
+    for topic, examples in topics.items():
+        centroid = vectors[start:start + len(examples)].mean(axis=0)
+        centroids[topic] = (centroid / np.linalg.norm(centroid)).tolist()
+        start += len(examples)
+    return centroids
+
+
+def load_centroids(path: str) -> Optional[Dict[str, List[float]]]:
+    """
+    Read the saved centroids, if they match the current examples.
+
+    Args:
+        path (str): Centroids file.
+
+    Returns:
+        Dict[str, List[float]]: The centroids, or None if missing or
+                                stale.
+    """
+    try:
+        with open(path, encoding="utf-8") as file:
+            saved = json.load(file)
+    except (OSError, ValueError):
+        return None
+    if saved.get("fingerprint") != examples_fingerprint():
+        return None
+    return saved["centroids"]
+
+
+def save_centroids(path: str, centroids: Dict[str, List[float]]):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as file:
+        json.dump(
+            {"fingerprint": examples_fingerprint(), "centroids": centroids},
+            file,
+        )
+    os.replace(temp_path, path)
+
+
+class TopicGate:
+    """
+    Nearest-centroid topic classifier with counters of the questions it
+    checked, let through and refused.
+    """
+
+    def __init__(self, threshold: float, centroids_path: str):
+        self.threshold = threshold
+        self.centroids_path = centroids_path
+        self._topics: Optional[List[str]] = None
+        self._matrix = None
+        self._embeddings_client = None
+        self._load_lock: Optional[asyncio.Lock] = None
+        self._load_task: Optional[asyncio.Task] = None
+        self._retry_at = 0.0
+        self._lock = threading.Lock()
+        self.checked = 0
+        self.gated = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.gated_topics: Counter = Counter()
+
+    @property
+    def ready(self) -> bool:
+        return self._matrix is not None
+
+    async def load(self):
+        """
+        Load the saved centroids, building and saving them when they are
+        missing or were computed from other examples.
+        """
+        import numpy as np
+
+        from backend.app.knowledge_base.embeddings import (
+            create_embeddings_client
+        )
+
+        if self.ready:
+            return
+        self._load_lock = self._load_lock or asyncio.Lock()
+        async with self._load_lock:
+            if self.ready:
+                return
+            if time.monotonic() < self._retry_at:
+                raise RuntimeError("centroides no disponibles")
+            embeddings_client = create_embeddings_client()
+            centroids = load_centroids(self.centroids_path)
+            if centroids is None:
+                try:
+                    centroids = await build_centroids(embeddings_client)
+                except Exception:
+                    self._retry_at = time.monotonic() + LOAD_RETRY_SECONDS
+                    raise
+                await asyncio.to_thread(
+                    save_centroids, self.centroids_path, centroids
+                )
+            self._embeddings_client = embeddings_client
+            self._topics = list(centroids)
+            self._matrix = np.array(list(centroids.values()))
+
+    def classify(self, vector: List[float]) -> TopicVerdict:
+        """
+        Classify an embedded question.
+
+        Args:
+            vector (List[float]): Embedding of the question.
+
+        Returns:
+            TopicVerdict: Whether it is off topic, its nearest topic and
+                          the similarity to it and to the nearest domain
+                          topic.
+        """
+        import numpy as np
+
+        query = np.asarray(vector)
+        similarities = self._matrix @ (query / np.linalg.norm(query))
+        nearest = int(similarities.argmax())
+        domain_similarity = max(
+            similarity
+            for topic, similarity in zip(self._topics, similarities)
+            if topic in DOMAIN_TOPICS
+        )
+        topic = self._topics[nearest]
+        return TopicVerdict(
+            off_topic=(
+                topic not in DOMAIN_TOPICS
+                and domain_similarity < self.threshold
+            ),
+            topic=topic,
+            similarity=round(float(similarities[nearest]), 4),
+            domain_similarity=round(float(domain_similarity), 4),
+        )
+
+    async def check(self, question: str) -> TopicVerdict:
+        await self.load()
+        vector = await self._embeddings_client.aembed_query(question)
+        return self.classify(vector)
+
+    def _on_loaded(self, task: asyncio.Task):
+        if task.cancelled() or task.exception() is None:
+            return
+        with self._lock:
+            self.errors += 1
+        logger.warning(f"Filtro de temas no disponible: {task.exception()}")
+
+    def _load_in_background(self):
+        if self._load_task is None or self._load_task.done():
+            self._load_task = asyncio.create_task(self.load())
+            self._load_task.add_done_callback(self._on_loaded)
+
+    async def is_off_topic(
+        self,
+        question: str,
+        timeout: Optional[float] = None
+    ) -> bool:
+        """
+        Decide whether a question must be refused. The gate fails open:
+        the question goes through while the centroids load in the
+        background, for `LOAD_RETRY_SECONDS` after they couldn't be
+        built, and when the embedding fails or takes over `timeout`.
+
+        Args:
+            question (str): User question.
+            timeout (float, optional): Seconds allowed for the embedding.
+
+        Returns:
+            bool: True if the question is clearly off topic.
+        """
+        if not self.ready:
+            if time.monotonic() >= self._retry_at:
+                self._load_in_background()
+            return False
+        try:
+            vector = await asyncio.wait_for(
+                self._embeddings_client.aembed_query(question), timeout
+            )
+            verdict = self.classify(vector)
+        except asyncio.TimeoutError:
+            with self._lock:
+                self.timeouts += 1
+            logger.warning(f"Filtro de temas: sin respuesta en {timeout} s.")
+            return False
+        except Exception as e:
+            with self._lock:
+                self.errors += 1
+            logger.warning(f"Filtro de temas no disponible: {e}")
+            return False
+        with self._lock:
+            self.checked += 1
+            if verdict.off_topic:
+                self.gated += 1
+                self.gated_topics[verdict.topic] += 1
+        if verdict.off_topic:
+            logger.info(
+                f"Pregunta fuera de tema ({verdict.topic}).",
+                extra={"topic_verdict": verdict._asdict()},
+            )
+        return verdict.off_topic
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "enabled": get_settings().TOPIC_GATE_ENABLED,
+                "ready": self.ready,
+                "threshold": self.threshold,
+                "checked": self.checked,
+                "gated": self.gated,
+                "gated_ratio": (
+                    round(self.gated / self.checked, 4)
+                    if self.checked else None
+                ),
+                "errors": self.errors,
+                "timeouts": self.timeouts,
+                "gated_topics": dict(self.gated_topics),
+            }
+
+
+_topic_gate = None
+
+
+def get_topic_gate() -> TopicGate:
+    """
+    Obtains the shared topic gate. Its centroids are loaded on first use
+    or by the warm-up stage.
+
+    Returns:
+        TopicGate: The shared topic gate.
+    """
+    global _topic_gate
+    if _topic_gate is None:
+        settings = get_settings()
+        _topic_gate = TopicGate(
+            settings.TOPIC_GATE_THRESHOLD,
+            settings.TOPIC_GATE_CENTROIDS_PATH,
+        )
+    return _topic_gate
+
+
+async def _main(args):
+    settings = get_settings()
+    if args.build:
+        centroids = await build_centroids()
+        save_centroids(settings.TOPIC_GATE_CENTROIDS_PATH, centroids)
+        print(
+            f"✅ {len(centroids)} centroides guardados en "
+            f"{settings.TOPIC_GATE_CENTROIDS_PATH}"
+        )
+    gate = TopicGate(
+        args.threshold or settings.TOPIC_GATE_THRESHOLD,
+        settings.TOPIC_GATE_CENTROIDS_PATH,
+    )
+    for question in args.check:
+        verdict = await gate.check(question)
+        mark = "🚫" if verdict.off_topic else "✅"
+        print(
+            f"{mark} {question}\n"
+            f"   tema más cercano: {verdict.topic} ({verdict.similarity}), "
+            f"dominio: {verdict.domain_similarity}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Build the topic centroids or classify questions."
+    )
+    parser.add_argument("--build", action="store_true",
+                        help="Embed the examples and save the centroids.")
+    parser.add_argument("--check", nargs="*", default=[],
+                        help="Questions to classify.")
+    parser.add_argument("--threshold", type=float, default=None)
+    args = parser.parse_args()
+    asyncio.run(_main(args))
+
+
+if __name__ == "__main__":
+    main()
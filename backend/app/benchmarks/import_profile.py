@@ -0,0 +1,110 @@
+"""
+Import-time profile of the application, used to keep cold starts fast.
+
+Runs `python -X importtime -c "import backend.app.main"` in a fresh
+interpreter, prints the slowest modules and fails when the total import
+time exceeds the budget or when a heavy integration is imported eagerly.
+
+Usage:
+    python -m backend.app.benchmarks.import_profile --budget-ms 1500
+"""
+
+import argparse
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+TARGET_MODULE = "backend.app.main"
+
+# Integrations that must only be imported where they are used (or by the
+# warm-up stage), never while importing the application.
+DEFERRED_MODULES = [
+    "langgraph",
+    "langchain_openai",
+    "langchain_community",
+    "langchain.chains",
+    "langchain.memory",
+    "openai",
+    "azure.search",
+]
+
+
+def profile_imports(module: str = TARGET_MODULE) -> List[Tuple[str, int, int]]:
+    """
+    Import a module in a fresh interpreter with `-X importtime`.
+
+    Args:
+        module (str): Module to import.
+
+    Returns:
+        List[Tuple[str, int, int]]: (module, self_us, cumulative_us) for
+                                    every imported module.
+    """
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(
+            f"Importing {module} failed:\n{completed.stderr[-2000:]}"
+        )
+
+    rows = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Profile the import time of the application."
+    )
+    parser.add_argument("--module", default=TARGET_MODULE)
+    parser.add_argument("--budget-ms", type=float, default=1500.0)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    rows = profile_imports(args.module)
+    cumulative: Dict[str, int] = {name: total for name, _, total in rows}
+    total_ms = cumulative.get(args.module, 0) / 1000
+
+    print(f"Slowest modules by self time importing {args.module}:")
+    for name, self_us, total_us in sorted(
+        rows, key=lambda row: row[1], reverse=True
+    )[:args.top]:
+        print(
+            f"  {self_us / 1000:8.1f} ms self {total_us / 1000:8.1f} ms "
+            f"cumulative  {name}"
+        )
+
+    eager = sorted(
+        name for name in cumulative
+        if any(
+            name == deferred or name.startswith(f"{deferred}.")
+            for deferred in DEFERRED_MODULES
+        )
+    )
+    print(f"\nTotal import time: {total_ms:.1f} ms "
+          f"(budget {args.budget_ms:.0f} ms)")
+
+    failed = False
+    if eager:
+        failed = True
+        roots = sorted({name.split(".")[0] for name in eager})
+        print(
+            f"❌ Deferred integrations imported eagerly: {', '.join(roots)}"
+        )
+    if total_ms > args.budget_ms:
+        failed = True
+        print("❌ Import time is over budget.")
+    if not failed:
+        print("✅ Import time is within budget.")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
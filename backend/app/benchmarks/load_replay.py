@@ -0,0 +1,479 @@
+"""
+Open-loop load generator that replays question traces.
+
+Requests are sent at their scheduled arrival times whatever the state of
+the previous ones, so queueing shows up as growing latency instead of
+silently lowering the offered load as in a closed-loop benchmark.
+
+Arrivals follow a Poisson process at each target rate of a sweep, or the
+recorded timestamps of the trace. For each rate the tool reports the
+achieved throughput, latency and time-to-first-token percentiles, and the
+error and 429 rates. The saturation point is the first rate that breaks
+the SLO.
+
+Targets:
+    chat       POST /api/chat of a running backend
+    stream     POST /api/chat/stream of a running backend (SSE)
+    inprocess  the LangGraph flow in this process, optionally against a
+               stub Azure OpenAI started with the --stub-* options
+
+Usage:
+    python -m backend.app.benchmarks.load_replay \\
+        --trace .kb_state/interactions.jsonl --target stream \\
+        --rates 1 2 4 8 --duration 60 --slo-p95-ms 8000
+    python -m backend.app.benchmarks.load_replay --target inprocess \\
+        --trace questions.jsonl --context "El stock de seguridad es..." \\
+        --stub-latency-ms 400 --stub-throttle-rate 0.05 --rates 5 10 20
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime
+from typing import Callable, List, NamedTuple, Optional, Tuple
+
+import httpx
+
+OK = "ok"
+ERROR = "error"
+THROTTLED = "throttled"
+
+
+class TraceEntry(NamedTuple):
+    question: str
+    timestamp: Optional[float]
+
+
+class Result(NamedTuple):
+    outcome: str
+    latency_ms: float
+    ttft_ms: Optional[float]
+    lag_ms: float
+
+
+def load_trace(path: str) -> List[TraceEntry]:
+    """
+    Read a question trace: JSON lines with the question under
+    "user_question", "question" or "message", and optionally its time as
+    "offset_s" (seconds) or "date_processed" / "timestamp" (ISO 8601).
+    Lines that are not JSON are taken as plain questions.
+
+    Args:
+        path (str): Trace file, e.g. the interaction log.
+
+    Returns:
+        List[TraceEntry]: Questions in trace order.
+    """
+    entries = []
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                entries.append(TraceEntry(line, None))
+                continue
+            question = (
+                record.get("user_question")
+                or record.get("question")
+                or record.get("message")
+            )
+            if not question:
+                continue
+            timestamp = record.get("offset_s")
+            when = record.get("date_processed") or record.get("timestamp")
+            if timestamp is None and when:
+                timestamp = datetime.fromisoformat(when).timestamp()
+            entries.append(TraceEntry(question, timestamp))
+    if not entries:
+        raise ValueError(f"No questions found in {path}")
+    return entries
+
+
+def poisson_schedule(
+    trace: List[TraceEntry],
+    rate: float,
+    duration: float,
+    seed: Optional[int] = None
+) -> List[Tuple[float, str]]:
+    """
+    Arrival times of a Poisson process at `rate` requests per second,
+    cycling through the questions of the trace.
+
+    Returns:
+        List[Tuple[float, str]]: (seconds from start, question) pairs.
+    """
+    generator = random.Random(seed)
+    schedule = []
+    now = generator.expovariate(rate)
+    index = 0
+    while now < duration:
+        schedule.append((now, trace[index % len(trace)].question))
+        index += 1
+        now += generator.expovariate(rate)
+    return schedule
+
+
+def recorded_schedule(
+    trace: List[TraceEntry],
+    speedup: float,
+    duration: float
+) -> List[Tuple[float, str]]:
+    """
+    Arrival times taken from the trace timestamps, compressed by
+    `speedup` and cut at `duration`.
+
+    Returns:
+        List[Tuple[float, str]]: (seconds from start, question) pairs.
+    """
+    timed = [entry for entry in trace if entry.timestamp is not None]
+    if not timed:
+        raise ValueError("The trace has no timestamps to replay")
+    start = min(entry.timestamp for entry in timed)
+    schedule = sorted(
+        ((entry.timestamp - start) / speedup, entry.question)
+        for entry in timed
+    )
+    return [(at, question) for at, question in schedule if at < duration]
+
+
+def _outcome_of(status_code: int, detail: str = "") -> str:
+    if status_code == 429 or "429" in detail or "RateLimit" in detail:
+        return THROTTLED
+    return OK if status_code < 400 else ERROR
+
+
+def http_chat_target(client: httpx.AsyncClient, base_url: str) -> Callable:
+    """Target that calls POST /api/chat; TTFT is the full latency."""
+
+    async def call(question: str) -> Tuple[str, Optional[float]]:
+        response = await client.post(
+            f"{base_url}/api/chat", json={"message": question}
+        )
+        return _outcome_of(response.status_code, response.text), None
+
+    return call
+
+
+def http_stream_target(client: httpx.AsyncClient, base_url: str) -> Callable:
+    """Target that calls POST /api/chat/stream and reads the SSE events."""
+
+    async def call(question: str) -> Tuple[str, Optional[float]]:
+        started = time.perf_counter()
+        ttft = None
+        async with client.stream(
+            "POST", f"{base_url}/api/chat/stream", json={"message": question}
+        ) as response:
+            if response.status_code >= 400:
+                body = (await response.aread()).decode("utf-8", "replace")
+                return _outcome_of(response.status_code, body), None
+            async for line in response.aiter_lines():
+                if not line.startswith("data: "):
+                    continue
+                event = json.loads(line[len("data: "):])
+                if event["type"] in ("token", "answer") and ttft is None:
+                    ttft = (time.perf_counter() - started) * 1000
+                if event["type"] == "error":
+                    return _outcome_of(500, event.get("detail", "")), ttft
+                if event["type"] == "answer":
+                    return OK, ttft
+        return ERROR, ttft
+
+    return call
+
+
+def inprocess_target(context: Optional[str]) -> Callable:
+    """
+    Target that runs the LangGraph flow in this process. With a context,
+    it is passed as the retrieved document and Azure AI Search is skipped.
+    """
+    from langchain_core.documents import Document
+
+    from backend.app.agents.agent import stream_user_question
+
+    documents = [Document(page_content=context)] if context else None
+
+    async def call(question: str) -> Tuple[str, Optional[float]]:
+        started = time.perf_counter()
+        ttft = None
+        try:
+            async for event in stream_user_question(
+                question, retrieved_documents=documents
+            ):
+                if event["type"] in ("token", "answer") and ttft is None:
+                    ttft = (time.perf_counter() - started) * 1000
+        except Exception as e:
+            return _outcome_of(500, f"{type(e).__name__} {e}"), ttft
+        return OK, ttft
+
+    return call
+
+
+async def run_open_loop(
+    call: Callable,
+    schedule: List[Tuple[float, str]],
+    drain_seconds: float = 60.0
+) -> Tuple[List[Result], int]:
+    """
+    Send every request at its scheduled time without waiting for the
+    previous ones.
+
+    Args:
+        call (Callable): Target to call with each question.
+        schedule (List[Tuple[float, str]]): Arrival times and questions.
+        drain_seconds (float): Time allowed for the last requests to end.
+
+    Returns:
+        Tuple[List[Result], int]: Result of every request and the maximum
+                                  number of requests in flight.
+    """
+    results: List[Result] = []
+    in_flight = 0
+    max_in_flight = 0
+
+    async def send(scheduled: float, question: str, start: float):
+        nonlocal in_flight, max_in_flight
+        sent = time.perf_counter()
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        try:
+            outcome, ttft = await call(question)
+        except Exception as e:
+            outcome, ttft = _outcome_of(500, f"{type(e).__name__} {e}"), None
+        finally:
+            in_flight -= 1
+        latency = (time.perf_counter() - sent) * 1000
+        results.append(
+            Result(
+                outcome,
+                latency,
+                ttft if ttft is not None else latency,
+                (sent - start - scheduled) * 1000,
+            )
+        )
+
+    start = time.perf_counter()
+    tasks = []
+    for scheduled, question in schedule:
+        delay = start + scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(send(scheduled, question, start)))
+    if tasks:
+        await asyncio.wait(tasks, timeout=drain_seconds)
+    unfinished = sum(not task.done() for task in tasks)
+    for task in tasks:
+        task.cancel()
+    results.extend(
+        Result(ERROR, drain_seconds * 1000, None, 0.0)
+        for _ in range(unfinished)
+    )
+    return results, max_in_flight
+
+
+def _percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(int(q * len(values)), len(values) - 1)], 1)
+
+
+def summarize(
+    results: List[Result],
+    offered_rate: float,
+    duration: float,
+    max_in_flight: int
+) -> dict:
+    """Aggregate the results of one step of the sweep."""
+    total = len(results)
+    succeeded = [result for result in results if result.outcome == OK]
+    latencies = [result.latency_ms for result in succeeded]
+    ttfts = [result.ttft_ms for result in succeeded]
+    return {
+        "offered_rps": offered_rate,
+        "sent": total,
+        "achieved_rps": round(len(succeeded) / duration, 2),
+        "error_rate": round(
+            sum(result.outcome == ERROR for result in results) / total, 4
+        ) if total else None,
+        "throttled_rate": round(
+            sum(result.outcome == THROTTLED for result in results) / total, 4
+        ) if total else None,
+        "latency_ms": {
+            "p50": _percentile(latencies, 0.50),
+            "p95": _percentile(latencies, 0.95),
+            "p99": _percentile(latencies, 0.99),
+        },
+        "ttft_ms": {
+            "p50": _percentile(ttfts, 0.50),
+            "p95": _percentile(ttfts, 0.95),
+            "p99": _percentile(ttfts, 0.99),
+        },
+        "max_in_flight": max_in_flight,
+        "max_send_lag_ms": round(
+            max((result.lag_ms for result in results), default=0.0), 1
+        ),
+    }
+
+
+def is_saturated(step: dict, slo_p95_ms: float, max_error_rate: float) -> bool:
+    """
+    A step is saturated when it breaks the latency SLO, fails too often
+    or completes noticeably less than the offered load.
+    """
+    p95 = step["latency_ms"]["p95"]
+    failures = (step["error_rate"] or 0) + (step["throttled_rate"] or 0)
+    return (
+        p95 is None
+        or p95 > slo_p95_ms
+        or failures > max_error_rate
+        or step["achieved_rps"] < 0.9 * step["offered_rps"]
+    )
+
+
+def start_stub(args) -> subprocess.Popen:
+    """Start a stub Azure OpenAI and point this process at it."""
+    stub = subprocess.Popen(
+        [
+            sys.executable, "-m", "backend.app.benchmarks.stub_server",
+            "--port", str(args.stub_port),
+            "--latency-ms", str(args.stub_latency_ms),
+            "--jitter-ms", str(args.stub_jitter_ms),
+            "--token-delay-ms", str(args.stub_token_delay_ms),
+            "--throttle-rate", str(args.stub_throttle_rate),
+            "--error-rate", str(args.stub_error_rate),
+        ],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    os.environ["AZURE_ENDPOINT"] = f"http://127.0.0.1:{args.stub_port}"
+    os.environ.pop("AZURE_LLM_DEPLOYMENTS", None)
+    os.environ.pop("AZURE_LLM_ROLE_DEPLOYMENTS", None)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{args.stub_port}/stats")
+            return stub
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    stub.terminate()
+    raise RuntimeError("The stub server did not start")
+
+
+async def sweep(args) -> List[dict]:
+    trace = load_trace(args.trace)
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=100)
+    async with httpx.AsyncClient(
+        limits=limits, timeout=args.timeout
+    ) as client:
+        if args.target == "chat":
+            call = http_chat_target(client, args.base_url)
+        elif args.target == "stream":
+            call = http_stream_target(client, args.base_url)
+        else:
+            call = inprocess_target(args.context)
+
+        steps = []
+        if args.arrivals == "recorded":
+            plans = [
+                (None, recorded_schedule(trace, args.speedup, args.duration))
+            ]
+        else:
+            plans = [
+                (rate, poisson_schedule(trace, rate, args.duration, args.seed))
+                for rate in args.rates
+            ]
+        for rate, schedule in plans:
+            offered = (
+                rate if rate is not None else len(schedule) / args.duration
+            )
+            with contextlib.ExitStack() as stack:
+                if args.target == "inprocess":
+                    devnull = stack.enter_context(open(os.devnull, "w"))
+                    stack.enter_context(contextlib.redirect_stdout(devnull))
+                results, max_in_flight = await run_open_loop(
+                    call, schedule, args.timeout
+                )
+            step = summarize(results, offered, args.duration, max_in_flight)
+            step["saturated"] = is_saturated(
+                step, args.slo_p95_ms, args.max_error_rate
+            )
+            steps.append(step)
+            print(
+                f"{offered:>8.2f} rps offered  {step['achieved_rps']:>8.2f} "
+                f"achieved  p50 {step['latency_ms']['p50']} ms  "
+                f"p95 {step['latency_ms']['p95']} ms  "
+                f"ttft p95 {step['ttft_ms']['p95']} ms  "
+                f"errors {step['error_rate']}  429 {step['throttled_rate']}"
+                f"{'  SATURATED' if step['saturated'] else ''}"
+            )
+    return steps
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Open-loop replay of question traces."
+    )
+    parser.add_argument("--trace", required=True,
+                        help="JSON lines trace, e.g. the interaction log.")
+    parser.add_argument("--target", choices=["chat", "stream", "inprocess"],
+                        default="chat")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--arrivals", choices=["poisson", "recorded"],
+                        default="poisson")
+    parser.add_argument("--rates", type=float, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--speedup", type=float, default=1.0,
+                        help="Time compression of recorded arrivals.")
+    parser.add_argument("--duration", type=float, default=60.0)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--slo-p95-ms", type=float, default=10000.0)
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--context", default=None,
+                        help="In-process only: fixed retrieved document.")
+    parser.add_argument("--stub-latency-ms", type=float, default=None,
+                        help="In-process only: start a stub Azure OpenAI.")
+    parser.add_argument("--stub-jitter-ms", type=float, default=50.0)
+    parser.add_argument("--stub-token-delay-ms", type=float, default=10.0)
+    parser.add_argument("--stub-throttle-rate", type=float, default=0.0)
+    parser.add_argument("--stub-error-rate", type=float, default=0.0)
+    parser.add_argument("--stub-port", type=int, default=9050)
+    parser.add_argument("--output", default=None,
+                        help="Write the summary as JSON to this file.")
+    args = parser.parse_args()
+
+    stub = None
+    if args.stub_latency_ms is not None:
+        if args.target != "inprocess":
+            parser.error("--stub-* options only apply to --target inprocess")
+        stub = start_stub(args)
+    try:
+        steps = asyncio.run(sweep(args))
+    finally:
+        if stub is not None:
+            stub.terminate()
+
+    saturation = next(
+        (step["offered_rps"] for step in steps if step["saturated"]), None
+    )
+    if saturation is None:
+        print("No saturation within the tested rates.")
+    else:
+        print(f"Saturation point: {saturation:.2f} rps")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(
+                {"steps": steps, "saturation_rps": saturation}, file, indent=2
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""
+Caller-side cost of logging a graph node event, used to keep logging
+off the request latency.
+
+Logs the same events through `print`, a synchronous JSON handler, the
+queue handler of the application and the queue handler with node event
+sampling, all writing to a stream that takes `--write-us` per write like
+a congested stdout pipe. Prints the p50 and p99 time spent in the
+logging call and fails when the p99 of the application handler exceeds
+the budget.
+
+Usage:
+    python -m backend.app.benchmarks.logging_overhead --budget-us 100
+"""
+
+import argparse
+import io
+import json
+import logging
+import queue
+import sys
+import time
+from logging.handlers import QueueListener
+from typing import Callable, Dict, List
+
+from backend.app.config.settings import get_settings
+from backend.app.structured_logging import (
+    ContextFilter,
+    JsonFormatter,
+    NonBlockingQueueHandler,
+    log_context,
+    new_request_id,
+)
+
+# Node events logged by one run of the LangGraph flow.
+EVENTS_PER_REQUEST = 8
+
+
+class SlowStream(io.TextIOBase):
+    """Text stream that blocks for a fixed time on every write."""
+
+    def __init__(self, write_us: float):
+        self.write_seconds = write_us / 1e6
+        self.writes = 0
+
+    def write(self, text: str) -> int:
+        # Sleeping releases the GIL, like a write blocked on the pipe.
+        time.sleep(self.write_seconds)
+        self.writes += 1
+        return len(text)
+
+
+def _percentile(samples: List[float], q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+def _logger(name: str, handler: logging.Handler) -> logging.Logger:
+    logger = logging.getLogger(f"logging_overhead.{name}")
+    logger.handlers = [handler]
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    return logger
+
+
+def measure(log: Callable[[int], None], requests: int) -> List[float]:
+    """
+    Time every logging call of a number of simulated requests.
+
+    Args:
+        log (Callable[[int], None]): Logs the event with the given index.
+        requests (int): Simulated requests, each with its own request id.
+
+    Returns:
+        List[float]: Duration of every call in microseconds.
+    """
+    samples = []
+    for _ in range(requests):
+        with log_context(request_id=new_request_id(), session_id="bench"):
+            for index in range(EVENTS_PER_REQUEST):
+                started = time.perf_counter()
+                log(index)
+                samples.append((time.perf_counter() - started) * 1e6)
+    return samples
+
+
+def run(
+    requests: int,
+    write_us: float,
+    sample_rate: float
+) -> Dict[str, dict]:
+    """
+    Measure every logging strategy against the same slow stream.
+
+    Args:
+        requests (int): Simulated requests per strategy.
+        write_us (float): Time the stream takes per write.
+        sample_rate (float): Share of requests whose node events are kept
+                             by the sampled strategy.
+
+    Returns:
+        Dict[str, dict]: p50 and p99 in microseconds, plus the records
+                         dropped by the queue, for every strategy.
+    """
+    queue_size = get_settings().LOG_QUEUE_SIZE
+    extra = {"node": "call_rag_agent", "sampled": True}
+    results = {}
+
+    stream = SlowStream(write_us)
+    samples = measure(
+        lambda index: print(
+            json.dumps({"message": f"Nodo {index}", **extra}), file=stream
+        ),
+        requests,
+    )
+    results["print"] = {"samples": samples, "dropped": 0}
+
+    handler = logging.StreamHandler(SlowStream(write_us))
+    handler.setFormatter(JsonFormatter())
+    handler.addFilter(ContextFilter(1.0))
+    logger = _logger("sync", handler)
+    samples = measure(
+        lambda index: logger.info("Nodo %d", index, extra=extra), requests
+    )
+    results["sync"] = {"samples": samples, "dropped": 0}
+
+    for name, rate in (("queue", 1.0), ("queue-sampled", sample_rate)):
+        writer = logging.StreamHandler(SlowStream(write_us))
+        writer.setFormatter(JsonFormatter())
+        handler = NonBlockingQueueHandler(queue.Queue(queue_size))
+        handler.addFilter(ContextFilter(rate))
+        listener = QueueListener(handler.queue, writer)
+        listener.start()
+        logger = _logger(name, handler)
+        samples = measure(
+            lambda index: logger.info("Nodo %d", index, extra=extra),
+            requests,
+        )
+        listener.stop()
+        results[name] = {"samples": samples, "dropped": handler.dropped}
+
+    return {
+        name: {
+            "p50_us": round(_percentile(result["samples"], 0.50), 1),
+            "p99_us": round(_percentile(result["samples"], 0.99), 1),
+            "dropped": result["dropped"],
+        }
+        for name, result in results.items()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure the caller-side cost of logging node events."
+    )
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--write-us", type=float, default=100.0,
+                        help="Time the output stream takes per write.")
+    parser.add_argument("--sample-rate", type=float, default=0.1)
+    parser.add_argument("--budget-us", type=float, default=100.0,
+                        help="Maximum p99 of the queue handler.")
+    args = parser.parse_args()
+
+    results = run(args.requests, args.write_us, args.sample_rate)
+    print(
+        f"{args.requests * EVENTS_PER_REQUEST} events per strategy, "
+        f"{args.write_us:.0f} us per write:"
+    )
+    for name, result in results.items():
+        print(
+            f"  {name:>14}  p50 {result['p50_us']:8.1f} us  "
+            f"p99 {result['p99_us']:8.1f} us  "
+            f"dropped {result['dropped']}"
+        )
+
+    p99 = results["queue"]["p99_us"]
+    print(f"\nQueue handler p99: {p99:.1f} us "
+          f"(budget {args.budget_us:.0f} us)")
+    if p99 > args.budget_us:
+        print("❌ Logging overhead is over budget.")
+        sys.exit(1)
+    print("✅ Logging overhead is within budget.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+"""
+Local stub of the Azure OpenAI chat and embeddings API, used to exercise
+the model router and the load tests without spending real quota.
+
+Usage:
+    python -m backend.app.benchmarks.stub_server --port 9001 \\
+        --latency-ms 300 --throttle-rate 0.05
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+DEFAULT_REPLY = (
+    '{"type": "FinalAnswer", "data": {"answer": "El stock de seguridad '
+    'es el inventario adicional que protege frente a la variabilidad '
+    'de la demanda."}}'
+)
+
+
+def create_stub_app(
+    latency_ms: float = 200.0,
+    jitter_ms: float = 50.0,
+    token_delay_ms: float = 10.0,
+    error_rate: float = 0.0,
+    throttle_rate: float = 0.0,
+    tokens_per_minute: int = 0,
+    reply: str = DEFAULT_REPLY,
+    embedding_dimensions: int = 1536,
+) -> FastAPI:
+    """
+    Create a FastAPI app that answers like an Azure OpenAI deployment.
+
+    Args:
+        latency_ms (float): Base latency before the first token.
+        jitter_ms (float): Random latency added on top of the base.
+        token_delay_ms (float): Delay between streamed tokens.
+        error_rate (float): Share of calls answered with a 500 error.
+        throttle_rate (float): Share of calls answered with a 429 error.
+        tokens_per_minute (int): Simulated token quota per minute,
+                                 0 for unlimited.
+        reply (str): Text returned by every chat completion.
+        embedding_dimensions (int): Size of the returned embeddings.
+
+    Returns:
+        FastAPI: The stub application.
+    """
+    app = FastAPI()
+    app.state.stats = {"requests": 0, "errors": 0, "throttled": 0}
+    window = {"start": time.monotonic(), "used": 0}
+    seen_prefixes = set()
+    reply_tokens = reply.split(" ")
+
+    def quota_headers(tokens: int) -> dict:
+        now = time.monotonic()
+        if now - window["start"] >= 60:
+            window["start"], window["used"] = now, 0
+        window["used"] += tokens
+        if not tokens_per_minute:
+            return {}
+        return {
+            "x-ratelimit-remaining-tokens": str(
+                max(tokens_per_minute - window["used"], 0)
+            ),
+            "x-ratelimit-remaining-requests": "1000",
+        }
+
+    def failure():
+        app.state.stats["requests"] += 1
+        retry_after = 60 - (time.monotonic() - window["start"])
+        if (
+            random.random() < throttle_rate
+            or (tokens_per_minute and window["used"] >= tokens_per_minute)
+        ):
+            app.state.stats["throttled"] += 1
+            return JSONResponse(
+                status_code=429,
+                content={"error": {"code": "429", "message": "Rate limit"}},
+                headers={"retry-after": str(max(int(retry_after), 1))},
+            )
+        if random.random() < error_rate:
+            app.state.stats["errors"] += 1
+            return JSONResponse(
+                status_code=500,
+                content={"error": {"code": "500", "message": "Stub error"}},
+            )
+        return None
+
+    def cached_tokens(messages: list) -> int:
+        # Like Azure OpenAI, a repeated system prefix is served from the
+        # cache once it reaches 1024 tokens, in increments of 128.
+        if not messages or messages[0].get("role") != "system":
+            return 0
+        prefix = messages[0].get("content", "")
+        prefix_tokens = len(prefix) // 4
+        if prefix not in seen_prefixes:
+            seen_prefixes.add(prefix)
+            return 0
+        if prefix_tokens < 1024:
+            return 0
+        return prefix_tokens // 128 * 128
+
+    async def wait():
+        await asyncio.sleep(
+            (latency_ms + random.uniform(0, jitter_ms)) / 1000
+        )
+
+    @app.post("/openai/deployments/{deployment}/chat/completions")
+    async def chat_completions(deployment: str, request: Request):
+        body = await request.json()
+        await wait()
+        error = failure()
+        if error is not None:
+            return error
+
+        messages = body.get("messages", [])
+        prompt_tokens = len(json.dumps(messages)) // 4
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(reply_tokens),
+            "total_tokens": prompt_tokens + len(reply_tokens),
+            "prompt_tokens_details": {
+                "cached_tokens": cached_tokens(messages)
+            },
+        }
+        headers = quota_headers(usage["total_tokens"])
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+
+        if not body.get("stream"):
+            return JSONResponse(
+                headers=headers,
+                content={
+                    "id": completion_id,
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": deployment,
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": reply},
+                        "finish_reason": "stop",
+                    }],
+                    "usage": usage,
+                },
+            )
+
+        async def events():
+            for index, token in enumerate(reply_tokens):
+                chunk = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": deployment,
+                    "choices": [{
+                        "index": 0,
+                        "delta": {
+                            "content": token if index == 0 else f" {token}"
+                        },
+                        "finish_reason": None,
+                    }],
+                }
+                yield f"data: {json.dumps(chunk)}\n\n"
+                await asyncio.sleep(token_delay_ms / 1000)
+            final = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": deployment,
+                "choices": [{
+                    "index": 0, "delta": {}, "finish_reason": "stop"
+                }],
+                "usage": usage,
+            }
+            yield f"data: {json.dumps(final)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(
+            events(), media_type="text/event-stream", headers=headers
+        )
+
+    @app.post("/openai/deployments/{deployment}/embeddings")
+    async def embeddings(deployment: str, request: Request):
+        body = await request.json()
+        await wait()
+        error = failure()
+        if error is not None:
+            return error
+
+        inputs = body.get("input", [])
+        if not isinstance(inputs, list):
+            inputs = [inputs]
+        data = []
+        for index, text in enumerate(inputs):
+            rng = random.Random(str(text))
+            data.append({
+                "object": "embedding",
+                "index": index,
+                "embedding": [
+                    rng.uniform(-1, 1) for _ in range(embedding_dimensions)
+                ],
+            })
+        tokens = sum(len(str(text)) // 4 for text in inputs)
+        return JSONResponse(
+            headers=quota_headers(tokens),
+            content={
+                "object": "list",
+                "data": data,
+                "model": deployment,
+                "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+            },
+        )
+
+    @app.get("/stats")
+    async def stats():
+        return app.state.stats
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Stub Azure OpenAI server for local tests."
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9001)
+    parser.add_argument("--latency-ms", type=float, default=200.0)
+    parser.add_argument("--jitter-ms", type=float, default=50.0)
+    parser.add_argument("--token-delay-ms", type=float, default=10.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--tokens-per-minute", type=int, default=0)
+    parser.add_argument("--reply", default=DEFAULT_REPLY)
+    args = parser.parse_args()
+
+    app = create_stub_app(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        token_delay_ms=args.token_delay_ms,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        tokens_per_minute=args.tokens_per_minute,
+        reply=args.reply,
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
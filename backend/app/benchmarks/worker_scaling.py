@@ -0,0 +1,178 @@
+"""
+Throughput of the pre-fork serving mode as the number of workers grows.
+
+Starts `backend.app.serve` with 1, 2, 4... workers, drives `/api/chat`
+from several client processes for a fixed time and reports requests per
+second and latency percentiles. The question is served from the
+precomputed-answer store, so the benchmark measures the CPU cost of the
+serving path and runs without any Azure upstream.
+
+Usage:
+    python -m backend.app.benchmarks.worker_scaling --workers 1 2 4 \\
+        --duration 10 --concurrency 64
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import List, Tuple
+
+import httpx
+
+QUESTION = "¿Qué es el stock de seguridad?"
+ANSWER = (
+    "El stock de seguridad es el inventario adicional que protege frente "
+    "a la variabilidad de la demanda y del tiempo de reposición."
+)
+
+
+def seed_answer_store(path: str, kb_version: str):
+    from backend.app.agents.answer_store import AnswerStore, question_key
+
+    AnswerStore(path).put(
+        question_key(QUESTION), QUESTION, ANSWER, kb_version, 1
+    )
+
+
+async def _drive(url: str, concurrency: int, duration: float) -> List[float]:
+    latencies: List[float] = []
+    deadline = time.perf_counter() + duration
+    limits = httpx.Limits(max_connections=concurrency)
+
+    async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+        async def loop():
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                response = await client.post(url, json={"message": QUESTION})
+                if response.status_code == 200:
+                    latencies.append((time.perf_counter() - started) * 1000)
+
+        await asyncio.gather(*(loop() for _ in range(concurrency)))
+    return latencies
+
+
+def _client_process(args: Tuple[str, int, float]) -> List[float]:
+    return asyncio.run(_drive(*args))
+
+
+def _wait_until_up(base_url: str, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{base_url}/api/health").status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError("The server did not start in time")
+
+
+def measure(
+    workers: int,
+    port: int,
+    env: dict,
+    duration: float,
+    concurrency: int,
+    client_processes: int
+) -> dict:
+    """
+    Serve with the given number of workers and measure the throughput.
+
+    Returns:
+        dict: Workers, requests per second and latency percentiles.
+    """
+    server = subprocess.Popen(
+        [
+            sys.executable, "-m", "backend.app.serve",
+            "--workers", str(workers), "--host", "127.0.0.1",
+            "--port", str(port),
+        ],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        _wait_until_up(base_url)
+        per_process = max(concurrency // client_processes, 1)
+        with multiprocessing.Pool(client_processes) as pool:
+            results = pool.map(
+                _client_process,
+                [(f"{base_url}/api/chat", per_process, duration)]
+                * client_processes,
+            )
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+    latencies = sorted(value for result in results for value in result)
+
+    def percentile(q: float) -> float:
+        if not latencies:
+            return float("nan")
+        return latencies[min(int(q * len(latencies)), len(latencies) - 1)]
+
+    return {
+        "workers": workers,
+        "rps": len(latencies) / duration,
+        "p50_ms": percentile(0.50),
+        "p95_ms": percentile(0.95),
+        "p99_ms": percentile(0.99),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure throughput scaling with serving workers."
+    )
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--client-processes", type=int, default=2)
+    args = parser.parse_args()
+
+    state_dir = tempfile.mkdtemp(prefix="worker_scaling_")
+    env = {
+        **os.environ,
+        "KB_STATE_DIR": state_dir,
+        "KB_REGISTRY_BACKEND": "file",
+        "ANSWER_STORE_PATH": os.path.join(state_dir, "answers.db"),
+        "INTERACTION_LOG_PATH": "",
+        "WARMUP_UPSTREAM": "false",
+        "HEALTH_CHECK_INTERVAL_SECONDS": "3600",
+        "KB_REFRESH_INTERVAL_HOURS": "0",
+    }
+    os.environ.update(env)
+    from backend.app.config.settings import get_settings
+
+    seed_answer_store(
+        env["ANSWER_STORE_PATH"],
+        get_settings().AZURE_COGNITIVE_SEARCH_INDEX_NAME,
+    )
+
+    print(f"CPU cores: {os.cpu_count()}")
+    print(f"{'workers':>8} {'req/s':>10} {'speedup':>8} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    baseline = None
+    for workers in args.workers:
+        result = measure(
+            workers, args.port, env, args.duration,
+            args.concurrency, args.client_processes,
+        )
+        baseline = baseline or result["rps"]
+        print(
+            f"{result['workers']:>8} {result['rps']:>10.1f} "
+            f"{result['rps'] / baseline:>7.2f}x "
+            f"{result['p50_ms']:>8.1f} {result['p95_ms']:>8.1f} "
+            f"{result['p99_ms']:>8.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""
+Load test of the WebSocket chat endpoint: opens many concurrent
+connections, asks a series of questions on each one and reports the
+time to the first event, to the first token and to the final answer.
+
+Usage:
+    python -m backend.app.benchmarks.ws_load \\
+        --url ws://localhost:8000/api/ws/chat \\
+        --connections 100 --questions 5 --cancel-rate 0.1
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+
+import websockets
+
+DEFAULT_QUESTIONS = [
+    "¿Qué es el stock de seguridad?",
+    "¿Cómo se calcula el punto de reorden?",
+    "¿Qué diferencia hay entre FIFO y LIFO?",
+    "¿Qué es el lote económico de pedido (EOQ)?",
+]
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(int(q * len(values)), len(values) - 1)], 1)
+
+
+async def run_connection(
+    url: str,
+    questions: List[str],
+    cancel_rate: float,
+    timings: Dict[str, List[float]],
+    outcomes: Counter
+):
+    """
+    Ask the questions in order over a single connection, cancelling a
+    share of them right after the first token.
+    """
+    started = time.perf_counter()
+    async with websockets.connect(url) as websocket:
+        json.loads(await websocket.recv())
+        timings["connect_ms"].append((time.perf_counter() - started) * 1000)
+
+        for question in questions:
+            cancel = random.random() < cancel_rate
+            sent = time.perf_counter()
+            await websocket.send(
+                json.dumps({"type": "message", "message": question})
+            )
+            first_event = first_token = None
+            while True:
+                event = json.loads(await websocket.recv())
+                elapsed = (time.perf_counter() - sent) * 1000
+                if first_event is None:
+                    first_event = elapsed
+                    timings["first_event_ms"].append(elapsed)
+                if event["type"] == "token" and first_token is None:
+                    first_token = elapsed
+                    timings["first_token_ms"].append(elapsed)
+                    if cancel:
+                        await websocket.send(json.dumps({"type": "cancel"}))
+                if event["type"] in ("answer", "cancelled", "error"):
+                    outcomes[event["type"]] += 1
+                    if event["type"] == "answer":
+                        timings["answer_ms"].append(elapsed)
+                    break
+
+
+async def run_load(
+    url: str,
+    connections: int,
+    questions_per_connection: int,
+    cancel_rate: float = 0.0,
+    ramp_seconds: float = 1.0
+) -> dict:
+    """
+    Run the load test and summarize the latencies.
+
+    Args:
+        url (str): WebSocket URL of the chat endpoint.
+        connections (int): Concurrent connections.
+        questions_per_connection (int): Questions asked on each connection.
+        cancel_rate (float): Share of questions cancelled after the
+                             first token.
+        ramp_seconds (float): Time over which the connections are opened.
+
+    Returns:
+        dict: Outcomes and p50/p95/p99 of every timing.
+    """
+    timings: Dict[str, List[float]] = {
+        "connect_ms": [],
+        "first_event_ms": [],
+        "first_token_ms": [],
+        "answer_ms": [],
+    }
+    outcomes: Counter = Counter()
+
+    async def connection(index: int):
+        await asyncio.sleep(ramp_seconds * index / max(connections, 1))
+        questions = [
+            random.choice(DEFAULT_QUESTIONS)
+            for _ in range(questions_per_connection)
+        ]
+        try:
+            await run_connection(
+                url, questions, cancel_rate, timings, outcomes
+            )
+        except Exception as e:
+            outcomes[f"connection_error:{type(e).__name__}"] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(connection(index) for index in range(connections)))
+    duration = time.perf_counter() - started
+
+    return {
+        "connections": connections,
+        "duration_s": round(duration, 2),
+        "answers_per_second": round(outcomes["answer"] / duration, 2),
+        "outcomes": dict(outcomes),
+        "timings": {
+            name: {
+                "p50": percentile(values, 0.50),
+                "p95": percentile(values, 0.95),
+                "p99": percentile(values, 0.99),
+            }
+            for name, values in timings.items()
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Load test of the WebSocket chat endpoint."
+    )
+    parser.add_argument("--url", default="ws://localhost:8000/api/ws/chat")
+    parser.add_argument("--connections", type=int, default=50)
+    parser.add_argument("--questions", type=int, default=3)
+    parser.add_argument("--cancel-rate", type=float, default=0.0)
+    parser.add_argument("--ramp-seconds", type=float, default=1.0)
+    args = parser.parse_args()
+
+    summary = asyncio.run(
+        run_load(
+            args.url,
+            args.connections,
+            args.questions,
+            args.cancel_rate,
+            args.ramp_seconds,
+        )
+    )
+    print(json.dumps(summary, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
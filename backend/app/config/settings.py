@@ -5,14 +5,35 @@ and functionality.
 """
 
 import os
-from typing import List, Optional
+from typing import Dict, List, Literal, Optional
 
 from dotenv import load_dotenv
+from pydantic import BaseModel
 from pydantic_settings import BaseSettings
 
 load_dotenv()
 
 
+class AzureDeployment(BaseModel):
+    """
+    An Azure OpenAI endpoint/deployment pair the model router can use.
+    The API key and version default to the global ones when omitted, and
+    the prices default to the public OpenAI ones for the served model.
+    """
+
+    name: Optional[str] = None
+    endpoint: str
+    deployment: str
+    api_key: Optional[str] = None
+    api_version: Optional[str] = None
+    input_cost_per_1k: Optional[float] = None
+    cached_input_cost_per_1k: Optional[float] = None
+    output_cost_per_1k: Optional[float] = None
+
+
+MODEL_ROLES = ("answer", "supervise", "merge", "condense")
+
+
 class Settings(BaseSettings):
     """
     Application configuration settings.
@@ -21,11 +42,54 @@ class Settings(BaseSettings):
     APP_NAME: str = "Azure AI Chatbot"
     ENVIRONMENT: str = os.getenv("ENVIRONMENT", "development")
     PORT: int = int(os.getenv("PORT", 8000))
+    SERVE_WORKERS: int = int(os.getenv("SERVE_WORKERS", 1))
+    SERVE_WORKER_INDEX: int = int(os.getenv("SERVE_WORKER_INDEX", 0))
+    SERVE_BACKLOG: int = int(os.getenv("SERVE_BACKLOG", 2048))
+
+    LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
+    LOG_FORMAT: str = os.getenv("LOG_FORMAT", "json")
+    LOG_NODE_SAMPLE_RATE: float = float(
+        os.getenv("LOG_NODE_SAMPLE_RATE", 1.0)
+    )
+    LOG_QUEUE_SIZE: int = int(os.getenv("LOG_QUEUE_SIZE", 10000))
+
+    REQUEST_BUDGET_SECONDS: float = float(
+        os.getenv("REQUEST_BUDGET_SECONDS", 25)
+    )
+    BUDGET_RESERVE_SECONDS: float = float(
+        os.getenv("BUDGET_RESERVE_SECONDS", 0.5)
+    )
+    SUPERVISOR_MIN_BUDGET_SECONDS: float = float(
+        os.getenv("SUPERVISOR_MIN_BUDGET_SECONDS", 4)
+    )
+    ENRICHMENT_MIN_BUDGET_SECONDS: float = float(
+        os.getenv("ENRICHMENT_MIN_BUDGET_SECONDS", 6)
+    )
+    ANSWER_CACHE_SIZE: int = int(os.getenv("ANSWER_CACHE_SIZE", 256))
+
+    WARMUP_UPSTREAM: bool = (
+        os.getenv("WARMUP_UPSTREAM", "true").lower() == "true"
+    )
+    WARMUP_TIMEOUT_SECONDS: float = float(
+        os.getenv("WARMUP_TIMEOUT_SECONDS", 30)
+    )
+
+    HEALTH_CHECK_INTERVAL_SECONDS: float = float(
+        os.getenv("HEALTH_CHECK_INTERVAL_SECONDS", 30)
+    )
+    HEALTH_CHECK_TIMEOUT_SECONDS: float = float(
+        os.getenv("HEALTH_CHECK_TIMEOUT_SECONDS", 5)
+    )
+    HEALTH_DEGRADED_LATENCY_MS: float = float(
+        os.getenv("HEALTH_DEGRADED_LATENCY_MS", 2000)
+    )
+    HEALTH_CRITICAL_CHECKS: List[str] = ["search", "chat"]
 
     CORS_ORIGINS: List[str] = [
         "http://localhost:3000",
         "http://localhost:5173",
-        "https://bda-chatbot-frontend-e4ddbvftcmcjbvd3.chilecentral-01.azurewebsites.net",
+        "https://bda-chatbot-frontend-e4ddbvftcmcjbvd3"
+        ".chilecentral-01.azurewebsites.net",
     ]
 
     AZURE_API_KEY: str = os.getenv("AZURE_API_KEY")
@@ -35,6 +99,24 @@ class Settings(BaseSettings):
     AZURE_EMBEDDING_DEPLOYMENT: str = os.getenv("AZURE_EMBEDDING_DEPLOYMENT")
     AZURE_DISPLAY_NAME: Optional[str] = os.getenv("AZURE_DISPLAY_NAME")
 
+    # JSON values, parsed and validated by pydantic-settings, which names
+    # the variable when one is malformed.
+    AZURE_LLM_DEPLOYMENTS: List[AzureDeployment] = []
+    AZURE_LLM_ROLE_DEPLOYMENTS: Dict[str, List[AzureDeployment]] = {}
+    LLM_ROUTER_EWMA_ALPHA: float = float(
+        os.getenv("LLM_ROUTER_EWMA_ALPHA", 0.2)
+    )
+    LLM_ROUTER_EXPLORATION: float = float(
+        os.getenv("LLM_ROUTER_EXPLORATION", 0.05)
+    )
+    LLM_ROUTER_COOLDOWN_SECONDS: float = float(
+        os.getenv("LLM_ROUTER_COOLDOWN_SECONDS", 10)
+    )
+    LLM_MAX_CONNECTIONS: int = int(os.getenv("LLM_MAX_CONNECTIONS", 200))
+    LLM_POOL_TIMEOUT_SECONDS: float = float(
+        os.getenv("LLM_POOL_TIMEOUT_SECONDS", 2)
+    )
+
     AZURE_COGNITIVE_SEARCH_NAME: str = os.getenv("AZURE_COGNITIVE_SEARCH_NAME")
     AZURE_COGNITIVE_SEARCH_API_KEY: str = os.getenv(
         "AZURE_COGNITIVE_SEARCH_API_KEY"
@@ -42,6 +124,75 @@ class Settings(BaseSettings):
     AZURE_COGNITIVE_SEARCH_INDEX_NAME: str = os.getenv(
         "AZURE_COGNITIVE_SEARCH_INDEX_NAME"
     )
+    RETRIEVER_TOP_K: int = int(os.getenv("RETRIEVER_TOP_K", 5))
+    RAG_CONTEXT_MAX_TOKENS: int = int(
+        os.getenv("RAG_CONTEXT_MAX_TOKENS", 3000)
+    )
+    # Checked when the settings load, so a typo fails at startup.
+    RAG_CONDENSE_STRATEGY: Literal["always", "heuristic", "parallel"] = (
+        os.getenv("RAG_CONDENSE_STRATEGY", "heuristic")
+    )
+
+    TOPIC_GATE_ENABLED: bool = (
+        os.getenv("TOPIC_GATE_ENABLED", "true").lower() == "true"
+    )
+    TOPIC_GATE_THRESHOLD: float = float(
+        os.getenv("TOPIC_GATE_THRESHOLD", 0.3)
+    )
+    TOPIC_GATE_CENTROIDS_PATH: str = os.getenv(
+        "TOPIC_GATE_CENTROIDS_PATH", ".kb_state/topic_centroids.json"
+    )
+    TOPIC_GATE_TIMEOUT_SECONDS: float = float(
+        os.getenv("TOPIC_GATE_TIMEOUT_SECONDS", 0.5)
+    )
+
+    BATCH_MAX_QUESTIONS: int = int(os.getenv("BATCH_MAX_QUESTIONS", 200))
+    BATCH_MAX_CONCURRENCY: int = int(os.getenv("BATCH_MAX_CONCURRENCY", 8))
+
+    WS_MAX_CONNECTIONS: int = int(os.getenv("WS_MAX_CONNECTIONS", 500))
+    WS_HISTORY_TURNS: int = int(os.getenv("WS_HISTORY_TURNS", 10))
+
+    KB_STATE_DIR: str = os.getenv("KB_STATE_DIR", ".kb_state")
+    KB_REGISTRY_BACKEND: str = os.getenv("KB_REGISTRY_BACKEND", "blob")
+    KB_REGISTRY_CONTAINER: str = os.getenv(
+        "KB_REGISTRY_CONTAINER", "kb-state"
+    )
+    KB_REGISTRY_POLL_SECONDS: float = float(
+        os.getenv("KB_REGISTRY_POLL_SECONDS", 15)
+    )
+    KB_REFRESH_INTERVAL_HOURS: float = float(
+        os.getenv("KB_REFRESH_INTERVAL_HOURS", 0)
+    )
+    # JSON list, parsed by pydantic-settings like the deployments.
+    KB_SMOKE_QUERIES: List[str] = []
+    KB_MIN_DOCUMENT_RATIO: float = float(
+        os.getenv("KB_MIN_DOCUMENT_RATIO", 0.8)
+    )
+    KB_INDEX_RETENTION: int = int(os.getenv("KB_INDEX_RETENTION", 2))
+    KB_CHUNK_TOKENS: int = int(os.getenv("KB_CHUNK_TOKENS", 256))
+    KB_CHUNK_OVERLAP_TOKENS: int = int(
+        os.getenv("KB_CHUNK_OVERLAP_TOKENS", 48)
+    )
+    KB_TOKENIZER_ENCODING: str = os.getenv(
+        "KB_TOKENIZER_ENCODING", "o200k_base"
+    )
+    KB_INGEST_CONCURRENCY: int = int(os.getenv("KB_INGEST_CONCURRENCY", 4))
+    KB_INGEST_BATCH_SIZE: int = int(os.getenv("KB_INGEST_BATCH_SIZE", 64))
+
+    INTERACTION_LOG_PATH: str = os.getenv(
+        "INTERACTION_LOG_PATH", ".kb_state/interactions.jsonl"
+    )
+    INTERACTION_LOG_MAX_BYTES: int = int(
+        os.getenv("INTERACTION_LOG_MAX_BYTES", 10 * 1024 * 1024)
+    )
+    INTERACTION_LOG_BACKUPS: int = int(
+        os.getenv("INTERACTION_LOG_BACKUPS", 5)
+    )
+    ANSWER_STORE_PATH: str = os.getenv(
+        "ANSWER_STORE_PATH", ".kb_state/answers.db"
+    )
+    ANSWER_STORE_TOP_N: int = int(os.getenv("ANSWER_STORE_TOP_N", 50))
+    ANSWER_STORE_MIN_COUNT: int = int(os.getenv("ANSWER_STORE_MIN_COUNT", 3))
 
     AZURE_STORAGE_ACCOUNT_NAME: str = os.getenv(
         "AZURE_STORAGE_ACCOUNT_NAME"
@@ -73,6 +224,75 @@ class Settings(BaseSettings):
     class Config:
         env_file = ".env"
         case_sensitive = False
+        # An empty variable means the default, as with `os.getenv(...)`.
+        env_ignore_empty = True
+
+    def worker_count(self) -> int:
+        """
+        Number of serving workers: `SERVE_WORKERS`, or one per CPU core
+        when it is 0.
+
+        Returns:
+            int: Worker processes of the instance.
+        """
+        return self.SERVE_WORKERS or os.cpu_count() or 1
+
+    def worker_share(self, total: int) -> int:
+        """
+        Share of an instance-wide limit (connections, concurrent calls)
+        that each serving worker gets.
+
+        Args:
+            total (int): Limit for the whole instance.
+
+        Returns:
+            int: Limit for one worker, at least 1.
+        """
+        return max(1, -(-total // self.worker_count()))
+
+    def get_llm_deployments(
+        self,
+        role: Optional[str] = None
+    ) -> List[AzureDeployment]:
+        """
+        Resolves the pool of chat deployments for a model role. Roles
+        without their own pool in `AZURE_LLM_ROLE_DEPLOYMENTS` use the
+        default pool, which falls back to the single `AZURE_ENDPOINT` /
+        `AZURE_LLM_DEPLOYMENT` pair when no pool is set.
+
+        Args:
+            role (str, optional): One of MODEL_ROLES. None for the
+                                  default pool.
+
+        Returns:
+            List[AzureDeployment]: Deployments with keys and versions filled.
+        """
+        if role is not None and role not in MODEL_ROLES:
+            raise ValueError(f"Unknown model role: {role}")
+        deployments = (
+            self.AZURE_LLM_ROLE_DEPLOYMENTS.get(role)
+            or self.AZURE_LLM_DEPLOYMENTS
+            or [
+                AzureDeployment(
+                    endpoint=self.AZURE_ENDPOINT,
+                    deployment=self.AZURE_LLM_DEPLOYMENT,
+                )
+            ]
+        )
+        return [
+            deployment.model_copy(
+                update={
+                    "name": deployment.name or (
+                        f"{deployment.deployment}@{deployment.endpoint}"
+                    ),
+                    "api_key": deployment.api_key or self.AZURE_API_KEY,
+                    "api_version": (
+                        deployment.api_version or self.AZURE_API_VERSION
+                    ),
+                }
+            )
+            for deployment in deployments
+        ]
 
 
 _settings = None
@@ -152,8 +372,8 @@ def validate_get_settings():
     if missing:
         missing_vars = ", ".join(missing)
         raise RuntimeError(
-            f"⚠️ Missing the following environment variables: {missing_vars}."
-            "Check the configuration before continuing."
+            f"⚠️ Missing the following environment variables: "
+            f"{missing_vars}. Check the configuration before continuing."
         )
 
     print("All the environment variables are set correctly.")
@@ -0,0 +1,285 @@
+"""
+Background health monitor that probes the upstream dependencies with
+cheap calls and caches the results, so the readiness probe can answer
+in constant time without adding load to the upstreams.
+
+Only the first serving worker probes. It shares the results with its
+sibling workers through a file in `KB_STATE_DIR`, so the upstreams see
+one probe per instance whatever the number of workers.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, Optional
+
+from backend.app.config.settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+UP = "up"
+DEGRADED = "degraded"
+DOWN = "down"
+UNKNOWN = "unknown"
+# Error rate EWMA from which a deployment serving traffic counts as down.
+CHAT_FAILING_ERROR_RATE = 0.5
+
+
+class PartialFailure(Exception):
+    """Raised by a probe when only part of a dependency is failing."""
+
+
+async def _check_search():
+    """Count the documents of the knowledge base index."""
+    from backend.app.utils import get_search_client
+
+    count = await asyncio.to_thread(
+        lambda: get_search_client().get_document_count()
+    )
+    if not count:
+        raise PartialFailure("El índice de búsqueda está vacío")
+
+
+async def _check_chat():
+    """
+    Judge every chat deployment by the outcomes the model router recorded
+    for the real traffic. Only the deployments that served no call during
+    the last interval are probed, with a one-token completion sent
+    through the router so the outcome feeds its statistics too.
+    """
+    from backend.app.model_router import get_model_routers
+    from backend.app.utils import get_model
+
+    get_model("answer")
+    interval = get_settings().HEALTH_CHECK_INTERVAL_SECONDS
+    errors, probes, deployments = [], [], 0
+    for router in get_model_routers().values():
+        idle = set(router.idle_deployments(interval))
+        for stats in router.stats():
+            deployments += 1
+            if stats["name"] in idle:
+                probes.append(router.probe(stats["name"]))
+            elif stats["error_ewma"] >= CHAT_FAILING_ERROR_RATE:
+                errors.append(stats["last_error"] or "errores recientes")
+    results = await asyncio.gather(*probes, return_exceptions=True)
+    errors += [result for result in results if isinstance(result, Exception)]
+    if deployments and len(errors) == deployments:
+        error = errors[0]
+        raise error if isinstance(error, Exception) else RuntimeError(error)
+    if errors:
+        raise PartialFailure(
+            f"{len(errors)} de {deployments} despliegues fallan: {errors[0]}"
+        )
+
+
+async def _check_embeddings():
+    """Embed a one-word query."""
+    from backend.app.knowledge_base.embeddings import create_embeddings_client
+
+    await create_embeddings_client().aembed_query("ping")
+
+
+async def _check_log_store():
+    """Run `SELECT 1` against the Turso log database over HTTP."""
+    import httpx
+
+    settings = get_settings()
+    url = settings.TURSO_DATABASE_URL.replace("libsql://", "https://", 1)
+    async with httpx.AsyncClient() as client:
+        response = await client.post(
+            f"{url.rstrip('/')}/v2/pipeline",
+            headers={"Authorization": f"Bearer {settings.TURSO_AUTH_TOKEN}"},
+            json={
+                "requests": [
+                    {"type": "execute", "stmt": {"sql": "SELECT 1"}},
+                    {"type": "close"},
+                ]
+            },
+        )
+        response.raise_for_status()
+
+
+HEALTH_CHECKS: Dict[str, Callable[[], Awaitable[None]]] = {
+    "search": _check_search,
+    "chat": _check_chat,
+    "embeddings": _check_embeddings,
+    "log_store": _check_log_store,
+}
+
+
+class HealthMonitor:
+    """
+    Runs every health check periodically in the background and keeps the
+    last result of each one with its timestamp and latency.
+    """
+
+    def __init__(
+        self,
+        checks: Dict[str, Callable[[], Awaitable[None]]],
+        interval_seconds: float = 30.0,
+        timeout_seconds: float = 5.0,
+        degraded_latency_ms: float = 2000.0,
+        critical_checks: Optional[list] = None,
+        results_path: Optional[str] = None,
+        probe: bool = True
+    ):
+        self.checks = checks
+        self.interval_seconds = interval_seconds
+        self.timeout_seconds = timeout_seconds
+        self.degraded_latency_ms = degraded_latency_ms
+        self.critical_checks = set(critical_checks or checks)
+        self.results_path = results_path
+        self.probe = probe
+        self._results: Dict[str, dict] = {
+            name: {"status": UNKNOWN, "checked_at": None}
+            for name in checks
+        }
+        self._results_mtime: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run_check(self, name: str):
+        started = time.perf_counter()
+        error = None
+        try:
+            await asyncio.wait_for(
+                self.checks[name](), timeout=self.timeout_seconds
+            )
+            status = UP
+        except PartialFailure as e:
+            status, error = DEGRADED, str(e)
+        except asyncio.TimeoutError:
+            status, error = DOWN, f"Timeout tras {self.timeout_seconds} s"
+        except Exception as e:
+            status, error = DOWN, str(e) or type(e).__name__
+        latency_ms = round((time.perf_counter() - started) * 1000, 1)
+        if status == UP and latency_ms > self.degraded_latency_ms:
+            status = DEGRADED
+            error = f"Latencia sobre {self.degraded_latency_ms:.0f} ms"
+        self._results[name] = {
+            "status": status,
+            "latency_ms": latency_ms,
+            "checked_at": datetime.now(timezone.utc).isoformat(),
+            "checked_timestamp": time.time(),
+            "error": error,
+        }
+
+    def _save_results(self):
+        directory = os.path.dirname(self.results_path) or "."
+        os.makedirs(directory, exist_ok=True)
+        descriptor, temporary_path = tempfile.mkstemp(dir=directory)
+        with os.fdopen(descriptor, "w", encoding="utf-8") as file:
+            json.dump(self._results, file)
+        os.replace(temporary_path, self.results_path)
+
+    def _load_results(self):
+        try:
+            mtime = os.stat(self.results_path).st_mtime_ns
+            if mtime == self._results_mtime:
+                return
+            with open(self.results_path, encoding="utf-8") as file:
+                results = json.load(file)
+        except (OSError, ValueError):
+            return
+        self._results.update(
+            (name, result) for name, result in results.items()
+            if name in self.checks
+        )
+        self._results_mtime = mtime
+
+    async def run_once(self):
+        """Run every check concurrently and store the results."""
+        await asyncio.gather(*(self._run_check(name) for name in self.checks))
+        if self.results_path:
+            try:
+                await asyncio.to_thread(self._save_results)
+            except OSError as e:
+                logger.warning(
+                    f"⚠️ No se pudo compartir el estado de salud: {e}"
+                )
+
+    async def _loop(self):
+        while True:
+            await self.run_once()
+            await asyncio.sleep(self.interval_seconds)
+
+    def start(self):
+        if self._task is None and self.probe:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def snapshot(self) -> dict:
+        """
+        Aggregate the cached results without calling any upstream.
+
+        Results older than three intervals are reported as unknown. The
+        overall status is down when a critical check is down or unknown,
+        and degraded when any other check is not up. A worker that
+        doesn't probe serves the results shared by the one that does.
+
+        Returns:
+            dict: Overall "status" and the result of each check.
+        """
+        if not self.probe and self.results_path:
+            self._load_results()
+        now = time.time()
+        checks = {}
+        for name, result in self._results.items():
+            result = dict(result)
+            checked = result.pop("checked_timestamp", None)
+            if checked is not None and (
+                now - checked > 3 * self.interval_seconds
+            ):
+                result["status"] = UNKNOWN
+                result["error"] = "Resultado obsoleto"
+            result["critical"] = name in self.critical_checks
+            checks[name] = result
+
+        statuses = {name: result["status"] for name, result in checks.items()}
+        if any(
+            statuses[name] in (DOWN, UNKNOWN)
+            for name in self.critical_checks if name in statuses
+        ):
+            status = DOWN
+        elif any(value != UP for value in statuses.values()):
+            status = DEGRADED
+        else:
+            status = UP
+        return {"status": status, "checks": checks}
+
+
+_health_monitor = None
+
+
+def get_health_monitor() -> HealthMonitor:
+    """
+    Obtains the global health monitor, creating it from the settings
+    the first time.
+
+    Returns:
+        HealthMonitor: The shared health monitor.
+    """
+    global _health_monitor
+    if _health_monitor is None:
+        settings = get_settings()
+        _health_monitor = HealthMonitor(
+            HEALTH_CHECKS,
+            interval_seconds=settings.HEALTH_CHECK_INTERVAL_SECONDS,
+            timeout_seconds=settings.HEALTH_CHECK_TIMEOUT_SECONDS,
+            degraded_latency_ms=settings.HEALTH_DEGRADED_LATENCY_MS,
+            critical_checks=settings.HEALTH_CRITICAL_CHECKS,
+            results_path=os.path.join(settings.KB_STATE_DIR, "health.json"),
+            probe=settings.SERVE_WORKER_INDEX == 0,
+        )
+    return _health_monitor
@@ -3,9 +3,14 @@ Creates and configures a document loader
 for Azure Blob Storage.
 """
 
+import os
+import tempfile
+from typing import List
+
 from langchain_community.document_loaders import (
     AzureBlobStorageContainerLoader
 )
+from langchain_core.documents import Document
 
 from backend.app.config.settings import get_settings
 
@@ -25,3 +30,59 @@ def create_blob_storage_document_loader() -> AzureBlobStorageContainerLoader:
         conn_str=settings.AZURE_STORAGE_CONN_STRING,
         container=settings.AZURE_STORAGE_ACCOUNT_CONTAINER_NAME,
     )
+
+
+def get_container_client():
+    """
+    Create a client for the knowledge base container.
+
+    Returns:
+        ContainerClient: Azure Blob Storage container client.
+    """
+    from azure.storage.blob import ContainerClient
+
+    settings = get_settings()
+    return ContainerClient.from_connection_string(
+        conn_str=settings.AZURE_STORAGE_CONN_STRING,
+        container_name=settings.AZURE_STORAGE_ACCOUNT_CONTAINER_NAME,
+    )
+
+
+def load_file_elements(file_path: str, source: str) -> List[Document]:
+    """
+    Partition a file into its elements (titles, paragraphs, tables...),
+    keeping the page number of each one.
+
+    Args:
+        file_path (str): Local path of the file.
+        source (str): Name recorded as the "source" of the elements.
+
+    Returns:
+        List[Document]: One document per element, in reading order.
+    """
+    from langchain_community.document_loaders import UnstructuredFileLoader
+
+    elements = UnstructuredFileLoader(file_path, mode="elements").load()
+    for element in elements:
+        element.metadata["source"] = source
+    return elements
+
+
+def load_blob_elements(blob_name: str, container=None) -> List[Document]:
+    """
+    Download a blob of the knowledge base container and partition it
+    into its elements.
+
+    Args:
+        blob_name (str): Name of the blob.
+        container (ContainerClient, optional): Client to download with.
+
+    Returns:
+        List[Document]: One document per element, in reading order.
+    """
+    container = container or get_container_client()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        file_path = os.path.join(temp_dir, os.path.basename(blob_name))
+        with open(file_path, "wb") as file:
+            container.download_blob(blob_name).readinto(file)
+        return load_file_elements(file_path, blob_name)
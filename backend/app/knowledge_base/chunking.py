@@ -0,0 +1,311 @@
+"""
+Token-aware chunking of the knowledge base. Documents are split along
+their page and section boundaries into chunks of about `KB_CHUNK_TOKENS`
+tokens, and every chunk records its token count, page, section and the
+character offsets of its text within the page. The token count is
+stored with the chunk in the index, so the prompt can be packed at
+request time without tokenizing the retrieved context again.
+
+Usage:
+    python -m backend.app.knowledge_base.chunking --path docs/
+    python -m backend.app.knowledge_base.chunking  # the blob container
+"""
+
+import argparse
+import json
+import os
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+from backend.app.config.settings import get_settings
+
+# Repeated on every page, they would only add noise to the chunks.
+SKIPPED_CATEGORIES = {"Header", "Footer", "PageBreak", "PageNumber"}
+SECTION_CATEGORIES = {"Title"}
+ELEMENT_SEPARATOR = "\n\n"
+# Rough characters per token of Spanish prose, used for the chunks that
+# were indexed before the token count was stored.
+CHARS_PER_TOKEN = 4
+HISTOGRAM_EDGES = [32, 64, 128, 256, 512, 1024]
+
+
+@lru_cache(maxsize=None)
+def get_encoding(name: Optional[str] = None):
+    """
+    Load the tiktoken encoding of the chat models.
+
+    Args:
+        name (str, optional): Encoding name. Defaults to
+                              `KB_TOKENIZER_ENCODING`.
+
+    Returns:
+        tiktoken.Encoding: The cached encoding.
+    """
+    import tiktoken
+
+    return tiktoken.get_encoding(
+        name or get_settings().KB_TOKENIZER_ENCODING
+    )
+
+
+def count_tokens(text: str) -> int:
+    return len(get_encoding().encode(text, disallowed_special=()))
+
+
+def chunk_token_count(document: Document) -> int:
+    """
+    Token count of an indexed chunk, read from its metadata. Search
+    results keep the chunk metadata as a JSON string, which is parsed
+    here; chunks indexed without a count get an estimate.
+
+    Args:
+        document (Document): Retrieved chunk.
+
+    Returns:
+        int: Number of tokens of the chunk.
+    """
+    metadata = document.metadata
+    count = metadata.get("token_count")
+    if count is None and isinstance(metadata.get("metadata"), str):
+        try:
+            count = json.loads(metadata["metadata"]).get("token_count")
+        except ValueError:
+            pass
+    if count is None:
+        count = len(document.page_content) // CHARS_PER_TOKEN + 1
+    return int(count)
+
+
+def split_sections(elements: List[Document]) -> List[Document]:
+    """
+    Group consecutive elements of the same page and section into the
+    passages that are chunked, so no chunk crosses a page or a section.
+    Each passage records the offset of its text within the page text,
+    which is the page elements joined by blank lines.
+
+    Args:
+        elements (List[Document]): Document elements in reading order,
+                                   with their "category" and
+                                   "page_number" when known.
+
+    Returns:
+        List[Document]: Passages with their "source", "page", "section"
+                        and "start_offset".
+    """
+    passages: List[Document] = []
+    current: Optional[Document] = None
+    page_ends: Dict[Tuple[str, int], int] = {}
+    sections: Dict[str, Optional[str]] = {}
+
+    for element in elements:
+        text = element.page_content.strip()
+        category = element.metadata.get("category")
+        if not text or category in SKIPPED_CATEGORIES:
+            continue
+        source = element.metadata.get("source")
+        page = element.metadata.get("page_number") or 1
+        is_title = category in SECTION_CATEGORIES
+        if is_title:
+            sections[source] = text
+
+        page_end = page_ends.get((source, page))
+        start = 0 if page_end is None else page_end + len(ELEMENT_SEPARATOR)
+        page_ends[(source, page)] = start + len(text)
+
+        if (
+            current is not None
+            and not is_title
+            and current.metadata["source"] == source
+            and current.metadata["page"] == page
+        ):
+            current.page_content += ELEMENT_SEPARATOR + text
+            continue
+        current = Document(
+            page_content=text,
+            metadata={
+                "source": source,
+                "page": page,
+                "section": sections.get(source),
+                "start_offset": start,
+            },
+        )
+        passages.append(current)
+    return passages
+
+
+def chunk_documents(
+    elements: List[Document],
+    chunk_tokens: Optional[int] = None,
+    overlap_tokens: Optional[int] = None
+) -> List[Document]:
+    """
+    Split documents into chunks measured in tokens, preferring paragraph,
+    line and sentence breaks, without crossing page or section
+    boundaries.
+
+    Args:
+        elements (List[Document]): Document elements in reading order.
+        chunk_tokens (int, optional): Maximum tokens of a chunk. Defaults
+                                      to `KB_CHUNK_TOKENS`.
+        overlap_tokens (int, optional): Tokens shared by consecutive
+                                        chunks. Defaults to
+                                        `KB_CHUNK_OVERLAP_TOKENS`.
+
+    Returns:
+        List[Document]: Chunks with their "source", "page", "section",
+                        "start_offset", "end_offset" and "token_count".
+    """
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    settings = get_settings()
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_tokens or settings.KB_CHUNK_TOKENS,
+        chunk_overlap=(
+            settings.KB_CHUNK_OVERLAP_TOKENS
+            if overlap_tokens is None else overlap_tokens
+        ),
+        length_function=count_tokens,
+        separators=["\n\n", "\n", ". ", " ", ""],
+        keep_separator="end",
+    )
+
+    chunks = []
+    for passage in split_sections(elements):
+        content = passage.page_content
+        first, last = 0, 0
+        for text in splitter.split_text(content):
+            # Chunks come in order with no gaps: each one starts after
+            # the start of the previous one and no later than its end,
+            # past the whitespace stripped between them.
+            while last < len(content) and content[last].isspace():
+                last += 1
+            index = content.rfind(text, first, last + len(text))
+            if index < 0:
+                index = first
+            first, last = index + 1, index + len(text)
+            start = passage.metadata["start_offset"] + index
+            chunks.append(
+                Document(
+                    page_content=text,
+                    metadata={
+                        **passage.metadata,
+                        "start_offset": start,
+                        "end_offset": start + len(text),
+                        "token_count": count_tokens(text),
+                    },
+                )
+            )
+    return chunks
+
+
+def corpus_stats(chunks: List[Document]) -> dict:
+    """
+    Summarize the size of the chunks of a corpus.
+
+    Args:
+        chunks (List[Document]): Chunks of the knowledge base.
+
+    Returns:
+        dict: Chunk, source, page and token counts, percentiles of the
+              chunk size in tokens and a histogram of the sizes.
+    """
+    counts = sorted(chunk_token_count(chunk) for chunk in chunks)
+
+    def percentile(q: float) -> Optional[int]:
+        if not counts:
+            return None
+        return counts[min(int(q * len(counts)), len(counts) - 1)]
+
+    histogram = {}
+    lower = 0
+    for edge in HISTOGRAM_EDGES + [None]:
+        label = f"{lower}-{edge - 1}" if edge else f"{lower}+"
+        histogram[label] = sum(
+            lower <= count and (edge is None or count < edge)
+            for count in counts
+        )
+        lower = edge
+    return {
+        "chunks": len(chunks),
+        "sources": len({chunk.metadata.get("source") for chunk in chunks}),
+        "pages": len({
+            (chunk.metadata.get("source"), chunk.metadata.get("page"))
+            for chunk in chunks
+        }),
+        "total_tokens": sum(counts),
+        "tokens": {
+            "min": percentile(0.0),
+            "mean": round(sum(counts) / len(counts), 1) if counts else None,
+            "p50": percentile(0.50),
+            "p90": percentile(0.90),
+            "p99": percentile(0.99),
+            "max": counts[-1] if counts else None,
+        },
+        "histogram": histogram,
+    }
+
+
+def print_corpus_stats(stats: dict):
+    tokens = stats["tokens"]
+    print(
+        f"📊 {stats['chunks']} fragmentos de {stats['sources']} documentos "
+        f"({stats['pages']} páginas, {stats['total_tokens']} tokens)"
+    )
+    print(
+        f"   Tokens por fragmento: min {tokens['min']}, "
+        f"media {tokens['mean']}, p50 {tokens['p50']}, "
+        f"p90 {tokens['p90']}, p99 {tokens['p99']}, max {tokens['max']}"
+    )
+    largest = max(stats["histogram"].values(), default=0) or 1
+    for label, count in stats["histogram"].items():
+        bar = "█" * round(40 * count / largest)
+        print(f"   {label:>10} tokens {count:>7} {bar}")
+
+
+def _local_elements(path: str) -> List[Document]:
+    from backend.app.knowledge_base.blob_storage import load_file_elements
+
+    if os.path.isfile(path):
+        return load_file_elements(path, os.path.basename(path))
+    elements = []
+    for root, _, files in os.walk(path):
+        for name in sorted(files):
+            file_path = os.path.join(root, name)
+            elements.extend(
+                load_file_elements(file_path, os.path.relpath(file_path, path))
+            )
+    return elements
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Chunk the knowledge base and report the corpus stats."
+    )
+    parser.add_argument("--path", default=None,
+                        help="Local file or folder instead of the container.")
+    parser.add_argument("--chunk-tokens", type=int, default=None)
+    parser.add_argument("--overlap-tokens", type=int, default=None)
+    parser.add_argument("--json", action="store_true",
+                        help="Print the stats as JSON.")
+    args = parser.parse_args()
+
+    if args.path:
+        elements = _local_elements(args.path)
+    else:
+        from backend.app.knowledge_base.update_knowledge_base import (
+            load_documents
+        )
+
+        elements = load_documents()
+    chunks = chunk_documents(elements, args.chunk_tokens, args.overlap_tokens)
+    stats = corpus_stats(chunks)
+    if args.json:
+        print(json.dumps(stats, indent=2, ensure_ascii=False))
+    else:
+        print_corpus_stats(stats)
+
+
+if __name__ == "__main__":
+    main()
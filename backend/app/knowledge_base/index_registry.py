@@ -0,0 +1,500 @@
+"""
+Registry of the knowledge base index versions. It records which Azure AI
+Search index is live, so a refresh can build a new index next to it and
+switch (or roll back) atomically, without touching the serving one.
+
+The registry is shared by every worker of every instance, so by default
+it is kept in a Blob Storage container (`KB_REGISTRY_CONTAINER`) that
+survives redeploys. A local file in `KB_STATE_DIR` can be used instead
+for development (`KB_REGISTRY_BACKEND=file`).
+"""
+
+import copy
+import json
+import logging
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Callable, Iterator, List, Optional, Tuple
+
+from backend.app.config.settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+REGISTRY_NAME = "index_registry.json"
+# Blob leases last between 15 and 60 seconds and are renewed while held.
+LEASE_SECONDS = 60
+UPDATE_ATTEMPTS = 5
+
+
+class RegistryConflictError(Exception):
+    """The registry state was modified since it was read."""
+
+
+class FileRegistryStore:
+    """
+    Keeps the registry state in a local JSON file, replaced atomically on
+    every change. Only the workers of a single instance can share it.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def version(self) -> Optional[str]:
+        try:
+            return str(os.stat(self.path).st_mtime_ns)
+        except FileNotFoundError:
+            return None
+
+    def read(self) -> Tuple[dict, str]:
+        with open(self.path, encoding="utf-8") as file:
+            state = json.load(file)
+        return state, self.version()
+
+    def write(self, state: dict, version: Optional[str]) -> str:
+        if self.version() != version:
+            raise RegistryConflictError(self.path)
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, exist_ok=True)
+        descriptor, temporary_path = tempfile.mkstemp(dir=directory)
+        with os.fdopen(descriptor, "w", encoding="utf-8") as file:
+            json.dump(state, file, indent=2)
+        os.replace(temporary_path, self.path)
+        return self.version()
+
+    @contextmanager
+    def exclusive(self, name: str) -> Iterator[bool]:
+        """Hold a lock file next to the registry, without waiting."""
+        import fcntl
+
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, f"{name}.lock"), "w") as file:
+            try:
+                fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(file, fcntl.LOCK_UN)
+
+
+class BlobRegistryStore:
+    """
+    Keeps the registry state in a blob shared by every instance. Writes
+    are conditional on the ETag that was read, so two instances can't
+    overwrite each other's changes.
+    """
+
+    def __init__(self, conn_str: str, container_name: str, blob_name: str):
+        self.conn_str = conn_str
+        self.container_name = container_name
+        self.blob_name = blob_name
+        self._client = None
+        self._pid: Optional[int] = None
+
+    def _container(self):
+        # Clients are not shared across a fork, each worker opens its own.
+        if self._client is None or self._pid != os.getpid():
+            from azure.storage.blob import ContainerClient
+
+            self._client = ContainerClient.from_connection_string(
+                conn_str=self.conn_str, container_name=self.container_name
+            )
+            self._pid = os.getpid()
+        return self._client
+
+    def version(self) -> Optional[str]:
+        from azure.core.exceptions import ResourceNotFoundError
+
+        blob = self._container().get_blob_client(self.blob_name)
+        try:
+            return blob.get_blob_properties().etag
+        except ResourceNotFoundError:
+            return None
+
+    def read(self) -> Tuple[dict, str]:
+        downloader = self._container().download_blob(self.blob_name)
+        state = json.loads(downloader.readall())
+        return state, downloader.properties.etag
+
+    def write(self, state: dict, version: Optional[str]) -> str:
+        from azure.core import MatchConditions
+        from azure.core.exceptions import (
+            ResourceExistsError,
+            ResourceModifiedError
+        )
+
+        container = self._container()
+        data = json.dumps(state, indent=2)
+        try:
+            if version is None:
+                try:
+                    container.create_container()
+                except ResourceExistsError:
+                    pass
+                result = container.upload_blob(
+                    self.blob_name, data, overwrite=False
+                )
+            else:
+                result = container.upload_blob(
+                    self.blob_name,
+                    data,
+                    overwrite=True,
+                    etag=version,
+                    match_condition=MatchConditions.IfNotModified,
+                )
+        except (ResourceExistsError, ResourceModifiedError) as e:
+            raise RegistryConflictError(self.blob_name) from e
+        return result["etag"]
+
+    @contextmanager
+    def exclusive(self, name: str) -> Iterator[bool]:
+        """
+        Hold a lease on a lock blob, without waiting. The lease is
+        renewed in the background and expires on its own if the holder
+        dies, so a crashed instance can't block the others.
+        """
+        from azure.core.exceptions import (
+            HttpResponseError,
+            ResourceExistsError
+        )
+
+        blob = self._container().get_blob_client(f"{name}.lock")
+        try:
+            blob.upload_blob(b"", overwrite=False)
+        except ResourceExistsError:
+            pass
+        try:
+            lease = blob.acquire_lease(lease_duration=LEASE_SECONDS)
+        except HttpResponseError as e:
+            if e.status_code != 409:
+                raise
+            yield False
+            return
+
+        stop = threading.Event()
+
+        def renew():
+            while not stop.wait(LEASE_SECONDS / 3):
+                try:
+                    lease.renew()
+                except Exception as e:
+                    logger.warning(
+                        f"⚠️ No se pudo renovar el bloqueo {name}: {e}"
+                    )
+                    return
+
+        renewer = threading.Thread(target=renew, daemon=True)
+        renewer.start()
+        try:
+            yield True
+        finally:
+            stop.set()
+            renewer.join()
+            try:
+                lease.release()
+            except Exception as e:
+                logger.warning(
+                    f"⚠️ No se pudo liberar el bloqueo {name}: {e}"
+                )
+
+
+class IndexRegistry:
+    """
+    Keeps the index versions in a registry store. Once started, a
+    background thread checks the store every `poll_seconds` and reloads
+    the state when another process (a scheduler, a sibling worker or
+    another instance) modified it, so reading the active index never
+    waits on the store. Every change is a conditional write retried on
+    conflict.
+    """
+
+    def __init__(
+        self,
+        store,
+        base_index_name: str,
+        poll_seconds: float = 0.0
+    ):
+        self.store = store
+        self.base_index_name = base_index_name
+        self.poll_seconds = poll_seconds
+        self._lock = threading.RLock()
+        self._version: Optional[str] = None
+        self._loaded = False
+        self._state = self._default_state()
+        self._listeners: List[Callable[[str], None]] = []
+        self._poller: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def subscribe(self, listener: Callable[[str], None]):
+        """
+        Register a callback run with the new index name whenever the
+        active index changes, in this process or in another one.
+
+        Args:
+            listener (Callable[[str], None]): Callback to run.
+        """
+        self._listeners.append(listener)
+
+    def _notify(self, previous: str):
+        active = self._state["active"]
+        if active == previous:
+            return
+        for listener in self._listeners:
+            try:
+                listener(active)
+            except Exception as e:
+                logger.warning(
+                    f"⚠️ Error al notificar el cambio de índice: {e}"
+                )
+
+    def _default_state(self) -> dict:
+        return {
+            "active": self.base_index_name,
+            "versions": [
+                {
+                    "index_name": self.base_index_name,
+                    "version": "base",
+                    "activated_at": None,
+                }
+            ],
+        }
+
+    def _reload(self, force: bool = False):
+        with self._lock:
+            try:
+                version = self.store.version()
+                if version is not None and version != self._version:
+                    state, version = self.store.read()
+                    previous = self._state["active"]
+                    self._state = state
+                    self._version = version
+                    self._notify(previous)
+            except Exception as e:
+                if force:
+                    raise
+                # Keep serving the last known index while the store is
+                # down.
+                logger.warning(
+                    f"⚠️ No se pudo leer el registro de índices: {e}"
+                )
+            self._loaded = True
+
+    def _poll(self):
+        while not self._stop.wait(self.poll_seconds):
+            self._reload()
+
+    def start(self):
+        """
+        Load the registry and keep it fresh from a background thread.
+        Blocks on the store, so async callers run it in a thread.
+        """
+        self._reload()
+        if self.poll_seconds > 0 and (
+            self._poller is None or not self._poller.is_alive()
+        ):
+            self._stop.clear()
+            self._poller = threading.Thread(
+                target=self._poll, name="index-registry", daemon=True
+            )
+            self._poller.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _current(self) -> dict:
+        # Processes that never started the registry, like the CLIs, load
+        # it on first use. The state is replaced as a whole, so reading
+        # it needs no lock.
+        if not self._loaded:
+            self._reload()
+        return self._state
+
+    def _update(self, change: Callable[[dict], dict]) -> dict:
+        """
+        Apply a change to the latest state and write it back, starting
+        over if another process wrote the registry in between.
+        """
+        with self._lock:
+            for _ in range(UPDATE_ATTEMPTS):
+                self._reload(force=True)
+                state = copy.deepcopy(self._state)
+                result = change(state)
+                try:
+                    version = self.store.write(state, self._version)
+                except RegistryConflictError:
+                    continue
+                previous = self._state["active"]
+                self._state = state
+                self._version = version
+                self._notify(previous)
+                return result
+            raise RuntimeError(
+                "The index registry keeps changing, try again later"
+            )
+
+    def active(self) -> str:
+        """
+        Name of the index that serves the retrieval.
+
+        Returns:
+            str: Active index name.
+        """
+        return self._current()["active"]
+
+    def active_version(self) -> dict:
+        """
+        Entry of the active index version.
+
+        Returns:
+            dict: Index name, version id, activation time and metadata.
+        """
+        state = self._current()
+        return next(
+            version for version in state["versions"]
+            if version["index_name"] == state["active"]
+        )
+
+    def versions(self) -> List[dict]:
+        return [dict(version) for version in self._current()["versions"]]
+
+    def activate(self, index_name: str, version: str, **metadata) -> dict:
+        """
+        Make an index the live one, keeping the previous versions
+        available for rollback. The previous active version is marked
+        with the time it was retired.
+
+        Args:
+            index_name (str): Index to activate.
+            version (str): Version identifier of the index.
+            **metadata: Extra information stored with the version.
+
+        Returns:
+            dict: The activated version entry.
+        """
+        now = datetime.now(timezone.utc).isoformat()
+        entry = {
+            "index_name": index_name,
+            "version": version,
+            "activated_at": now,
+            **metadata,
+        }
+
+        def change(state: dict) -> dict:
+            for existing in state["versions"]:
+                if existing["index_name"] == state["active"]:
+                    existing["retired_at"] = now
+            state["versions"] = [
+                existing for existing in state["versions"]
+                if existing["index_name"] != index_name
+            ] + [entry]
+            state["active"] = index_name
+            return entry
+
+        return self._update(change)
+
+    def rollback(self) -> dict:
+        """
+        Switch back to the version activated before the current one.
+        The current one stays in the registry, marked as rolled back, so
+        the processes that still serve it can switch over before it is
+        deleted; it is never a rollback target again.
+
+        Raises:
+            RuntimeError: If there is no previous version.
+
+        Returns:
+            dict: The version entry that is now active.
+        """
+        now = datetime.now(timezone.utc).isoformat()
+
+        def change(state: dict) -> dict:
+            candidates = [
+                version for version in state["versions"]
+                if version["index_name"] != state["active"]
+                and not version.get("rolled_back_at")
+            ]
+            if not candidates:
+                raise RuntimeError(
+                    "No previous knowledge base version to roll back to"
+                )
+            for version in state["versions"]:
+                if version["index_name"] == state["active"]:
+                    version.update(rolled_back_at=now, retired_at=now)
+            restored = candidates[-1]
+            restored.pop("retired_at", None)
+            state["active"] = restored["index_name"]
+            return dict(restored)
+
+        return self._update(change)
+
+    def forget(self, index_name: str):
+        """Remove a retired index from the registry."""
+        def change(state: dict) -> None:
+            if index_name == state["active"]:
+                raise RuntimeError("The active index can't be removed")
+            state["versions"] = [
+                version for version in state["versions"]
+                if version["index_name"] != index_name
+            ]
+
+        self._update(change)
+
+    def exclusive(self, name: str):
+        """
+        Hold a lock shared with every process that uses the registry,
+        without waiting for it.
+
+        Args:
+            name (str): Name of the lock.
+
+        Returns:
+            ContextManager[bool]: Yields whether the lock was acquired.
+        """
+        return self.store.exclusive(name)
+
+
+_index_registry = None
+
+
+def get_index_registry() -> IndexRegistry:
+    """
+    Obtains the global index registry.
+
+    Returns:
+        IndexRegistry: The shared index registry.
+    """
+    global _index_registry
+    if _index_registry is None:
+        settings = get_settings()
+        if settings.KB_REGISTRY_BACKEND == "file":
+            store = FileRegistryStore(
+                os.path.join(settings.KB_STATE_DIR, REGISTRY_NAME)
+            )
+        else:
+            store = BlobRegistryStore(
+                settings.AZURE_STORAGE_CONN_STRING,
+                settings.KB_REGISTRY_CONTAINER,
+                REGISTRY_NAME,
+            )
+        _index_registry = IndexRegistry(
+            store,
+            settings.AZURE_COGNITIVE_SEARCH_INDEX_NAME,
+            settings.KB_REGISTRY_POLL_SECONDS,
+        )
+    return _index_registry
+
+
+def get_active_index_name() -> str:
+    """
+    Name of the Azure AI Search index currently serving the retrieval.
+
+    Returns:
+        str: Active index name.
+    """
+    return get_index_registry().active()
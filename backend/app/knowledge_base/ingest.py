@@ -0,0 +1,530 @@
+"""
+Resumable ingestion of the Blob Storage container into an Azure AI
+Search index. Each blob is partitioned, chunked and uploaded in batches
+of embedded chunks with deterministic keys, and a checkpoint file
+records the blobs and batches already uploaded. A run that stops
+halfway (network error, throttling) resumes where it left off, and a
+rerun only uploads the blobs that were added or changed, removing the
+chunks of the deleted ones.
+
+The checkpoint is the only record of what the index holds, so a run
+without one refuses to touch an index that already has documents (for
+example one built by `update_knowledge_base` or a refresh, whose keys
+are random). Ingest into a new index instead, or pass `--sweep` to
+delete every document that doesn't belong to the checkpoint.
+
+Usage:
+    python -m backend.app.knowledge_base.ingest --dry-run
+    python -m backend.app.knowledge_base.ingest --concurrency 4 \\
+        --batch-size 64
+    python -m backend.app.knowledge_base.ingest --index kb-v2 --sweep
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional, Set
+
+from backend.app.config.settings import get_settings
+from backend.app.knowledge_base.index_registry import get_active_index_name
+
+PLAN_ACTIONS = ("new", "changed", "resumed", "unchanged", "removed")
+DELETE_BATCH_SIZE = 1000
+
+
+class IngestionError(Exception):
+    """Raised when the target index can't be ingested into safely."""
+
+
+class Checkpoint:
+    """
+    Record of the ingestion of the container into one index: the ETag,
+    chunk count and uploaded chunks of every blob. The file is replaced
+    atomically on every change, so a crash never leaves it half written.
+    """
+
+    def __init__(self, path: str, index_name: str):
+        self.path = path
+        self.state = {"index_name": index_name, "blobs": {}}
+        self.exists = os.path.exists(path)
+        if self.exists:
+            with open(path, encoding="utf-8") as file:
+                self.state = json.load(file)
+
+    @property
+    def blobs(self) -> Dict[str, dict]:
+        return self.state["blobs"]
+
+    def save(self):
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, exist_ok=True)
+        descriptor, temporary_path = tempfile.mkstemp(dir=directory)
+        with os.fdopen(descriptor, "w", encoding="utf-8") as file:
+            json.dump(self.state, file, indent=2)
+        os.replace(temporary_path, self.path)
+        self.exists = True
+
+    def reset(self):
+        """
+        Mark every blob as changed, so it is uploaded again and the
+        chunks its previous version had beyond the new count are still
+        deleted.
+        """
+        for entry in self.blobs.values():
+            entry["etag"] = None
+
+    def keys(self) -> Set[str]:
+        """Keys of every chunk the index holds according to the record."""
+        return {
+            chunk_key(name, number)
+            for name, entry in self.blobs.items()
+            for number in range(max(entry["chunks"] or 0, entry["uploaded"]))
+        }
+
+
+class Progress:
+    """Throughput and ETA of the pending bytes, printed periodically."""
+
+    def __init__(self, total_bytes: float, total_blobs: int,
+                 interval: float = 2.0):
+        self.total_bytes = total_bytes
+        self.total_blobs = total_blobs
+        self.interval = interval
+        self.bytes = 0.0
+        self.blobs = 0
+        self.chunks = 0
+        self.started = time.monotonic()
+        self._printed = 0.0
+
+    def advance(self, bytes: float = 0.0, blobs: int = 0, chunks: int = 0):
+        self.bytes += bytes
+        self.blobs += blobs
+        self.chunks += chunks
+        if time.monotonic() - self._printed >= self.interval or blobs:
+            self.report()
+
+    def report(self):
+        self._printed = time.monotonic()
+        elapsed = max(self._printed - self.started, 1e-6)
+        share = self.bytes / self.total_bytes if self.total_bytes else 1.0
+        byte_rate = self.bytes / elapsed
+        remaining = self.total_bytes - self.bytes
+        eta = remaining / byte_rate if byte_rate else None
+        eta_text = (
+            time.strftime("%H:%M:%S", time.gmtime(eta))
+            if eta is not None else "--:--:--"
+        )
+        print(
+            f"⏳ {self.blobs}/{self.total_blobs} documentos "
+            f"({share:.1%}) · {self.chunks} fragmentos "
+            f"({self.chunks / elapsed:.1f}/s, "
+            f"{byte_rate / 1e6:.2f} MB/s) · ETA {eta_text}"
+        )
+
+
+def checkpoint_path(index_name: str) -> str:
+    return os.path.join(
+        get_settings().KB_STATE_DIR, f"ingest-{index_name}.json"
+    )
+
+
+def chunking_signature() -> dict:
+    """Chunking settings the uploaded chunks of a blob were built with."""
+    settings = get_settings()
+    return {
+        "chunk_tokens": settings.KB_CHUNK_TOKENS,
+        "overlap_tokens": settings.KB_CHUNK_OVERLAP_TOKENS,
+        "encoding": settings.KB_TOKENIZER_ENCODING,
+    }
+
+
+def chunk_key(blob_name: str, number: int) -> str:
+    """
+    Index key of a chunk. It only depends on the blob and the position
+    of the chunk, so uploading a blob again replaces its chunks instead
+    of adding duplicates.
+    """
+    digest = hashlib.sha1(blob_name.encode("utf-8")).hexdigest()
+    return f"{digest}-{number}"
+
+
+def index_document_count(index_name: str) -> int:
+    """Documents in an index, 0 if it doesn't exist yet."""
+    from azure.core.exceptions import ResourceNotFoundError
+
+    from backend.app.utils import get_search_client
+
+    try:
+        return get_search_client(index_name).get_document_count()
+    except ResourceNotFoundError:
+        return 0
+
+
+def index_keys(index_name: str) -> Iterator[str]:
+    """Keys of every document of an index."""
+    from langchain_community.vectorstores.azuresearch import FIELDS_ID
+
+    from backend.app.utils import get_search_client
+
+    results = get_search_client(index_name).search(
+        search_text="*", select=[FIELDS_ID]
+    )
+    for result in results:
+        yield result[FIELDS_ID]
+
+
+def list_blobs() -> List[dict]:
+    """
+    List the blobs of the knowledge base container.
+
+    Returns:
+        List[dict]: "name", "etag" and "size" of every blob.
+    """
+    from backend.app.knowledge_base.blob_storage import get_container_client
+
+    return [
+        {"name": blob.name, "etag": blob.etag, "size": blob.size}
+        for blob in get_container_client().list_blobs()
+    ]
+
+
+def plan_ingestion(blobs: List[dict], checkpoint: Checkpoint) -> dict:
+    """
+    Compare the container with the checkpoint.
+
+    Args:
+        blobs (List[dict]): Blobs of the container.
+        checkpoint (Checkpoint): Ingestion checkpoint of the index.
+
+    Returns:
+        dict: Blobs that are "new", "changed" (other ETag or chunking
+              settings), "resumed" (partially uploaded), "unchanged",
+              and names of the "removed" blobs.
+    """
+    plan = {action: [] for action in PLAN_ACTIONS}
+    signature = chunking_signature()
+    for blob in blobs:
+        entry = checkpoint.blobs.get(blob["name"])
+        if entry is None:
+            plan["new"].append(blob)
+        elif (
+            entry["etag"] != blob["etag"]
+            or entry.get("chunking") != signature
+        ):
+            plan["changed"].append(blob)
+        elif entry["chunks"] is None or entry["uploaded"] < entry["chunks"]:
+            plan["resumed"].append(blob)
+        else:
+            plan["unchanged"].append(blob)
+    names = {blob["name"] for blob in blobs}
+    plan["removed"] = [name for name in checkpoint.blobs if name not in names]
+    return plan
+
+
+def print_plan(plan: dict, index_name: str, verbose: bool = False):
+    print(
+        f"🔎 Índice {index_name}: {len(plan['new'])} nuevos, "
+        f"{len(plan['changed'])} modificados, "
+        f"{len(plan['resumed'])} por reanudar, "
+        f"{len(plan['unchanged'])} sin cambios, "
+        f"{len(plan['removed'])} eliminados."
+    )
+    if not verbose:
+        return
+    for action in ("new", "changed", "resumed"):
+        for blob in plan[action]:
+            print(f"   {action:>8}  {blob['name']} "
+                  f"({blob['size'] / 1e6:.2f} MB)")
+    for name in plan["removed"]:
+        print(f"   {'removed':>8}  {name}")
+
+
+def _pending_share(blob: dict, checkpoint: Checkpoint) -> float:
+    """Share of a blob still to upload, 1 unless it is resumed."""
+    entry = checkpoint.blobs.get(blob["name"])
+    if (
+        entry is None
+        or entry["etag"] != blob["etag"]
+        or entry.get("chunking") != chunking_signature()
+        or not entry["chunks"]
+    ):
+        return 1.0
+    return 1 - entry["uploaded"] / entry["chunks"]
+
+
+async def _with_retries(call, retries: int, description: str):
+    for attempt in range(retries + 1):
+        try:
+            return await call()
+        except Exception as e:
+            if attempt == retries:
+                raise
+            delay = 2 ** attempt
+            print(f"⚠️ {description} falló ({e}), "
+                  f"reintentando en {delay} s...")
+            await asyncio.sleep(delay)
+
+
+async def ingest(
+    index_name: Optional[str] = None,
+    concurrency: Optional[int] = None,
+    batch_size: Optional[int] = None,
+    retries: int = 3,
+    dry_run: bool = False,
+    reset: bool = False,
+    verbose: bool = False,
+    sweep: bool = False
+) -> dict:
+    """
+    Bring an index in line with the container, resuming from the
+    checkpoint of the previous run.
+
+    Args:
+        index_name (str, optional): Index to ingest into. Defaults to the
+                                    active knowledge base index.
+        concurrency (int, optional): Blobs processed at the same time.
+                                     Defaults to `KB_INGEST_CONCURRENCY`.
+        batch_size (int, optional): Chunks embedded and uploaded per
+                                    request. Defaults to
+                                    `KB_INGEST_BATCH_SIZE`.
+        retries (int): Retries of a failed batch before giving up on its
+                       blob.
+        dry_run (bool): Only report what would change.
+        reset (bool): Upload every blob again, still deleting the chunks
+                      of the previous versions.
+        verbose (bool): List every blob that would change.
+        sweep (bool): Once every blob is ingested, delete the documents
+                      of the index that aren't chunks of the checkpoint.
+
+    Raises:
+        IngestionError: If the index has documents but no checkpoint and
+                        `sweep` is not set.
+
+    Returns:
+        dict: The plan counts, the "uploaded" chunks, the "failed"
+              blobs and the "swept" documents.
+    """
+    from backend.app.knowledge_base.blob_storage import (
+        get_container_client,
+        load_blob_elements
+    )
+    from backend.app.knowledge_base.chunking import chunk_documents
+    from backend.app.knowledge_base.embeddings import create_embeddings_client
+    from backend.app.knowledge_base.vector_store import create_vector_store
+
+    settings = get_settings()
+    index_name = index_name or get_active_index_name()
+    concurrency = concurrency or settings.KB_INGEST_CONCURRENCY
+    batch_size = batch_size or settings.KB_INGEST_BATCH_SIZE
+
+    checkpoint = Checkpoint(checkpoint_path(index_name), index_name)
+    if not checkpoint.exists and not sweep:
+        existing = await asyncio.to_thread(index_document_count, index_name)
+        if existing:
+            raise IngestionError(
+                f"El índice {index_name} tiene {existing} documentos y no "
+                f"hay un punto de control de ingesta. Usa un índice nuevo "
+                f"(--index) o --sweep para eliminar los documentos ajenos."
+            )
+    if reset:
+        checkpoint.reset()
+    blobs = await asyncio.to_thread(list_blobs)
+    plan = plan_ingestion(blobs, checkpoint)
+    print_plan(plan, index_name, verbose or dry_run)
+    summary = {action: len(plan[action]) for action in PLAN_ACTIONS}
+    summary.update(uploaded=0, failed=[], swept=0)
+    if dry_run:
+        return summary
+
+    embeddings_client = create_embeddings_client()
+    vector_store = create_vector_store(
+        embeddings_client.embed_query, index_name
+    )
+    container = get_container_client()
+    semaphore = asyncio.Semaphore(concurrency)
+    pending = plan["new"] + plan["changed"] + plan["resumed"]
+    progress = Progress(
+        sum(blob["size"] * _pending_share(blob, checkpoint)
+            for blob in pending),
+        len(pending),
+    )
+
+    async def delete_chunks(blob_name: str, first: int, last: int):
+        keys = [chunk_key(blob_name, number) for number in range(first, last)]
+        if keys:
+            await _with_retries(
+                lambda: asyncio.to_thread(vector_store.delete, keys),
+                retries,
+                f"El borrado de {blob_name}",
+            )
+
+    async def upload_batch(blob_name: str, start: int, batch: list):
+        texts = [chunk.page_content for chunk in batch]
+        vectors = await embeddings_client.aembed_documents(texts)
+        await asyncio.to_thread(
+            vector_store.add_embeddings,
+            list(zip(texts, vectors)),
+            [chunk.metadata for chunk in batch],
+            keys=[
+                chunk_key(blob_name, start + number)
+                for number in range(len(batch))
+            ],
+        )
+
+    async def process(blob: dict):
+        name = blob["name"]
+        async with semaphore:
+            entry = checkpoint.blobs.get(name)
+            signature = chunking_signature()
+            if (
+                entry is None
+                or entry["etag"] != blob["etag"]
+                or entry.get("chunking") != signature
+            ):
+                # Chunks of the previous version beyond the new chunk
+                # count are deleted once the new version is uploaded.
+                stale = 0
+                if entry is not None:
+                    stale = max(entry["chunks"] or 0, entry.get("stale", 0))
+                entry = {
+                    "etag": blob["etag"],
+                    "size": blob["size"],
+                    "chunking": signature,
+                    "chunks": None,
+                    "uploaded": 0,
+                    "stale": stale,
+                }
+                checkpoint.blobs[name] = entry
+                checkpoint.save()
+
+            elements = await _with_retries(
+                lambda: asyncio.to_thread(
+                    load_blob_elements, name, container
+                ),
+                retries,
+                f"La descarga de {name}",
+            )
+            chunks = await asyncio.to_thread(chunk_documents, elements)
+            entry["chunks"] = len(chunks)
+            checkpoint.save()
+
+            for start in range(entry["uploaded"], len(chunks), batch_size):
+                batch = chunks[start:start + batch_size]
+                await _with_retries(
+                    lambda: upload_batch(name, start, batch),
+                    retries,
+                    f"El lote {start // batch_size + 1} de {name}",
+                )
+                entry["uploaded"] = start + len(batch)
+                checkpoint.save()
+                summary["uploaded"] += len(batch)
+                progress.advance(
+                    bytes=blob["size"] * len(batch) / len(chunks),
+                    chunks=len(batch),
+                )
+
+            await delete_chunks(name, len(chunks), entry.get("stale", 0))
+            entry.pop("stale", None)
+            entry["completed_at"] = datetime.now(timezone.utc).isoformat()
+            checkpoint.save()
+            progress.advance(
+                bytes=0 if chunks else blob["size"], blobs=1
+            )
+
+    async def guarded(blob: dict):
+        try:
+            await process(blob)
+        except Exception as e:
+            print(f"❌ No se pudo ingerir {blob['name']}: {e}")
+            summary["failed"].append(blob["name"])
+
+    for name in plan["removed"]:
+        entry = checkpoint.blobs[name]
+        await delete_chunks(
+            name, 0, max(entry["chunks"] or 0, entry.get("stale", 0))
+        )
+        del checkpoint.blobs[name]
+        checkpoint.save()
+
+    await asyncio.gather(*(guarded(blob) for blob in pending))
+    if pending:
+        progress.report()
+    if summary["failed"]:
+        print(f"⚠️ {len(summary['failed'])} documentos fallaron. "
+              "Vuelve a ejecutar la ingesta para reanudarla.")
+        return summary
+
+    if sweep:
+        expected = checkpoint.keys()
+        unknown = [
+            key for key in await asyncio.to_thread(
+                lambda: list(index_keys(index_name))
+            )
+            if key not in expected
+        ]
+        for start in range(0, len(unknown), DELETE_BATCH_SIZE):
+            keys = unknown[start:start + DELETE_BATCH_SIZE]
+            await _with_retries(
+                lambda: asyncio.to_thread(vector_store.delete, keys),
+                retries,
+                "El borrado de los documentos ajenos",
+            )
+        summary["swept"] = len(unknown)
+        print(f"🧹 {len(unknown)} documentos ajenos eliminados.")
+    print(f"✅ Ingesta completa en el índice {index_name}.")
+    return summary
+
+
+def main():
+    settings = get_settings()
+    parser = argparse.ArgumentParser(
+        description="Ingest the Blob Storage container into the index, "
+                    "resuming from the last checkpoint."
+    )
+    parser.add_argument("--index", default=None,
+                        help="Index to ingest into (default: active one).")
+    parser.add_argument("--concurrency", type=int,
+                        default=settings.KB_INGEST_CONCURRENCY,
+                        help="Blobs processed at the same time.")
+    parser.add_argument("--batch-size", type=int,
+                        default=settings.KB_INGEST_BATCH_SIZE,
+                        help="Chunks embedded and uploaded per request.")
+    parser.add_argument("--retries", type=int, default=3)
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Only show what would change.")
+    parser.add_argument("--reset", action="store_true",
+                        help="Upload every blob again.")
+    parser.add_argument("--verbose", action="store_true",
+                        help="List every blob that changes.")
+    parser.add_argument("--sweep", action="store_true",
+                        help="Delete the documents that aren't chunks "
+                             "of the checkpoint.")
+    args = parser.parse_args()
+
+    try:
+        summary = asyncio.run(
+            ingest(
+                args.index,
+                args.concurrency,
+                args.batch_size,
+                args.retries,
+                args.dry_run,
+                args.reset,
+                args.verbose,
+                args.sweep,
+            )
+        )
+    except IngestionError as e:
+        print(f"❌ {e}")
+        raise SystemExit(1)
+    if summary["failed"]:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,411 @@
+"""
+Background refresh of the knowledge base. Every refresh builds a new
+(shadow) Azure AI Search index next to the live one, validates it with
+smoke queries, and only then switches the retrieval to it through the
+index registry. The previous index is kept for rollback.
+
+Usage:
+    python -m backend.app.knowledge_base.refresh --once [--force]
+    python -m backend.app.knowledge_base.refresh --rollback
+"""
+
+import argparse
+import asyncio
+import hashlib
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from backend.app.config.settings import get_settings
+from backend.app.knowledge_base.index_registry import get_index_registry
+
+logger = logging.getLogger(__name__)
+
+
+class ValidationError(Exception):
+    """Raised when a shadow index doesn't pass the validation."""
+
+
+def _search_endpoint() -> str:
+    settings = get_settings()
+    return f"https://{settings.AZURE_COGNITIVE_SEARCH_NAME}.search.windows.net"
+
+
+def _index_client():
+    from azure.core.credentials import AzureKeyCredential
+    from azure.search.documents.indexes import SearchIndexClient
+
+    settings = get_settings()
+    return SearchIndexClient(
+        endpoint=_search_endpoint(),
+        credential=AzureKeyCredential(
+            settings.AZURE_COGNITIVE_SEARCH_API_KEY
+        ),
+    )
+
+
+def blob_fingerprint() -> str:
+    """
+    Fingerprint of the Blob Storage container, built from the name and
+    ETag of every blob, to skip the rebuild when nothing changed.
+
+    Returns:
+        str: SHA-256 hex digest of the container listing.
+    """
+    from backend.app.knowledge_base.blob_storage import get_container_client
+
+    container = get_container_client()
+    digest = hashlib.sha256()
+    for blob in sorted(container.list_blobs(), key=lambda blob: blob.name):
+        digest.update(f"{blob.name}\0{blob.etag}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _document_count(index_name: str) -> int:
+    from backend.app.utils import get_search_client
+
+    return get_search_client(index_name).get_document_count()
+
+
+def validate_index(
+    index_name: str,
+    expected_documents: int,
+    previous_documents: Optional[int] = None,
+    wait_seconds: float = 60.0
+) -> int:
+    """
+    Check that a shadow index is ready to serve: it holds every uploaded
+    segment, it didn't shrink below `KB_MIN_DOCUMENT_RATIO` of the live
+    index, and each of `KB_SMOKE_QUERIES` returns at least one result.
+
+    Args:
+        index_name (str): Index to validate.
+        expected_documents (int): Number of segments uploaded.
+        previous_documents (int, optional): Size of the live index.
+        wait_seconds (float): Time allowed for the indexing to catch up.
+
+    Raises:
+        ValidationError: If any check fails.
+
+    Returns:
+        int: Number of documents in the index.
+    """
+    from backend.app.utils import get_search_client
+
+    settings = get_settings()
+    deadline = time.monotonic() + wait_seconds
+    count = _document_count(index_name)
+    while count < expected_documents and time.monotonic() < deadline:
+        time.sleep(2)
+        count = _document_count(index_name)
+
+    if count < expected_documents:
+        raise ValidationError(
+            f"El índice {index_name} tiene {count} documentos, "
+            f"se esperaban {expected_documents}"
+        )
+    if previous_documents and (
+        count < settings.KB_MIN_DOCUMENT_RATIO * previous_documents
+    ):
+        raise ValidationError(
+            f"El índice {index_name} tiene {count} documentos, menos del "
+            f"{settings.KB_MIN_DOCUMENT_RATIO:.0%} de los "
+            f"{previous_documents} actuales"
+        )
+
+    search_client = get_search_client(index_name)
+    for query in settings.KB_SMOKE_QUERIES:
+        if not list(search_client.search(search_text=query, top=1)):
+            raise ValidationError(
+                f"La consulta de prueba '{query}' no devolvió resultados"
+            )
+    return count
+
+
+def _delete_index(index_name: str):
+    if index_name == get_settings().AZURE_COGNITIVE_SEARCH_INDEX_NAME:
+        # The base index is the fallback of every fresh registry.
+        logger.warning(f"⚠️ El índice base {index_name} no se elimina.")
+        return
+    try:
+        _index_client().delete_index(index_name)
+    except Exception as e:
+        logger.warning(
+            f"⚠️ No se pudo eliminar el índice {index_name}: {e}"
+        )
+
+
+def retire_grace_seconds() -> float:
+    """
+    Time a retired index is kept before it is deleted: two polls of the
+    registry, so every process has switched away from it, plus the
+    budget of the requests that were already querying it.
+    """
+    settings = get_settings()
+    return (
+        2 * settings.KB_REGISTRY_POLL_SECONDS
+        + settings.REQUEST_BUDGET_SECONDS
+    )
+
+
+def _retired_before(version: dict, cutoff: datetime) -> bool:
+    retired_at = version.get("retired_at")
+    return retired_at is None or datetime.fromisoformat(retired_at) < cutoff
+
+
+def prune_indexes(grace_seconds: Optional[float] = None):
+    """
+    Delete the rolled back indexes and those older than the last
+    `KB_INDEX_RETENTION` versions (the active one included), and drop
+    them from the registry. An index is only deleted once it has been
+    retired for the grace period, since other workers and instances keep
+    serving it until their next poll of the registry. The base index
+    (`AZURE_COGNITIVE_SEARCH_INDEX_NAME`) is never deleted.
+
+    Args:
+        grace_seconds (float, optional): Defaults to
+                                         `retire_grace_seconds()`.
+    """
+    settings = get_settings()
+    registry = get_index_registry()
+    if grace_seconds is None:
+        grace_seconds = retire_grace_seconds()
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=grace_seconds)
+    active = registry.active()
+    retired = [
+        version for version in registry.versions()
+        if version["index_name"] not in (active, registry.base_index_name)
+    ]
+    restorable = [
+        version for version in retired if not version.get("rolled_back_at")
+    ]
+    keep = max(settings.KB_INDEX_RETENTION - 1, 0)
+    expired = [
+        version for version in retired if version.get("rolled_back_at")
+    ] + restorable[:len(restorable) - keep]
+    for version in expired:
+        if not _retired_before(version, cutoff):
+            continue
+        registry.forget(version["index_name"])
+        _delete_index(version["index_name"])
+        logger.info(f"🗑️ Índice retirado: {version['index_name']}")
+
+
+def refresh_knowledge_base(force: bool = False) -> dict:
+    """
+    Build the knowledge base into a new index, validate it and make it
+    the active one. The live index keeps serving during the whole build,
+    and a shadow index that fails the validation is deleted. Only one
+    process of all the instances refreshes at a time, the others skip.
+
+    Args:
+        force (bool): Rebuild even if the container didn't change.
+
+    Returns:
+        dict: Outcome of the refresh ("status" plus details).
+    """
+    with get_index_registry().exclusive("refresh") as acquired:
+        if not acquired:
+            logger.info(
+                "⏭️ Otra instancia está actualizando la base de "
+                "conocimiento."
+            )
+            return {"status": "in_progress_elsewhere"}
+        return _refresh_knowledge_base(force)
+
+
+def _refresh_knowledge_base(force: bool) -> dict:
+    from backend.app.knowledge_base.chunking import corpus_stats
+    from backend.app.knowledge_base.embeddings import create_embeddings_client
+    from backend.app.knowledge_base.update_knowledge_base import (
+        load_documents,
+        split_documents
+    )
+    from backend.app.knowledge_base.vector_store import create_vector_store
+
+    settings = get_settings()
+    registry = get_index_registry()
+    # Delete the indexes retired by earlier runs or rollbacks whose
+    # grace period has passed.
+    prune_indexes()
+    current = registry.active_version()
+
+    fingerprint = blob_fingerprint()
+    if not force and current.get("fingerprint") == fingerprint:
+        logger.info(
+            "✅ La base de conocimiento no cambió, no se reconstruye."
+        )
+        return {"status": "unchanged", "index_name": current["index_name"]}
+
+    documents = load_documents()
+    if not documents:
+        logger.error("❌ No se encontraron documentos en Blob Storage.")
+        return {"status": "no_documents", "index_name": current["index_name"]}
+    segments = split_documents(documents)
+
+    version = datetime.now(timezone.utc).strftime("%Y%m%d%H%M%S")
+    index_name = f"{settings.AZURE_COGNITIVE_SEARCH_INDEX_NAME}-{version}"
+    logger.info(
+        f"⚙️ Construyendo el índice {index_name} "
+        f"({len(segments)} segmentos)..."
+    )
+
+    try:
+        vector_store = create_vector_store(
+            create_embeddings_client().embed_query, index_name
+        )
+        vector_store.add_documents(documents=segments)
+        try:
+            previous_documents = _document_count(current["index_name"])
+        except Exception:
+            previous_documents = None
+        document_count = validate_index(
+            index_name, len(segments), previous_documents
+        )
+    except Exception as e:
+        logger.error(
+            f"❌ El índice {index_name} no pasó la validación: {e}"
+        )
+        _delete_index(index_name)
+        return {"status": "failed", "index_name": index_name, "error": str(e)}
+
+    registry.activate(
+        index_name,
+        version,
+        fingerprint=fingerprint,
+        document_count=document_count,
+        chunks=corpus_stats(segments),
+    )
+    logger.info(
+        f"✅ Índice activo: {index_name} ({document_count} documentos)"
+    )
+    prune_indexes()
+    return {
+        "status": "activated",
+        "index_name": index_name,
+        "version": version,
+        "document_count": document_count,
+    }
+
+
+def rollback_knowledge_base() -> dict:
+    """
+    Switch the retrieval back to the previous index version. The one
+    that was active is deleted by a later refresh, once the other
+    processes have stopped serving it.
+
+    Returns:
+        dict: The version entry that is now active.
+    """
+    restored = get_index_registry().rollback()
+    logger.info(f"↩️ Índice activo restaurado: {restored['index_name']}")
+    return restored
+
+
+class KnowledgeBaseRefresher:
+    """
+    Runs the knowledge base refresh periodically in the background. The
+    blocking build runs in a worker thread so serving is not affected.
+    """
+
+    def __init__(self, interval_hours: float):
+        self.interval_hours = interval_hours
+        self.running = False
+        self.last_run: Optional[dict] = None
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    async def run_once(self, force: bool = False) -> dict:
+        """Run one refresh unless another one is in progress."""
+        if self._lock.locked():
+            return {"status": "in_progress"}
+        async with self._lock:
+            self.running = True
+            started = datetime.now(timezone.utc).isoformat()
+            try:
+                result = await asyncio.to_thread(refresh_knowledge_base, force)
+            except Exception as e:
+                logger.error(
+                    f"❌ Error al actualizar la base de conocimiento: {e}"
+                )
+                result = {"status": "failed", "error": str(e)}
+            finally:
+                self.running = False
+            self.last_run = {"started_at": started, **result}
+            return result
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.interval_hours * 3600)
+            await self.run_once()
+
+    def start(self):
+        if self._task is None and self.interval_hours > 0:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def status(self) -> dict:
+        registry = get_index_registry()
+        return {
+            "active": registry.active_version(),
+            "versions": registry.versions(),
+            "refresh_interval_hours": self.interval_hours,
+            "running": self.running,
+            "last_run": self.last_run,
+        }
+
+
+_knowledge_base_refresher = None
+
+
+def get_knowledge_base_refresher() -> KnowledgeBaseRefresher:
+    """
+    Obtains the global knowledge base refresher.
+
+    Returns:
+        KnowledgeBaseRefresher: The shared refresher.
+    """
+    global _knowledge_base_refresher
+    if _knowledge_base_refresher is None:
+        settings = get_settings()
+        # The background refresh runs in the first serving worker only.
+        _knowledge_base_refresher = KnowledgeBaseRefresher(
+            settings.KB_REFRESH_INTERVAL_HOURS
+            if settings.SERVE_WORKER_INDEX == 0 else 0
+        )
+    return _knowledge_base_refresher
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Refresh or roll back the knowledge base index."
+    )
+    action = parser.add_mutually_exclusive_group(required=True)
+    action.add_argument("--once", action="store_true",
+                        help="Build, validate and activate a new index.")
+    action.add_argument("--rollback", action="store_true",
+                        help="Reactivate the previous index version.")
+    parser.add_argument("--force", action="store_true",
+                        help="Rebuild even if the documents didn't change.")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    if args.rollback:
+        rollback_knowledge_base()
+        return
+    result = refresh_knowledge_base(force=args.force)
+    if result["status"] == "failed":
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,26 +3,74 @@ Knowledge Base update module, responsible for updateing
 the knowledge base by loading documents from Blob Storage.
 """
 
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+from typing import List, Optional
+
+from langchain_core.documents import Document
 
 from backend.app.knowledge_base.blob_storage import (
-    create_blob_storage_document_loader
+    get_container_client,
+    load_blob_elements
+)
+from backend.app.knowledge_base.chunking import (
+    chunk_documents,
+    corpus_stats,
+    print_corpus_stats
 )
 from backend.app.knowledge_base.embeddings import create_embeddings_client
 from backend.app.knowledge_base.vector_store import create_vector_store
 
 
-def update_knowledge_base(force_update: bool = False):
+def load_documents() -> List[Document]:
+    """
+    Load every document of the Azure Blob Storage container, partitioned
+    into its elements (titles, paragraphs, tables...) with their page.
+
+    Returns:
+        List[Document]: Elements of every document, in reading order.
+    """
+    container = get_container_client()
+    documents = []
+    for blob in container.list_blobs():
+        documents.extend(load_blob_elements(blob.name, container))
+    return documents
+
+
+def split_documents(documents: List[Document]) -> List[Document]:
+    """
+    Split documents into the segments stored in the index: chunks of
+    about `KB_CHUNK_TOKENS` tokens that don't cross page or section
+    boundaries, with their token count, page and offsets as metadata.
+
+    Args:
+        documents (List[Document]): Document elements to split.
+
+    Returns:
+        List[Document]: Document segments.
+    """
+    return chunk_documents(documents)
+
+
+def update_knowledge_base(
+    force_update: bool = False,
+    index_name: Optional[str] = None
+):
     """
     Update the knowledge base by loading documents from Azure Blob Storage,
     splitting them into segments, and uploading them to Azure AI Search.
 
+    This writes into an index in place. To refresh the live knowledge base
+    without serving a half-updated index, use
+    `backend.app.knowledge_base.refresh.refresh_knowledge_base`.
+
     Args:
         forced_update (bool): If True, forces the update of knowledge base.
+        index_name (str, optional): Index to update. Defaults to the active
+                                    knowledge base index.
     """
     embeddings_client = create_embeddings_client()
-    vector_store = create_vector_store(embeddings_client.embed_query)
-    loader = create_blob_storage_document_loader()
+    vector_store = create_vector_store(
+        embeddings_client.embed_query, index_name
+    )
 
     try:
         existing_documents = vector_store.similarity_search("test", k=1)
@@ -36,7 +84,7 @@ def update_knowledge_base(force_update: bool = False):
         pass
 
     print("⚠️ Processing documents to update the knowledge base...")
-    documents: list = loader.load()
+    documents: list = load_documents()
 
     if not documents:
         print(
@@ -45,11 +93,8 @@ def update_knowledge_base(force_update: bool = False):
         )
         return
 
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=500,
-        chunk_overlap=100
-    )
-    splitted_documents = text_splitter.split_documents(documents=documents)
+    splitted_documents = split_documents(documents)
+    print_corpus_stats(corpus_stats(splitted_documents))
 
     vector_store.add_documents(documents=splitted_documents)
     print("✅ Knowledge base updated successfully.")
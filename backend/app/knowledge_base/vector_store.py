@@ -3,14 +3,18 @@ Create and configure a vector store
 using Azure AI Search.
 """
 
-from typing import Callable
+from typing import Callable, Optional
 
 from langchain_community.vectorstores import AzureSearch
 
 from backend.app.config.settings import get_settings
+from backend.app.knowledge_base.index_registry import get_active_index_name
 
 
-def create_vector_store(embedding_function: Callable) -> AzureSearch:
+def create_vector_store(
+    embedding_function: Callable,
+    index_name: Optional[str] = None
+) -> AzureSearch:
     """
     Create and configure a vector store using AI Search to create the index
     that will store the knowledge base.
@@ -18,6 +22,8 @@ def create_vector_store(embedding_function: Callable) -> AzureSearch:
     Args:
         embedding_function (Callable): The embbedings function used to
                                        vectorize the text.
+        index_name (str, optional): Index to write to. Defaults to the
+                                    active knowledge base index.
 
     Returns:
         AzureSearch: Vector store instance.
@@ -30,6 +36,6 @@ def create_vector_store(embedding_function: Callable) -> AzureSearch:
     return AzureSearch(
         azure_search_endpoint=vector_store_address,
         azure_search_key=settings.AZURE_COGNITIVE_SEARCH_API_KEY,
-        index_name=settings.AZURE_COGNITIVE_SEARCH_INDEX_NAME,
+        index_name=index_name or get_active_index_name(),
         embedding_function=embedding_function,
     )
@@ -3,38 +3,86 @@ FastAPI main application file for AI Chatbot
 Configures the FastAPI app, middleware, and routes
 """
 
+import asyncio
+import logging
 from contextlib import asynccontextmanager
 from datetime import datetime
 
-import uvicorn
 from azure.core.exceptions import AzureError
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 
+from backend.app.agents.answer_store import (
+    get_answer_store,
+    get_answer_store_sync
+)
+from backend.app.agents.budget import answer_cache, degradation_metrics
+from backend.app.agents.rag_memory import condensation_metrics
+from backend.app.agents.topic_gate import get_topic_gate
 from backend.app.config.settings import get_settings, validate_get_settings
+from backend.app.health import DEGRADED, DOWN, get_health_monitor
+from backend.app.knowledge_base.index_registry import get_index_registry
+from backend.app.knowledge_base.refresh import get_knowledge_base_refresher
+from backend.app.model_router import get_model_routers, get_role_metrics
 from backend.app.routers.chatbot_router import router
+from backend.app.routers.ws_router import router as ws_router
+from backend.app.structured_logging import (
+    RequestContextMiddleware,
+    logging_stats,
+    setup_logging,
+    shutdown_logging
+)
+from backend.app.warmup import warm_up
 
 settings = get_settings()
+logger = logging.getLogger(__name__)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """
     Application lifespan management
-    Handles startup and shutdown events
+    Handles startup and shutdown events. The warm-up and the health
+    monitor run in the background and feed the readiness probe, and the
+    knowledge base refresh runs on its own schedule
     """
     # Startup
-    print(" Starting AI Chatbot Backend...")
+    setup_logging()
+    logger.info("Starting AI Chatbot Backend...")
     try:
         validate_get_settings()
     except RuntimeError as e:
-        print(f"Configuration error while initializing: {e}")
+        logger.error(f"Configuration error while initializing: {e}")
+        shutdown_logging()
         raise
 
+    # The registry is read on every request from memory; loading it and
+    # polling the shared store happen off the event loop.
+    index_registry = get_index_registry()
+    index_registry.subscribe(lambda index_name: answer_cache.clear())
+    await asyncio.to_thread(index_registry.start)
+    answer_store_sync = get_answer_store_sync()
+    if answer_store_sync is not None:
+        answer_store_sync.start()
+
+    app.state.warmup = {"ready": False, "steps": {}}
+    warmup_task = asyncio.create_task(warm_up(app.state))
+    health_monitor = get_health_monitor()
+    health_monitor.start()
+    knowledge_base_refresher = get_knowledge_base_refresher()
+    knowledge_base_refresher.start()
+
     yield
 
-    print(" Shutting down AI Chatbot Backend...")
+    logger.info("Shutting down AI Chatbot Backend...")
+    warmup_task.cancel()
+    await health_monitor.stop()
+    await knowledge_base_refresher.stop()
+    index_registry.stop()
+    if answer_store_sync is not None:
+        answer_store_sync.stop()
+    shutdown_logging()
 
 
 app = FastAPI(
@@ -54,7 +102,10 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.add_middleware(RequestContextMiddleware)
+
 app.include_router(router, prefix="/api", tags=["chatbot"])
+app.include_router(ws_router, prefix="/api", tags=["chatbot"])
 
 
 @app.get("/")
@@ -98,6 +149,90 @@ async def health_check():
         )
 
 
+@app.get("/api/health/ready")
+async def readiness_check(request: Request):
+    """
+    Readiness check endpoint
+    Serves the cached results of the background health monitor in
+    constant time. Returns 503 until the warm-up has finished or while a
+    critical dependency (search index, chat deployments) is down or a
+    required warm-up step failed, and 200 with a "degraded" status when a
+    non-critical check or warm-up step is failing
+    """
+    warmup = getattr(
+        request.app.state, "warmup", {"ready": False, "steps": {}}
+    )
+    health = get_health_monitor().snapshot()
+
+    if warmup.get("failed"):
+        status = "warmup_failed"
+    elif not warmup["ready"]:
+        status = "warming_up"
+    elif health["status"] == DOWN:
+        status = "unavailable"
+    elif health["status"] == DEGRADED or warmup.get("degraded"):
+        status = "degraded"
+    else:
+        status = "ready"
+
+    content = {
+        "status": status,
+        "checks": health["checks"],
+        "warmup": warmup,
+        "timestamp": datetime.utcnow().isoformat(),
+    }
+    return JSONResponse(
+        status_code=200 if status in ("ready", "degraded") else 503,
+        content=content,
+    )
+
+
+@app.get("/api/models/stats")
+async def model_stats():
+    """
+    Model router statistics endpoint
+    Returns the live latency, error rate and quota of each deployment,
+    and the latency, tokens and cost spent by each model role
+    """
+    return {
+        "deployments": {
+            pool: router.stats()
+            for pool, router in get_model_routers().items()
+        },
+        "roles": get_role_metrics(),
+    }
+
+
+@app.get("/api/graph/stats")
+async def graph_stats():
+    """
+    Graph statistics endpoint
+    Returns how many requests ran out of latency budget, which
+    degradation paths they took, how follow-up questions were condensed,
+    how many questions were served from precomputed answers and how
+    many were refused as off topic
+    """
+    return {
+        "request_budget_seconds": settings.REQUEST_BUDGET_SECONDS,
+        "degradations": degradation_metrics.as_dict(),
+        "condensation_strategy": settings.RAG_CONDENSE_STRATEGY,
+        "condensation": dict(condensation_metrics),
+        "answer_store": get_answer_store().stats(),
+        "topic_gate": get_topic_gate().stats(),
+        "logging": logging_stats(),
+    }
+
+
+@app.get("/api/knowledge-base/status")
+async def knowledge_base_status():
+    """
+    Knowledge base status endpoint
+    Returns the active index version, the versions kept for rollback
+    and the outcome of the last background refresh
+    """
+    return get_knowledge_base_refresher().status()
+
+
 @app.exception_handler(Exception)
 async def global_exception_handler(request, exc):
     """
@@ -132,6 +267,8 @@ async def global_exception_handler(request, exc):
 
 
 if __name__ == "__main__":
+    import uvicorn
+
     try:
         validate_get_settings()
     except RuntimeError as e:
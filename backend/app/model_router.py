@@ -0,0 +1,772 @@
+"""
+Latency-aware router that spreads chat completions across several
+Azure OpenAI deployments, failing over on throttling and server errors.
+"""
+
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    AsyncIterator,
+    Dict,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional
+)
+
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForLLMRun,
+    CallbackManagerForLLMRun
+)
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+from pydantic import ConfigDict
+
+from backend.app.config.settings import (
+    MODEL_ROLES,
+    AzureDeployment,
+    get_settings
+)
+
+if TYPE_CHECKING:
+    from langchain_openai import AzureChatOpenAI
+
+
+def _failover_errors() -> tuple:
+    """
+    Errors that move the call to the next deployment: throttling, server
+    errors and connection failures. Imported lazily to keep startup fast.
+    """
+    import openai
+
+    return (
+        openai.RateLimitError,
+        openai.InternalServerError,
+        openai.APIConnectionError,
+    )
+
+
+def _http_clients(max_connections: Optional[int]) -> dict:
+    """
+    HTTP clients with a bounded connection pool for one deployment. The
+    pool also caps the calls in flight, so each serving worker only uses
+    its share of the deployment's capacity. Waiting for a free connection
+    is bounded by the request budget: a saturated pool fails with a
+    timeout, which fails over like any connection error.
+    """
+    if not max_connections:
+        return {}
+    import httpx
+
+    settings = get_settings()
+    limits = httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=max_connections,
+    )
+    timeout = httpx.Timeout(
+        600.0,
+        connect=5.0,
+        pool=min(
+            settings.LLM_POOL_TIMEOUT_SECONDS,
+            settings.REQUEST_BUDGET_SECONDS,
+        ),
+    )
+    return {
+        "http_client": httpx.Client(limits=limits, timeout=timeout),
+        "http_async_client": httpx.AsyncClient(
+            limits=limits, timeout=timeout
+        ),
+    }
+
+
+class DeploymentStats:
+    """
+    Live statistics of a deployment: latency and error EWMAs, remaining
+    quota reported by Azure and the cooldown after throttling.
+    """
+
+    def __init__(self, deployment: AzureDeployment):
+        self.deployment = deployment
+        self.latency_ewma: Optional[float] = None
+        self.error_ewma: float = 0.0
+        self.remaining_requests: Optional[int] = None
+        self.remaining_tokens: Optional[int] = None
+        self.max_remaining_tokens: Optional[int] = None
+        self.cooldown_until: float = 0.0
+        self.requests: int = 0
+        self.failures: int = 0
+        self.throttled: int = 0
+        self.in_flight: int = 0
+        self.last_outcome_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    def quota_fraction(self) -> float:
+        """
+        Fraction of the token quota still available in the current window,
+        relative to the highest value seen. 1.0 when unknown.
+        """
+        if self.remaining_requests == 0:
+            return 0.0
+        if not self.remaining_tokens or not self.max_remaining_tokens:
+            return 1.0 if self.remaining_tokens is None else 0.0
+        return self.remaining_tokens / self.max_remaining_tokens
+
+    def as_dict(self) -> dict:
+        return {
+            "name": self.deployment.name,
+            "endpoint": self.deployment.endpoint,
+            "deployment": self.deployment.deployment,
+            "latency_ewma_ms": (
+                round(self.latency_ewma * 1000, 1)
+                if self.latency_ewma is not None else None
+            ),
+            "error_ewma": round(self.error_ewma, 4),
+            "remaining_requests": self.remaining_requests,
+            "remaining_tokens": self.remaining_tokens,
+            "cooling_down": self.cooldown_until > time.monotonic(),
+            "requests": self.requests,
+            "failures": self.failures,
+            "throttled": self.throttled,
+            "in_flight": self.in_flight,
+            "idle_seconds": (
+                round(time.monotonic() - self.last_outcome_at, 1)
+                if self.last_outcome_at is not None else None
+            ),
+            "last_error": self.last_error,
+        }
+
+
+class ModelRouter:
+    """
+    Keeps one chat client per deployment and picks the deployment with
+    the lowest expected latency, penalised by its error rate and by how
+    much of its quota is already spent.
+    """
+
+    def __init__(
+        self,
+        deployments: List[AzureDeployment],
+        ewma_alpha: float = 0.2,
+        exploration: float = 0.05,
+        cooldown_seconds: float = 10.0,
+        max_connections: Optional[int] = None,
+        **model_kwargs: Any
+    ):
+        if not deployments:
+            raise ValueError("The model router needs at least one deployment")
+        self.ewma_alpha = ewma_alpha
+        self.exploration = exploration
+        self.cooldown_seconds = cooldown_seconds
+        self._lock = threading.Lock()
+        self._stats: Dict[str, DeploymentStats] = {
+            deployment.name: DeploymentStats(deployment)
+            for deployment in deployments
+        }
+        # With a pool the router itself retries on another deployment,
+        # so the clients fail fast instead of retrying on the same one.
+        max_retries = model_kwargs.pop(
+            "max_retries", 0 if len(deployments) > 1 else 2
+        )
+        from langchain_openai import AzureChatOpenAI
+
+        self._clients: Dict[str, "AzureChatOpenAI"] = {
+            deployment.name: AzureChatOpenAI(
+                api_key=deployment.api_key,
+                api_version=deployment.api_version,
+                azure_endpoint=deployment.endpoint,
+                azure_deployment=deployment.deployment,
+                include_response_headers=True,
+                stream_usage=True,
+                max_retries=max_retries,
+                **_http_clients(max_connections),
+                **model_kwargs,
+            )
+            for deployment in deployments
+        }
+
+    def _score(self, stats: DeploymentStats, fastest: float) -> float:
+        latency = (
+            stats.latency_ewma if stats.latency_ewma is not None else fastest
+        )
+        quota = max(stats.quota_fraction(), 0.05)
+        return latency * (1 + 4 * stats.error_ewma) * (
+            1 + stats.in_flight
+        ) / quota
+
+    def candidates(self) -> List[str]:
+        """
+        Order the deployments by preference for the next call. Deployments
+        cooling down after a 429 go last, and a small share of calls
+        explores a random deployment to keep its latency estimate fresh.
+
+        Returns:
+            List[str]: Deployment names, best first.
+        """
+        now = time.monotonic()
+        with self._lock:
+            stats = list(self._stats.values())
+            observed = [
+                s.latency_ewma for s in stats if s.latency_ewma is not None
+            ]
+            fastest = min(observed) if observed else 1.0
+            ranked = sorted(
+                stats,
+                key=lambda s: (
+                    s.cooldown_until > now, self._score(s, fastest)
+                ),
+            )
+        names = [s.deployment.name for s in ranked]
+        if len(names) > 1 and random.random() < self.exploration:
+            names.insert(0, names.pop(random.randrange(1, len(names))))
+        return names
+
+    def client(self, name: str) -> "AzureChatOpenAI":
+        return self._clients[name]
+
+    def deployment(self, name: str) -> AzureDeployment:
+        return self._stats[name].deployment
+
+    def start(self, name: str):
+        with self._lock:
+            self._stats[name].in_flight += 1
+
+    def release(self, name: str):
+        """
+        Release a call that was abandoned by the caller, e.g. a stream
+        closed early or a cancelled request, without scoring it.
+
+        Args:
+            name (str): Deployment name.
+        """
+        with self._lock:
+            self._stats[name].in_flight -= 1
+
+    def record_success(
+        self,
+        name: str,
+        latency: float,
+        headers: Optional[dict] = None
+    ):
+        """
+        Update the deployment EWMAs and quota after a successful call.
+
+        Args:
+            name (str): Deployment name.
+            latency (float): Call duration in seconds.
+            headers (dict, optional): Response headers from Azure OpenAI.
+        """
+        alpha = self.ewma_alpha
+        with self._lock:
+            stats = self._stats[name]
+            stats.in_flight -= 1
+            stats.requests += 1
+            stats.latency_ewma = (
+                latency if stats.latency_ewma is None
+                else alpha * latency + (1 - alpha) * stats.latency_ewma
+            )
+            stats.error_ewma = (1 - alpha) * stats.error_ewma
+            stats.last_outcome_at = time.monotonic()
+            stats.last_error = None
+            if headers:
+                self._update_quota(stats, headers)
+
+    def record_failure(self, name: str, error: Exception):
+        """
+        Update the deployment error EWMA and start a cooldown when
+        Azure throttled the call.
+
+        Args:
+            name (str): Deployment name.
+            error (Exception): The error raised by the call.
+        """
+        alpha = self.ewma_alpha
+        with self._lock:
+            stats = self._stats[name]
+            stats.in_flight -= 1
+            stats.requests += 1
+            stats.failures += 1
+            stats.error_ewma = alpha + (1 - alpha) * stats.error_ewma
+            stats.last_outcome_at = time.monotonic()
+            stats.last_error = str(error) or type(error).__name__
+            if getattr(error, "status_code", None) == 429:
+                stats.throttled += 1
+                retry_after = _retry_after(error)
+                stats.cooldown_until = time.monotonic() + (
+                    retry_after
+                    if retry_after is not None
+                    else self.cooldown_seconds
+                )
+
+    def _update_quota(self, stats: DeploymentStats, headers: dict):
+        headers = {key.lower(): value for key, value in headers.items()}
+        remaining_requests = headers.get("x-ratelimit-remaining-requests")
+        remaining_tokens = headers.get("x-ratelimit-remaining-tokens")
+        if remaining_requests is not None:
+            stats.remaining_requests = int(remaining_requests)
+        if remaining_tokens is not None:
+            stats.remaining_tokens = int(remaining_tokens)
+            stats.max_remaining_tokens = max(
+                stats.max_remaining_tokens or 0, stats.remaining_tokens
+            )
+
+    def idle_deployments(self, seconds: float) -> List[str]:
+        """
+        Deployments without any call completed in the last seconds, whose
+        statistics say nothing about their current health.
+
+        Args:
+            seconds (float): Time window.
+
+        Returns:
+            List[str]: Deployment names.
+        """
+        now = time.monotonic()
+        with self._lock:
+            return [
+                name for name, stats in self._stats.items()
+                if stats.in_flight == 0 and (
+                    stats.last_outcome_at is None
+                    or now - stats.last_outcome_at > seconds
+                )
+            ]
+
+    async def probe(self, name: str):
+        """
+        Send a one-token completion to a deployment, recording its outcome
+        like any other call.
+
+        Args:
+            name (str): Deployment name.
+        """
+        self.start(name)
+        started = time.perf_counter()
+        try:
+            await self._clients[name].ainvoke("ping", max_tokens=1)
+        except BaseException as e:
+            if isinstance(e, Exception):
+                self.record_failure(name, e)
+            else:
+                self.release(name)
+            raise
+        self.record_success(name, time.perf_counter() - started)
+
+    def stats(self) -> List[dict]:
+        """
+        Snapshot of the statistics of every deployment.
+
+        Returns:
+            List[dict]: One entry per deployment.
+        """
+        with self._lock:
+            return [stats.as_dict() for stats in self._stats.values()]
+
+
+class Usage(NamedTuple):
+    """Served model name and token usage of a chat completion."""
+
+    model_name: Optional[str] = None
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: int = 0
+
+    def __add__(self, other: "Usage") -> "Usage":
+        return Usage(
+            other.model_name or self.model_name,
+            self.prompt_tokens + other.prompt_tokens,
+            self.completion_tokens + other.completion_tokens,
+            self.cached_tokens + other.cached_tokens,
+        )
+
+
+class RoleMetrics:
+    """
+    Latency, token and cost counters of the calls made for a model role,
+    used to compare the cost of each step of the graph.
+    """
+
+    def __init__(self, window: int = 1000):
+        self._lock = threading.Lock()
+        self.calls: int = 0
+        self.failures: int = 0
+        self.prompt_tokens: int = 0
+        self.cached_tokens: int = 0
+        self.completion_tokens: int = 0
+        self.cost_usd: float = 0.0
+        self.latencies = deque(maxlen=window)
+        self.deployments: Dict[str, int] = {}
+
+    def record_success(
+        self,
+        deployment: AzureDeployment,
+        latency: float,
+        usage: Usage
+    ):
+        cost = _cost(deployment, usage)
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens += usage.prompt_tokens
+            self.cached_tokens += usage.cached_tokens
+            self.completion_tokens += usage.completion_tokens
+            self.cost_usd += cost
+            self.latencies.append(latency)
+            self.deployments[deployment.name] = (
+                self.deployments.get(deployment.name, 0) + 1
+            )
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            latencies = sorted(self.latencies)
+            calls = self.calls
+
+            def percentile(q: float) -> Optional[float]:
+                if not latencies:
+                    return None
+                index = min(int(q * len(latencies)), len(latencies) - 1)
+                return round(latencies[index] * 1000, 1)
+
+            return {
+                "calls": calls,
+                "failures": self.failures,
+                "latency_p50_ms": percentile(0.5),
+                "latency_p95_ms": percentile(0.95),
+                "prompt_tokens": self.prompt_tokens,
+                "cached_tokens": self.cached_tokens,
+                "cache_hit_ratio": (
+                    round(self.cached_tokens / self.prompt_tokens, 4)
+                    if self.prompt_tokens else None
+                ),
+                "completion_tokens": self.completion_tokens,
+                "cost_usd": round(self.cost_usd, 6),
+                "avg_cost_usd": (
+                    round(self.cost_usd / calls, 6) if calls else None
+                ),
+                "deployments": dict(self.deployments),
+            }
+
+
+_role_metrics: Dict[str, RoleMetrics] = {
+    role: RoleMetrics() for role in MODEL_ROLES
+}
+
+
+def get_role_metrics() -> Dict[str, dict]:
+    """
+    Snapshot of the latency and cost counters of every model role.
+
+    Returns:
+        Dict[str, dict]: Metrics keyed by role.
+    """
+    return {role: metrics.as_dict() for role, metrics in _role_metrics.items()}
+
+
+def _cost(deployment: AzureDeployment, usage: Usage) -> float:
+    """
+    Price a completion, charging the prompt tokens served from the
+    prompt cache at the cached-input rate.
+    """
+    uncached_tokens = usage.prompt_tokens - usage.cached_tokens
+    if deployment.input_cost_per_1k is not None:
+        cached_cost_per_1k = (
+            deployment.cached_input_cost_per_1k
+            if deployment.cached_input_cost_per_1k is not None
+            else deployment.input_cost_per_1k
+        )
+        return (
+            uncached_tokens * deployment.input_cost_per_1k
+            + usage.cached_tokens * cached_cost_per_1k
+            + usage.completion_tokens * (deployment.output_cost_per_1k or 0.0)
+        ) / 1000
+    if not usage.model_name:
+        return 0.0
+
+    from langchain_community.callbacks.openai_info import (
+        TokenType,
+        get_openai_token_cost_for_model
+    )
+
+    try:
+        cost = get_openai_token_cost_for_model(
+            usage.model_name, uncached_tokens, token_type=TokenType.PROMPT
+        ) + get_openai_token_cost_for_model(
+            usage.model_name,
+            usage.completion_tokens,
+            token_type=TokenType.COMPLETION,
+        )
+    except ValueError:
+        return 0.0
+    try:
+        cost += get_openai_token_cost_for_model(
+            usage.model_name,
+            usage.cached_tokens,
+            token_type=TokenType.PROMPT_CACHED,
+        )
+    except ValueError:
+        cost += get_openai_token_cost_for_model(
+            usage.model_name, usage.cached_tokens, token_type=TokenType.PROMPT
+        )
+    return cost
+
+
+def _usage(result) -> Usage:
+    """
+    Extract the served model name and token usage from a chat result
+    or from a chunk of a stream.
+    """
+    llm_output = getattr(result, "llm_output", None) or {}
+    token_usage = llm_output.get("token_usage") or {}
+    if token_usage:
+        details = token_usage.get("prompt_tokens_details") or {}
+        return Usage(
+            llm_output.get("model_name"),
+            token_usage.get("prompt_tokens", 0),
+            token_usage.get("completion_tokens", 0),
+            details.get("cached_tokens") or 0,
+        )
+    message = getattr(result, "message", None)
+    usage = getattr(message, "usage_metadata", None) or {}
+    details = usage.get("input_token_details") or {}
+    generation_info = getattr(result, "generation_info", None) or {}
+    return Usage(
+        generation_info.get("model_name"),
+        usage.get("input_tokens", 0),
+        usage.get("output_tokens", 0),
+        details.get("cache_read") or 0,
+    )
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    try:
+        return float(error.response.headers.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+def _headers(result) -> Optional[dict]:
+    generations = getattr(result, "generations", None) or [result]
+    generation_info = getattr(generations[0], "generation_info", None) or {}
+    return generation_info.get("headers")
+
+
+class RoutedChatModel(BaseChatModel):
+    """
+    Chat model that delegates every call to the deployment chosen by
+    the ModelRouter, failing over to the next one on 429/5xx errors.
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    router: ModelRouter
+    role: str = "answer"
+
+    @property
+    def _llm_type(self) -> str:
+        return "azure-openai-router"
+
+    def _record_success(
+        self,
+        name: str,
+        started: float,
+        headers: Optional[dict],
+        usage: Usage
+    ):
+        latency = time.perf_counter() - started
+        self.router.record_success(name, latency, headers)
+        _role_metrics[self.role].record_success(
+            self.router.deployment(name), latency, usage
+        )
+
+    def _record_failure(self, name: str, error: Exception):
+        self.router.record_failure(name, error)
+        _role_metrics[self.role].record_failure()
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any
+    ) -> ChatResult:
+        last_error = None
+        for name in self.router.candidates():
+            self.router.start(name)
+            started = time.perf_counter()
+            try:
+                result = self.router.client(name)._generate(
+                    messages, stop=stop, run_manager=run_manager, **kwargs
+                )
+            except _failover_errors() as e:
+                self._record_failure(name, e)
+                last_error = e
+                continue
+            except Exception as e:
+                self._record_failure(name, e)
+                raise
+            self._record_success(
+                name, started, _headers(result), _usage(result)
+            )
+            return result
+        raise last_error
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any
+    ) -> ChatResult:
+        last_error = None
+        for name in self.router.candidates():
+            self.router.start(name)
+            started = time.perf_counter()
+            try:
+                result = await self.router.client(name)._agenerate(
+                    messages, stop=stop, run_manager=run_manager, **kwargs
+                )
+            except _failover_errors() as e:
+                self._record_failure(name, e)
+                last_error = e
+                continue
+            except asyncio.CancelledError:
+                self.router.release(name)
+                raise
+            except Exception as e:
+                self._record_failure(name, e)
+                raise
+            self._record_success(
+                name, started, _headers(result), _usage(result)
+            )
+            return result
+        raise last_error
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any
+    ) -> Iterator[ChatGenerationChunk]:
+        last_error = None
+        for name in self.router.candidates():
+            self.router.start(name)
+            started = time.perf_counter()
+            headers = None
+            usage = Usage()
+            emitted = False
+            try:
+                for chunk in self.router.client(name)._stream(
+                    messages, stop=stop, run_manager=run_manager, **kwargs
+                ):
+                    headers = headers or _headers(chunk)
+                    usage += _usage(chunk)
+                    emitted = True
+                    yield chunk
+            except _failover_errors() as e:
+                self._record_failure(name, e)
+                # Once tokens reached the caller the call can't be replayed.
+                if emitted:
+                    raise
+                last_error = e
+                continue
+            except (GeneratorExit, asyncio.CancelledError):
+                self.router.release(name)
+                raise
+            except Exception as e:
+                self._record_failure(name, e)
+                raise
+            self._record_success(name, started, headers, usage)
+            return
+        raise last_error
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        last_error = None
+        for name in self.router.candidates():
+            self.router.start(name)
+            started = time.perf_counter()
+            headers = None
+            usage = Usage()
+            emitted = False
+            try:
+                async for chunk in self.router.client(name)._astream(
+                    messages, stop=stop, run_manager=run_manager, **kwargs
+                ):
+                    headers = headers or _headers(chunk)
+                    usage += _usage(chunk)
+                    emitted = True
+                    yield chunk
+            except _failover_errors() as e:
+                self._record_failure(name, e)
+                if emitted:
+                    raise
+                last_error = e
+                continue
+            except (GeneratorExit, asyncio.CancelledError):
+                self.router.release(name)
+                raise
+            except Exception as e:
+                self._record_failure(name, e)
+                raise
+            self._record_success(name, started, headers, usage)
+            return
+        raise last_error
+
+
+_model_routers: Dict[Optional[str], ModelRouter] = {}
+
+
+def get_model_router(role: Optional[str] = None) -> ModelRouter:
+    """
+    Obtains the model router serving a model role, creating it from the
+    configured deployments the first time. Roles without their own pool
+    share the default router, and with it the deployment statistics.
+    Each deployment client gets this worker's share of
+    `LLM_MAX_CONNECTIONS` as its connection pool.
+
+    Args:
+        role (str, optional): One of MODEL_ROLES. None for the default.
+
+    Returns:
+        ModelRouter: The shared model router.
+    """
+    settings = get_settings()
+    if role not in settings.AZURE_LLM_ROLE_DEPLOYMENTS:
+        role = None
+    if role not in _model_routers:
+        _model_routers[role] = ModelRouter(
+            settings.get_llm_deployments(role),
+            ewma_alpha=settings.LLM_ROUTER_EWMA_ALPHA,
+            exploration=settings.LLM_ROUTER_EXPLORATION,
+            cooldown_seconds=settings.LLM_ROUTER_COOLDOWN_SECONDS,
+            max_connections=settings.worker_share(
+                settings.LLM_MAX_CONNECTIONS
+            ),
+        )
+    return _model_routers[role]
+
+
+def get_model_routers() -> Dict[str, ModelRouter]:
+    """
+    Obtains the routers created so far, keyed by the role they serve.
+
+    Returns:
+        Dict[str, ModelRouter]: Routers keyed by role, "default" for the
+                                shared one.
+    """
+    return {
+        role or "default": router for role, router in _model_routers.items()
+    }
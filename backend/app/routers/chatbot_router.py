@@ -2,10 +2,19 @@
 Router for the chatbot functionality
 """
 
+import json
+from typing import List, Optional
+
 from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
 
-from backend.app.agents.agent import process_user_question
+from backend.app.agents.agent import (
+    process_user_question,
+    stream_user_question
+)
+from backend.app.agents.batch import process_user_questions
+from backend.app.config.settings import get_settings
 
 router = APIRouter()
 
@@ -22,6 +31,13 @@ class ChatResponse(BaseModel):
     response: str
 
 
+class BatchChatRequest(BaseModel):
+    """Model representing a batch of user messages"""
+
+    messages: List[str] = Field(..., min_length=1)
+    max_concurrency: Optional[int] = Field(default=None, ge=1)
+
+
 @router.post("/chat", response_model=ChatResponse)
 async def chat_endpoint(request: ChatRequest):
     """
@@ -36,3 +52,67 @@ async def chat_endpoint(request: ChatRequest):
             status_code=500,
             detail=f"Error interno del servidor: {e}"
         )
+
+
+@router.post("/chat/stream")
+async def chat_stream_endpoint(request: ChatRequest):
+    """
+    Endpoint for interacting with the chatbot over Server-Sent Events.
+    Streams the graph stages and the draft answer tokens as they are
+    produced, and the final answer as the last event.
+    """
+
+    async def stream_events():
+        try:
+            async for event in stream_user_question(request.message):
+                yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+        except Exception as e:
+            error = {
+                "type": "error",
+                "detail": f"Error interno del servidor: {e}",
+            }
+            yield f"data: {json.dumps(error, ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(
+        stream_events(),
+        media_type="text/event-stream"
+    )
+
+
+@router.post("/chat/batch")
+async def chat_batch_endpoint(request: BatchChatRequest):
+    """
+    Endpoint for answering a batch of messages.
+    Streams one NDJSON line per message as soon as its answer is ready,
+    reporting per-message errors without failing the whole batch.
+    """
+    settings = get_settings()
+    if len(request.messages) > settings.BATCH_MAX_QUESTIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=(
+                f"El lote supera el máximo de "
+                f"{settings.BATCH_MAX_QUESTIONS} preguntas"
+            )
+        )
+    if any(not message.strip() for message in request.messages):
+        raise HTTPException(
+            status_code=400,
+            detail="El lote contiene preguntas vacías"
+        )
+
+    max_concurrency = min(
+        request.max_concurrency or settings.BATCH_MAX_CONCURRENCY,
+        settings.BATCH_MAX_CONCURRENCY
+    )
+
+    async def stream_results():
+        async for result in process_user_questions(
+            request.messages, max_concurrency
+        ):
+            yield json.dumps(result, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(
+        stream_results(),
+        media_type="application/x-ndjson"
+    )
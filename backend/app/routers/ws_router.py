@@ -0,0 +1,150 @@
+"""
+WebSocket router for the chatbot. Each browser session keeps a single
+connection that holds its conversation memory, streams the progress of
+every answer and lets the user cancel a question in flight.
+"""
+
+import asyncio
+import json
+import uuid
+from typing import Dict, Optional
+
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+
+from backend.app.agents.agent import stream_user_question
+from backend.app.config.settings import get_settings
+from backend.app.structured_logging import log_context, new_request_id
+
+router = APIRouter()
+
+
+class ChatSession:
+    """
+    Server-side state of a WebSocket connection: the conversation memory
+    and the question being answered, if any.
+    """
+
+    def __init__(self, websocket: WebSocket, session_id: str):
+        from langchain.memory import ConversationBufferWindowMemory
+
+        settings = get_settings()
+        self.websocket = websocket
+        self.session_id = session_id
+        self.memory = ConversationBufferWindowMemory(
+            memory_key="chat_history",
+            return_messages=True,
+            k=settings.WS_HISTORY_TURNS,
+        )
+        self.task: Optional[asyncio.Task] = None
+        self._send_lock = asyncio.Lock()
+
+    @property
+    def busy(self) -> bool:
+        return self.task is not None and not self.task.done()
+
+    async def send(self, event: dict):
+        async with self._send_lock:
+            await self.websocket.send_json(event)
+
+    async def answer(self, message: str):
+        """Stream the answer of a question to the client."""
+        # Every question is its own request in the logs.
+        with log_context(
+            request_id=new_request_id(), session_id=self.session_id
+        ):
+            await self._answer(message)
+
+    async def _answer(self, message: str):
+        try:
+            async for event in stream_user_question(
+                message, self.memory, self.session_id
+            ):
+                await self.send(event)
+        except asyncio.CancelledError:
+            try:
+                await self.send({"type": "cancelled"})
+            except Exception:
+                pass
+            raise
+        except WebSocketDisconnect:
+            # The client is gone: nobody is left to tell about it.
+            pass
+        except Exception as e:
+            try:
+                await self.send({
+                    "type": "error",
+                    "detail": f"Error interno del servidor: {e}",
+                })
+            except (WebSocketDisconnect, RuntimeError):
+                # Closed while answering; the receive loop cleans up.
+                pass
+
+    def cancel(self):
+        if self.busy:
+            self.task.cancel()
+
+
+sessions: Dict[str, ChatSession] = {}
+
+
+@router.websocket("/ws/chat")
+async def chat_websocket(
+    websocket: WebSocket,
+    session_id: Optional[str] = None
+):
+    """
+    WebSocket endpoint for interacting with the chatbot.
+
+    The client sends {"type": "message", "message": "..."} to ask a
+    question and {"type": "cancel"} to stop the one in flight. The server
+    answers with "stage", "token", "answer", "cancelled" and "error"
+    events, one question at a time per connection.
+    """
+    settings = get_settings()
+    if len(sessions) >= settings.worker_share(settings.WS_MAX_CONNECTIONS):
+        await websocket.close(code=1013, reason="Servidor ocupado")
+        return
+
+    await websocket.accept()
+    session = ChatSession(websocket, session_id or uuid.uuid4().hex)
+    connection_id = uuid.uuid4().hex
+    sessions[connection_id] = session
+    await session.send({"type": "session", "session_id": session.session_id})
+
+    try:
+        while True:
+            try:
+                data = json.loads(await websocket.receive_text())
+                kind = data.get("type", "message")
+            except (ValueError, AttributeError):
+                await session.send(
+                    {"type": "error", "detail": "Mensaje JSON inválido"}
+                )
+                continue
+
+            if kind == "cancel":
+                session.cancel()
+            elif kind == "message":
+                message = str(data.get("message") or "").strip()
+                if not message:
+                    await session.send(
+                        {"type": "error", "detail": "El mensaje está vacío"}
+                    )
+                elif session.busy:
+                    await session.send({
+                        "type": "error",
+                        "detail": "Ya hay una pregunta en curso",
+                    })
+                else:
+                    session.task = asyncio.create_task(
+                        session.answer(message)
+                    )
+            else:
+                await session.send(
+                    {"type": "error", "detail": f"Tipo desconocido: {kind}"}
+                )
+    except WebSocketDisconnect:
+        pass
+    finally:
+        session.cancel()
+        sessions.pop(connection_id, None)
@@ -0,0 +1,166 @@
+"""
+Production serving mode: a pre-fork master that loads the application
+once, binds the listening socket and forks `SERVE_WORKERS` uvicorn
+workers (one per core when 0) that share it.
+
+Everything loaded before the fork (integrations, compiled graph,
+precomputed answers) is shared copy-on-write by the workers.
+Clients and connection pools are created after the fork, in each worker,
+sized to its share of the instance limits.
+
+Usage:
+    python -m backend.app.serve --workers 4 --port 8000
+"""
+
+import argparse
+import os
+import signal
+import socket
+import sys
+import time
+from typing import Dict
+
+from backend.app.config.settings import get_settings, validate_get_settings
+
+
+def preload():
+    """
+    Load the shared, read-only state of the application before forking.
+    Nothing here may open a connection or start a thread.
+    """
+    from backend.app.agents.agent import get_graph
+    from backend.app.agents.answer_store import get_answer_store
+    from backend.app.main import app
+    from backend.app.warmup import _import_heavy_modules
+
+    started = time.perf_counter()
+    _import_heavy_modules()
+    get_graph()
+    get_answer_store().load()
+    print(
+        f"📦 Aplicación precargada en "
+        f"{(time.perf_counter() - started) * 1000:.0f} ms"
+    )
+    return app
+
+
+def bind_socket(host: str, port: int, backlog: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(app, sock: socket.socket, index: int):
+    """Serve the preloaded application on the shared socket."""
+    import uvicorn
+
+    # The health probes and the knowledge base refresh run in worker 0.
+    get_settings().SERVE_WORKER_INDEX = index
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    server = uvicorn.Server(
+        uvicorn.Config(app, lifespan="on", log_level="warning")
+    )
+    server.run(sockets=[sock])
+
+
+def serve(host: str, port: int, workers: int):
+    """
+    Fork the workers and supervise them, replacing any worker that dies
+    until the master receives SIGINT or SIGTERM.
+
+    Args:
+        host (str): Interface to bind.
+        port (int): Port to bind.
+        workers (int): Number of worker processes.
+    """
+    settings = get_settings()
+    settings.SERVE_WORKERS = workers
+    app = preload()
+    sock = bind_socket(host, port, settings.SERVE_BACKLOG)
+    print(
+        f"🚀 Sirviendo en http://{host}:{port} con {workers} workers "
+        f"({settings.worker_share(settings.LLM_MAX_CONNECTIONS)} "
+        f"conexiones LLM por worker)"
+    )
+
+    children: Dict[int, int] = {}
+    stopping = False
+
+    def spawn(index: int):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                run_worker(app, sock, index)
+            finally:
+                os._exit(0)
+        children[pid] = index
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    for index in range(workers):
+        spawn(index)
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        index = children.pop(pid, None)
+        if index is not None and not stopping:
+            print(f"⚠️ Worker {index} (pid {pid}) terminó, reinicio...")
+            spawn(index)
+    sock.close()
+
+
+def main():
+    settings = get_settings()
+    parser = argparse.ArgumentParser(
+        description="Serve the API with pre-forked workers."
+    )
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=settings.PORT)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=settings.worker_count(),
+        help="Worker processes, defaults to SERVE_WORKERS (0 = one per core).",
+    )
+    args = parser.parse_args()
+
+    try:
+        validate_get_settings()
+    except RuntimeError as e:
+        print(str(e))
+        sys.exit(1)
+
+    workers = args.workers or os.cpu_count() or 1
+    if not hasattr(os, "fork"):
+        import uvicorn
+
+        print("⚠️ Sin fork(): cada worker carga la aplicación.")
+        os.environ["SERVE_WORKERS"] = str(workers)
+        uvicorn.run(
+            "backend.app.main:app",
+            host=args.host,
+            port=args.port,
+            workers=workers,
+        )
+        return
+    serve(args.host, args.port, workers)
+
+
+if __name__ == "__main__":
+    main()
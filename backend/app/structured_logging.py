@@ -0,0 +1,325 @@
+"""
+Structured, non-blocking logging. Every record is written as a JSON
+line with the request and session ids of the request that emitted it.
+
+Loggers only put the record on a bounded queue; a background thread
+formats and writes it, so a slow stdout never stalls the event loop.
+When the queue is full the record is dropped and counted instead of
+blocking the caller.
+
+High-volume node events are logged with `extra={"sampled": True}` and
+kept for a share `LOG_NODE_SAMPLE_RATE` of the requests. The decision is
+made per request id, so a sampled request keeps all of its events.
+Warnings and errors are never sampled out.
+
+The interaction log goes through its own queue to a size-rotated file,
+one per serving worker since rotation can't be shared between processes.
+"""
+
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import uuid
+import zlib
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Optional
+
+from backend.app.config.settings import get_settings
+
+request_id_var: contextvars.ContextVar = contextvars.ContextVar(
+    "request_id", default=None
+)
+session_id_var: contextvars.ContextVar = contextvars.ContextVar(
+    "session_id", default=None
+)
+
+INTERACTION_LOGGER = "interactions"
+TEXT_FORMAT = (
+    "%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s"
+)
+# Attributes of every LogRecord; anything else was passed in `extra`.
+_RECORD_ATTRIBUTES = set(
+    vars(logging.LogRecord("", 0, "", 0, "", None, None))
+) | {"message", "asctime", "sampled"}
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+@contextmanager
+def log_context(
+    request_id: Optional[str] = None,
+    session_id: Optional[str] = None
+):
+    """
+    Tag the records logged inside the block (and by the tasks it starts)
+    with a request and session id.
+
+    Args:
+        request_id (str, optional): Request id, kept as is when None.
+        session_id (str, optional): Session id, kept as is when None.
+    """
+    tokens = []
+    if request_id is not None:
+        tokens.append((request_id_var, request_id_var.set(request_id)))
+    if session_id is not None:
+        tokens.append((session_id_var, session_id_var.set(session_id)))
+    try:
+        yield
+    finally:
+        for variable, token in reversed(tokens):
+            variable.reset(token)
+
+
+def is_sampled(request_id: Optional[str], rate: float) -> bool:
+    """Whether the sampled events of a request are kept."""
+    if rate >= 1:
+        return True
+    if rate <= 0:
+        return False
+    if request_id is None:
+        return random.random() < rate
+    return zlib.crc32(request_id.encode("utf-8")) / 0xFFFFFFFF < rate
+
+
+class ContextFilter(logging.Filter):
+    """
+    Runs on the calling side: adds the request and session ids of the
+    current context and drops the sampled events of unsampled requests.
+    """
+
+    def __init__(self, sample_rate: float):
+        super().__init__()
+        self.sample_rate = sample_rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if getattr(record, "request_id", None) is None:
+            record.request_id = request_id_var.get()
+        if getattr(record, "session_id", None) is None:
+            record.session_id = session_id_var.get()
+        if (
+            getattr(record, "sampled", False)
+            and record.levelno < logging.WARNING
+        ):
+            return is_sampled(record.request_id, self.sample_rate)
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats a record and its `extra` fields as one JSON line."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": datetime.fromtimestamp(
+                record.created, timezone.utc
+            ).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES and value is not None:
+                data[key] = value
+        if record.exc_info:
+            data["exception"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Queue handler that drops records instead of waiting for room."""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Only the message is rendered here, since its arguments may
+        # change after the call; the JSON is built by the writer thread.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class RequestContextMiddleware:
+    """
+    ASGI middleware that tags every HTTP request with a request id, taken
+    from the X-Request-ID header when the client sends one, and returns
+    it in the response headers.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == b"x-request-id":
+                request_id = value.decode("latin-1")[:64]
+                break
+        request_id = request_id or new_request_id()
+
+        async def send_with_request_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [
+                    *message.get("headers", []),
+                    (b"x-request-id", request_id.encode("latin-1")),
+                ]
+            await send(message)
+
+        with log_context(request_id=request_id):
+            await self.app(scope, receive, send_with_request_id)
+
+
+_handler: Optional[NonBlockingQueueHandler] = None
+_listener: Optional[QueueListener] = None
+_interaction_handler: Optional[NonBlockingQueueHandler] = None
+_interaction_listener: Optional[QueueListener] = None
+
+
+def interaction_log_path(path: str, worker_index: int) -> str:
+    """
+    File of the interaction log written by a serving worker.
+
+    Args:
+        path (str): `INTERACTION_LOG_PATH`, used as is by worker 0.
+        worker_index (int): Index of the serving worker.
+
+    Returns:
+        str: The path with the worker index before the extension.
+    """
+    if worker_index <= 0:
+        return path
+    root, extension = os.path.splitext(path)
+    return f"{root}.{worker_index}{extension}"
+
+
+def _setup_interaction_log(settings):
+    global _interaction_handler, _interaction_listener
+    path = interaction_log_path(
+        settings.INTERACTION_LOG_PATH, settings.SERVE_WORKER_INDEX
+    )
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    writer = RotatingFileHandler(
+        path,
+        maxBytes=settings.INTERACTION_LOG_MAX_BYTES,
+        backupCount=settings.INTERACTION_LOG_BACKUPS,
+        encoding="utf-8",
+        delay=True,
+    )
+    writer.setFormatter(logging.Formatter("%(message)s"))
+
+    log_queue = queue.Queue(settings.LOG_QUEUE_SIZE)
+    _interaction_handler = NonBlockingQueueHandler(log_queue)
+    _interaction_listener = QueueListener(log_queue, writer)
+    _interaction_listener.start()
+
+    logger = logging.getLogger(INTERACTION_LOGGER)
+    logger.setLevel(logging.INFO)
+    logger.handlers = [_interaction_handler]
+    logger.propagate = False
+
+
+def setup_logging(stream=None):
+    """
+    Route the application loggers through the queue and start the
+    writer thread. It must run in every process after forking, which is
+    why the application calls it from its lifespan.
+
+    Args:
+        stream (file, optional): Where the records are written. Defaults
+                                 to stdout.
+    """
+    global _handler, _listener
+    if _listener is not None:
+        return
+    settings = get_settings()
+
+    writer = logging.StreamHandler(stream or sys.stdout)
+    if settings.LOG_FORMAT == "text":
+        writer.setFormatter(logging.Formatter(TEXT_FORMAT))
+    else:
+        writer.setFormatter(JsonFormatter())
+
+    log_queue = queue.Queue(settings.LOG_QUEUE_SIZE)
+    _handler = NonBlockingQueueHandler(log_queue)
+    _handler.addFilter(ContextFilter(settings.LOG_NODE_SAMPLE_RATE))
+    _listener = QueueListener(log_queue, writer)
+    _listener.start()
+
+    logger = logging.getLogger("backend")
+    logger.setLevel(settings.LOG_LEVEL.upper())
+    logger.handlers = [_handler]
+    logger.propagate = False
+
+    if settings.INTERACTION_LOG_PATH:
+        _setup_interaction_log(settings)
+
+
+def shutdown_logging():
+    """Write the queued records and stop the writer threads."""
+    global _handler, _listener, _interaction_handler, _interaction_listener
+    if _interaction_listener is not None:
+        _interaction_listener.stop()
+        logging.getLogger(INTERACTION_LOGGER).removeHandler(
+            _interaction_handler
+        )
+        _interaction_handler, _interaction_listener = None, None
+    if _listener is None:
+        return
+    _listener.stop()
+    logging.getLogger("backend").removeHandler(_handler)
+    _handler, _listener = None, None
+
+
+def logging_stats() -> dict:
+    """
+    Returns:
+        dict: Records "queued" and not written yet, and records
+              "dropped" because the queue was full, plus the interaction
+              records dropped.
+    """
+    stats = {"queued": 0, "dropped": 0, "interactions_dropped": 0}
+    if _handler is not None:
+        stats.update(queued=_handler.queue.qsize(), dropped=_handler.dropped)
+    if _interaction_handler is not None:
+        stats["interactions_dropped"] = _interaction_handler.dropped
+    return stats
+
+
+def _reset_after_fork():
+    # The writer threads don't survive a fork: the child starts its own.
+    global _handler, _listener, _interaction_handler, _interaction_listener
+    if _handler is not None:
+        logging.getLogger("backend").removeHandler(_handler)
+    if _interaction_handler is not None:
+        logging.getLogger(INTERACTION_LOGGER).removeHandler(
+            _interaction_handler
+        )
+    _handler, _listener = None, None
+    _interaction_handler, _interaction_listener = None, None
+
+
+atexit.register(shutdown_logging)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -1,46 +1,86 @@
 """
 Utilities for configuring and retrieving instances
 of Azure OpenAI and Azure Cognitive Search retriever.
+
+The Azure SDK and LangChain integrations are imported inside the
+factories so that importing the application stays fast.
 """
 
-from langchain_community.retrievers import AzureCognitiveSearchRetriever
-from langchain_openai import AzureChatOpenAI
+from typing import TYPE_CHECKING, Optional
 
 from backend.app.config.settings import get_settings
+from backend.app.knowledge_base.index_registry import get_active_index_name
+from backend.app.model_router import RoutedChatModel, get_model_router
+
+if TYPE_CHECKING:
+    from azure.search.documents import SearchClient
+    from langchain_community.retrievers import AzureCognitiveSearchRetriever
 
 
-def get_model() -> AzureChatOpenAI:
+def get_model(role: str = "answer") -> RoutedChatModel:
     """
-    Create and configure an Azure OpenAI completion model instance.
+    Create an Azure OpenAI completion model that routes each call to the
+    fastest healthy deployment of the pool configured for the role. The
+    role is set as a run tag, so streamed events can be told apart.
+
+    Args:
+        role (str): Step the model is used for: "answer", "supervise",
+                    "merge" or "condense".
 
     Returns:
-        AzureChatOpenAI: Azure OpenAI completion model instance.
+        RoutedChatModel: Azure OpenAI completion model instance.
     """
-    settings = get_settings()
-
-    return AzureChatOpenAI(
-        api_key=settings.AZURE_API_KEY,
-        api_version=settings.AZURE_API_VERSION,
-        azure_endpoint=settings.AZURE_ENDPOINT,
-        azure_deployment=settings.AZURE_LLM_DEPLOYMENT,
-        deployment_name="chat",
+    return RoutedChatModel(
+        router=get_model_router(role), role=role, tags=[role]
     )
 
 
-def get_retriever() -> AzureCognitiveSearchRetriever:
+def get_retriever() -> "AzureCognitiveSearchRetriever":
     """
     Create and configure a retriever for Azure Cognitive Search, retrieving
-    the top 5 relevant documents based on the query.
+    the top `RETRIEVER_TOP_K` relevant documents based on the query from
+    the active knowledge base index.
 
     Returns:
         AzureCognitiveSearchRetriever: Cognitive Search Retriever instance.
     """
+    from langchain_community.retrievers import AzureCognitiveSearchRetriever
+
     settings = get_settings()
 
     return AzureCognitiveSearchRetriever(
         api_key=settings.AZURE_COGNITIVE_SEARCH_API_KEY,
         service_name=settings.AZURE_COGNITIVE_SEARCH_NAME,
-        index_name=settings.AZURE_COGNITIVE_SEARCH_INDEX_NAME,
+        index_name=get_active_index_name(),
         content_key="content",
-        top_k=5,
+        top_k=settings.RETRIEVER_TOP_K,
+    )
+
+
+def get_search_client(index_name: Optional[str] = None) -> "SearchClient":
+    """
+    Create a search client bound to the knowledge base index, used to
+    run vector queries with precomputed embeddings.
+
+    Args:
+        index_name (str, optional): Index to query. Defaults to the active
+                                    knowledge base index.
+
+    Returns:
+        SearchClient: Azure AI Search client instance.
+    """
+    from azure.core.credentials import AzureKeyCredential
+    from azure.search.documents import SearchClient
+
+    settings = get_settings()
+
+    return SearchClient(
+        endpoint=(
+            f"https://{settings.AZURE_COGNITIVE_SEARCH_NAME}"
+            ".search.windows.net"
+        ),
+        index_name=index_name or get_active_index_name(),
+        credential=AzureKeyCredential(
+            settings.AZURE_COGNITIVE_SEARCH_API_KEY
+        ),
     )
@@ -0,0 +1,156 @@
+"""
+Warm-up stage run at startup, so a new instance pays its cold costs
+(heavy imports, graph compilation, client and connection creation)
+before the readiness probe lets traffic in.
+"""
+
+import asyncio
+import importlib
+import logging
+import time
+from typing import Awaitable, Callable, Dict
+
+from backend.app.config.settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+HEAVY_MODULES = [
+    "langchain.chains",
+    "langchain.memory",
+    "langchain_community.retrievers",
+    "langchain_community.utilities",
+    "langchain_community.callbacks.manager",
+    "langchain_openai",
+    "langgraph.graph",
+]
+
+
+def _import_heavy_modules():
+    for module in HEAVY_MODULES:
+        importlib.import_module(module)
+
+
+async def _load_integrations():
+    await asyncio.to_thread(_import_heavy_modules)
+
+
+async def _compile_graph():
+    from backend.app.agents.agent import get_graph
+
+    get_graph()
+
+
+async def _create_clients():
+    from backend.app.agents.agent import get_refinement_agent
+    from backend.app.utils import get_model
+
+    get_refinement_agent()
+    get_model("answer")
+    get_model("condense")
+
+
+async def _load_topic_gate():
+    from backend.app.agents.topic_gate import get_topic_gate
+
+    if get_settings().TOPIC_GATE_ENABLED:
+        await get_topic_gate().load()
+
+
+async def _open_connections():
+    """
+    Probe every deployment through its router with a one-token
+    completion, so the pooled HTTPS connections are open before the first
+    user request and the router starts from measured latency and error
+    statistics. The per-role metrics are left alone: they count user
+    requests only.
+    """
+    from backend.app.model_router import get_model_routers
+
+    settings = get_settings()
+    if not settings.WARMUP_UPSTREAM:
+        return
+
+    calls = [
+        router.probe(name)
+        for router in get_model_routers().values()
+        for name in (stats["name"] for stats in router.stats())
+    ]
+    results = await asyncio.gather(*calls, return_exceptions=True)
+    errors = [result for result in results if isinstance(result, Exception)]
+    if errors:
+        raise RuntimeError(
+            f"{len(errors)} de {len(calls)} despliegues no respondieron: "
+            f"{errors[0]}"
+        )
+
+
+WARMUP_STEPS: Dict[str, Callable[[], Awaitable[None]]] = {
+    "load_integrations": _load_integrations,
+    "compile_graph": _compile_graph,
+    "create_clients": _create_clients,
+    "load_topic_gate": _load_topic_gate,
+    "open_connections": _open_connections,
+}
+# Steps without which the instance cannot serve. The others only save
+# cold costs: the topic gate lets questions through until it is loaded
+# and the connections open on the first requests.
+REQUIRED_STEPS = {"load_integrations", "compile_graph", "create_clients"}
+
+
+async def warm_up(state) -> dict:
+    """
+    Run the warm-up steps in order, recording the duration and outcome of
+    each one in `state.warmup`, and mark the instance as ready at the end.
+
+    A failing required step keeps the instance out of rotation and marks
+    the warm-up as failed. Any other failing step marks it as degraded:
+    the instance can still serve, only the first requests will pay the
+    cold cost.
+
+    Args:
+        state: Application state (`app.state`) shared with the probes.
+
+    Returns:
+        dict: Summary of the warm-up steps.
+    """
+    settings = get_settings()
+    summary = {"ready": False, "failed": False, "degraded": False,
+               "steps": {}}
+    state.warmup = summary
+    started = time.perf_counter()
+
+    for name, step in WARMUP_STEPS.items():
+        step_started = time.perf_counter()
+        try:
+            await asyncio.wait_for(
+                step(), timeout=settings.WARMUP_TIMEOUT_SECONDS
+            )
+            status, error = "ok", None
+        except Exception as e:
+            status, error = "failed", str(e) or type(e).__name__
+            logger.warning(
+                f"⚠️ Paso de calentamiento '{name}' falló: {error}"
+            )
+            if name in REQUIRED_STEPS:
+                summary["failed"] = True
+            else:
+                summary["degraded"] = True
+        summary["steps"][name] = {
+            "status": status,
+            "duration_ms": round(
+                (time.perf_counter() - step_started) * 1000, 1
+            ),
+            "error": error,
+        }
+
+    summary["duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    if summary["failed"]:
+        logger.error(
+            "❌ Calentamiento fallido: la instancia no recibirá tráfico"
+        )
+        return summary
+    summary["ready"] = True
+    logger.info(
+        f"🔥 Calentamiento completado en {summary['duration_ms']} ms"
+    )
+    return summary
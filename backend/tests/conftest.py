@@ -0,0 +1,27 @@
+"""
+Shared setup of the unit tests. The settings require the Azure and Turso
+variables at import time, so placeholders are set before any module of
+the application is imported; no test talks to those services.
+"""
+
+import os
+
+REQUIRED_VARIABLES = [
+    "AZURE_API_KEY",
+    "AZURE_ENDPOINT",
+    "AZURE_API_VERSION",
+    "AZURE_LLM_DEPLOYMENT",
+    "AZURE_EMBEDDING_DEPLOYMENT",
+    "AZURE_COGNITIVE_SEARCH_NAME",
+    "AZURE_COGNITIVE_SEARCH_API_KEY",
+    "AZURE_COGNITIVE_SEARCH_INDEX_NAME",
+    "AZURE_STORAGE_ACCOUNT_NAME",
+    "AZURE_STORAGE_ACCOUNT_API_KEY",
+    "AZURE_STORAGE_ACCOUNT_CONTAINER_NAME",
+    "AZURE_STORAGE_ACCOUNT_ENDPOINT_SUFFIX",
+    "TURSO_AUTH_TOKEN",
+    "TURSO_DATABASE_URL",
+]
+
+for variable in REQUIRED_VARIABLES:
+    os.environ.setdefault(variable, "test")
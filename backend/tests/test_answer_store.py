@@ -0,0 +1,105 @@
+import json
+
+import pytest
+
+from backend.app.agents import answer_store
+from backend.app.agents.answer_store import (
+    AnswerStore,
+    mine_frequent_questions,
+    question_key,
+    redact,
+)
+
+
+@pytest.mark.parametrize(
+    "question",
+    [
+        "¿Cuál es el horario de la biblioteca?",
+        "cual es el HORARIO de la Biblioteca",
+        "Horario biblioteca",
+        "  ¿horario   de   biblioteca?!  ",
+    ],
+)
+def test_rephrasings_share_a_key(question):
+    assert question_key(question) == "horario biblioteca"
+
+
+def test_keys_keep_the_meaningful_words():
+    assert question_key("¿Cómo pido una beca?") == "pido beca"
+    assert question_key("horario del comedor") != question_key(
+        "horario de la biblioteca"
+    )
+    assert question_key("¿¡de la que!?") == ""
+
+
+@pytest.mark.parametrize(
+    "question, expected",
+    [
+        ("Soy ana.perez+uni@mail.example.es, ¿y mi nota?",
+         "Soy <email>, ¿y mi nota?"),
+        ("Mi DNI es 12345678Z", "Mi DNI es <número>Z"),
+        ("Llamad al +34 612 345 678", "Llamad al <número>"),
+        ("Expediente 123-456", "Expediente <número>"),
+        ("¿Aula 2.14 en el curso 2024?", "¿Aula 2.14 en el curso 2024?"),
+    ],
+)
+def test_redact(question, expected):
+    assert redact(question) == expected
+
+
+def _write_log(path, questions):
+    with open(path, "w", encoding="utf-8") as file:
+        for question, source in questions:
+            record = {"user_question": question, "source": source}
+            file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def test_mine_groups_every_worker_and_instance(tmp_path):
+    first = tmp_path / "a" / "interactions.log"
+    second = tmp_path / "b" / "interactions.log"
+    first.parent.mkdir()
+    second.parent.mkdir()
+    _write_log(first, [
+        ("¿Horario de la biblioteca?", "graph"),
+        ("¿Horario de la biblioteca?", "precomputed"),
+        ("¿Quién ganó el partido?", "gated"),
+        ("¿Quién ganó el partido?", "gated"),
+        ("¿Quién ganó el partido?", "gated"),
+    ])
+    # Another worker of the same instance, and a rotated backup.
+    _write_log(tmp_path / "a" / "interactions.1.log", [
+        ("horario biblioteca", "graph"),
+    ])
+    _write_log(tmp_path / "a" / "interactions.log.1", [
+        ("¿Cómo pido una beca?", "graph"),
+    ])
+    _write_log(second, [("¿Cómo pido una beca?", "graph")])
+    with open(second, "a", encoding="utf-8") as file:
+        file.write("not json\n{}\n")
+
+    groups = mine_frequent_questions([str(first), str(second)], top_n=5)
+    assert groups == [
+        {"key": "horario biblioteca",
+         "question": "¿Horario de la biblioteca?", "count": 3},
+        {"key": "pido beca", "question": "¿Cómo pido una beca?",
+         "count": 2},
+    ]
+    assert len(mine_frequent_questions([str(first)], top_n=1)) == 1
+    assert mine_frequent_questions([str(first)], 5, min_count=4) == []
+
+
+def test_lookup_only_serves_the_active_version(tmp_path, monkeypatch):
+    active = "kb-1"
+    monkeypatch.setattr(
+        answer_store, "get_active_index_name", lambda: active
+    )
+    store = AnswerStore(str(tmp_path / "answers.db"))
+    key = question_key("¿Horario de la biblioteca?")
+    store.put(key, "¿Horario de la biblioteca?", "De 8 a 21.", "kb-1", 3)
+
+    assert store.lookup("horario biblioteca") == "De 8 a 21."
+    active = "kb-2"
+    assert store.lookup("horario biblioteca") is None
+    assert store.stats() == {
+        "entries": 1, "fresh_entries": 0, "hits": 1, "misses": 1,
+    }
@@ -0,0 +1,63 @@
+import time
+
+import pytest
+
+from backend.app.agents import budget
+from backend.app.agents.budget import AnswerCache
+from backend.app.config.settings import get_settings
+
+
+def test_new_deadline_defaults_to_the_request_budget():
+    seconds = get_settings().REQUEST_BUDGET_SECONDS
+    started = time.monotonic()
+    deadline = budget.new_deadline()
+    assert started + seconds <= deadline <= time.monotonic() + seconds
+
+
+def test_new_deadline_keeps_a_zero_budget():
+    assert budget.new_deadline(0) <= time.monotonic()
+    assert budget.remaining({"deadline": budget.new_deadline(0)}) == 0.0
+
+
+def test_remaining_subtracts_the_reserve():
+    reserve = get_settings().BUDGET_RESERVE_SECONDS
+    left = budget.remaining({"deadline": budget.new_deadline(10)})
+    assert 10 - reserve - 1 < left <= 10 - reserve
+
+
+def test_remaining_without_deadline_is_unbounded():
+    assert budget.remaining({}) == float("inf")
+
+
+def test_answer_cache_evicts_the_least_recently_used():
+    cache = AnswerCache(max_size=2)
+    cache.put("uno", "1")
+    cache.put("dos", "2")
+    assert cache.get("uno") == "1"
+    cache.put("tres", "3")
+    assert cache.get("dos") is None
+    assert cache.get("uno") == "1"
+    assert cache.get("tres") == "3"
+
+
+def test_answer_cache_normalizes_the_question():
+    cache = AnswerCache(max_size=2)
+    cache.put("  ¿Qué es   Azure?  ", "Una nube")
+    assert cache.get("¿qué es azure?") == "Una nube"
+
+
+def test_answer_cache_replaces_an_existing_answer():
+    cache = AnswerCache(max_size=2)
+    cache.put("uno", "1")
+    cache.put("dos", "2")
+    cache.put("uno", "uno")
+    cache.put("tres", "3")
+    assert cache.get("uno") == "uno"
+    assert cache.get("dos") is None
+
+
+@pytest.mark.parametrize("max_size", [0, -1])
+def test_answer_cache_disabled(max_size):
+    cache = AnswerCache(max_size=max_size)
+    cache.put("uno", "1")
+    assert cache.get("uno") is None
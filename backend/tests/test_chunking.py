@@ -0,0 +1,88 @@
+import pytest
+from langchain_core.documents import Document
+
+from backend.app.knowledge_base import chunking
+from backend.app.knowledge_base.chunking import (
+    ELEMENT_SEPARATOR,
+    chunk_documents,
+    split_sections,
+)
+
+
+@pytest.fixture(autouse=True)
+def word_tokens(monkeypatch):
+    # One token per word, so the tests need no tokenizer download.
+    monkeypatch.setattr(
+        chunking, "count_tokens", lambda text: len(text.split())
+    )
+
+
+def _element(text, page=1, category="NarrativeText", source="doc.pdf"):
+    return Document(
+        page_content=text,
+        metadata={
+            "source": source, "page_number": page, "category": category,
+        },
+    )
+
+
+def _page_texts(elements):
+    pages = {}
+    for element in elements:
+        if element.metadata["category"] in chunking.SKIPPED_CATEGORIES:
+            continue
+        key = (element.metadata["source"], element.metadata["page_number"])
+        pages.setdefault(key, []).append(element.page_content.strip())
+    return {key: ELEMENT_SEPARATOR.join(texts) for key, texts in pages.items()}
+
+
+ELEMENTS = [
+    _element("Cabecera", category="Header"),
+    _element("Introducción", category="Title"),
+    _element("Azure AI Search indexa los documentos. " * 6),
+    _element("Cada fragmento guarda su página.\nY su sección."),
+    _element("Detalles", category="Title"),
+    _element("Los fragmentos no cruzan secciones. " * 5),
+    _element("Segunda página con texto propio. " * 4, page=2),
+]
+
+
+def test_chunk_offsets_point_at_their_text_in_the_page():
+    pages = _page_texts(ELEMENTS)
+    chunks = chunk_documents(ELEMENTS, chunk_tokens=12, overlap_tokens=3)
+    assert len(chunks) > len(pages)
+    for chunk in chunks:
+        metadata = chunk.metadata
+        page = pages[(metadata["source"], metadata["page"])]
+        start, end = metadata["start_offset"], metadata["end_offset"]
+        assert page[start:end] == chunk.page_content
+        assert metadata["token_count"] == len(chunk.page_content.split())
+
+
+def test_chunks_do_not_cross_sections_or_pages():
+    chunks = chunk_documents(ELEMENTS, chunk_tokens=12, overlap_tokens=0)
+    sections = {chunk.metadata["section"] for chunk in chunks}
+    assert sections == {"Introducción", "Detalles"}
+    for chunk in chunks:
+        if chunk.metadata["page"] == 2 or (
+            chunk.metadata["section"] == "Introducción"
+        ):
+            assert "secciones" not in chunk.page_content
+        if chunk.metadata["page"] == 1:
+            assert "Segunda" not in chunk.page_content
+
+
+def test_split_sections_skips_repeated_page_elements():
+    page = _page_texts(ELEMENTS)[("doc.pdf", 1)]
+    passages = split_sections(ELEMENTS)
+    assert all("Cabecera" not in p.page_content for p in passages)
+    assert [p.metadata["start_offset"] for p in passages] == [
+        0, page.index("Detalles"), 0,
+    ]
+
+
+def test_repeated_text_gets_increasing_offsets():
+    element = _element("uno dos tres. " * 8)
+    chunks = chunk_documents([element], chunk_tokens=6, overlap_tokens=0)
+    starts = [chunk.metadata["start_offset"] for chunk in chunks]
+    assert starts == sorted(set(starts))
@@ -0,0 +1,230 @@
+import copy
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from azure.core.exceptions import HttpResponseError
+
+from backend.app.knowledge_base import index_registry, refresh
+from backend.app.knowledge_base.index_registry import (
+    BlobRegistryStore,
+    FileRegistryStore,
+    IndexRegistry,
+    RegistryConflictError,
+)
+
+
+class FakeStore:
+    """
+    In-memory registry store. `conflicts` writes fail as if another
+    process had written the registry in between.
+    """
+
+    def __init__(self, conflicts=0):
+        self.state = None
+        self.etag = 0
+        self.conflicts = conflicts
+        self.writes = 0
+
+    def version(self):
+        return None if self.state is None else str(self.etag)
+
+    def read(self):
+        return copy.deepcopy(self.state), str(self.etag)
+
+    def write(self, state, version):
+        self.writes += 1
+        if self.conflicts:
+            self.conflicts -= 1
+            self.etag += 1
+            raise RegistryConflictError("registry")
+        if version != self.version():
+            raise RegistryConflictError("registry")
+        self.state = copy.deepcopy(state)
+        self.etag += 1
+        return str(self.etag)
+
+
+def test_registry_starts_on_the_base_index():
+    registry = IndexRegistry(FakeStore(), "kb")
+    assert registry.active() == "kb"
+    assert registry.active_version()["version"] == "base"
+
+
+def test_activate_and_rollback():
+    registry = IndexRegistry(FakeStore(), "kb")
+    registry.activate("kb-1", "1")
+    registry.activate("kb-2", "2")
+    assert registry.active() == "kb-2"
+
+    restored = registry.rollback()
+    assert restored["index_name"] == "kb-1"
+    assert "retired_at" not in restored
+    versions = {v["index_name"]: v for v in registry.versions()}
+    # The rolled back index stays until it is pruned.
+    assert versions["kb-2"]["rolled_back_at"]
+    assert registry.rollback()["index_name"] == "kb"
+    with pytest.raises(RuntimeError):
+        registry.rollback()
+
+
+def test_update_retries_on_conflict():
+    store = FakeStore(conflicts=2)
+    registry = IndexRegistry(store, "kb")
+    registry.activate("kb-1", "1")
+    assert store.writes == 3
+    assert store.state["active"] == "kb-1"
+
+
+def test_update_gives_up_when_the_registry_keeps_changing():
+    store = FakeStore(conflicts=index_registry.UPDATE_ATTEMPTS)
+    registry = IndexRegistry(store, "kb")
+    with pytest.raises(RuntimeError):
+        registry.activate("kb-1", "1")
+    assert registry.active() == "kb"
+
+
+def test_changes_by_other_processes_are_polled():
+    store = FakeStore()
+    writer = IndexRegistry(store, "kb")
+    reader = IndexRegistry(store, "kb", poll_seconds=0.01)
+    switched = threading.Event()
+    reader.subscribe(lambda index_name: switched.set())
+    reader.start()
+    try:
+        writer.activate("kb-1", "1")
+        assert switched.wait(2)
+        assert reader.active() == "kb-1"
+    finally:
+        reader.stop()
+
+
+def test_reads_keep_the_last_state_while_the_store_is_down():
+    store = FakeStore()
+    registry = IndexRegistry(store, "kb")
+    registry.activate("kb-1", "1")
+
+    def down():
+        raise ConnectionError("storage down")
+
+    store.version = down
+    registry._reload()
+    assert registry.active() == "kb-1"
+    with pytest.raises(ConnectionError):
+        registry.activate("kb-2", "2")
+
+
+def test_file_store_rejects_stale_writes(tmp_path):
+    store = FileRegistryStore(str(tmp_path / "registry.json"))
+    version = store.write({"active": "kb"}, None)
+    with pytest.raises(RegistryConflictError):
+        store.write({"active": "kb-1"}, None)
+    time.sleep(0.01)
+    store.write({"active": "kb-2"}, version)
+    with pytest.raises(RegistryConflictError):
+        store.write({"active": "kb-3"}, version)
+    assert store.read()[0] == {"active": "kb-2"}
+
+
+def test_file_store_lock_is_exclusive(tmp_path):
+    store = FileRegistryStore(str(tmp_path / "registry.json"))
+    with store.exclusive("refresh") as first:
+        with FileRegistryStore(store.path).exclusive("refresh") as second:
+            assert (first, second) == (True, False)
+    with store.exclusive("refresh") as again:
+        assert again
+
+
+class FakeLease:
+    def __init__(self):
+        self.released = False
+
+    def renew(self):
+        pass
+
+    def release(self):
+        self.released = True
+
+
+class FakeBlob:
+    def __init__(self, leased):
+        self.leased = leased
+        self.lease = FakeLease()
+
+    def upload_blob(self, data, overwrite):
+        pass
+
+    def acquire_lease(self, lease_duration):
+        if self.leased:
+            error = HttpResponseError("lease already present")
+            error.status_code = 409
+            raise error
+        return self.lease
+
+
+class FakeContainer:
+    def __init__(self, blob):
+        self.blob = blob
+
+    def get_blob_client(self, name):
+        return self.blob
+
+
+@pytest.mark.parametrize("leased", [False, True])
+def test_blob_store_lease(leased):
+    blob = FakeBlob(leased)
+    store = BlobRegistryStore("conn", "kb-state", "registry.json")
+    store._container = lambda: FakeContainer(blob)
+    with store.exclusive("refresh") as acquired:
+        assert acquired is not leased
+    assert blob.lease.released is not leased
+
+
+@pytest.fixture
+def shared_registry(monkeypatch):
+    registry = IndexRegistry(FakeStore(), "kb")
+    deleted = []
+    monkeypatch.setattr(refresh, "get_index_registry", lambda: registry)
+    monkeypatch.setattr(refresh, "_delete_index", deleted.append)
+    return registry, deleted
+
+
+def _age(registry, index_name, seconds):
+    past = datetime.now(timezone.utc) - timedelta(seconds=seconds)
+
+    def change(state):
+        for version in state["versions"]:
+            if version["index_name"] == index_name:
+                version["retired_at"] = past.isoformat()
+
+    registry._update(change)
+
+
+def test_prune_waits_for_the_grace_period(shared_registry, monkeypatch):
+    registry, deleted = shared_registry
+    monkeypatch.setattr(refresh.get_settings(), "KB_INDEX_RETENTION", 1)
+    registry.activate("kb-1", "1")
+    registry.activate("kb-2", "2")
+
+    refresh.prune_indexes(grace_seconds=60)
+    assert deleted == []
+    _age(registry, "kb-1", 120)
+    refresh.prune_indexes(grace_seconds=60)
+    assert deleted == ["kb-1"]
+    assert [v["index_name"] for v in registry.versions()] == ["kb", "kb-2"]
+
+
+def test_prune_removes_rolled_back_indexes(shared_registry, monkeypatch):
+    registry, deleted = shared_registry
+    monkeypatch.setattr(refresh.get_settings(), "KB_INDEX_RETENTION", 3)
+    registry.activate("kb-1", "1")
+    registry.activate("kb-2", "2")
+    refresh.rollback_knowledge_base()
+    assert deleted == []
+
+    _age(registry, "kb-2", 120)
+    refresh.prune_indexes(grace_seconds=60)
+    # Rolled back indexes go whatever the retention; the base never does.
+    assert deleted == ["kb-2"]
+    assert registry.active() == "kb-1"
@@ -0,0 +1,350 @@
+import asyncio
+import time
+
+import httpx
+import openai
+import pytest
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import (
+    ChatGeneration,
+    ChatGenerationChunk,
+    ChatResult,
+)
+
+from backend.app import model_router
+from backend.app.config.settings import AzureDeployment, get_settings
+from backend.app.model_router import (
+    ModelRouter,
+    RoleMetrics,
+    RoutedChatModel,
+    Usage,
+)
+
+REQUEST = httpx.Request("POST", "https://east.openai.azure.com/chat")
+
+
+def _deployment(name, **prices):
+    return AzureDeployment(
+        name=name,
+        endpoint=f"https://{name}.openai.azure.com/",
+        deployment="gpt-4o",
+        api_key="key",
+        api_version="2024-06-01",
+        **prices,
+    )
+
+
+def _status_error(cls, status, headers=None):
+    response = httpx.Response(status, headers=headers, request=REQUEST)
+    return cls(f"HTTP {status}", response=response, body=None)
+
+
+class FakeClient:
+    """Deployment client answering "ok", or raising the given errors."""
+
+    def __init__(self, *errors, chunks=("o", "k")):
+        self.errors = list(errors)
+        self.chunks = chunks
+        self.calls = 0
+
+    def _next_error(self):
+        self.calls += 1
+        return self.errors.pop(0) if self.errors else None
+
+    def _result(self):
+        return ChatResult(
+            generations=[
+                ChatGeneration(
+                    message=AIMessage(content="ok"),
+                    generation_info={
+                        "headers": {"x-ratelimit-remaining-tokens": "900"}
+                    },
+                )
+            ],
+            llm_output={
+                "model_name": "gpt-4o",
+                "token_usage": {"prompt_tokens": 10, "completion_tokens": 2},
+            },
+        )
+
+    def _generate(self, messages, **kwargs):
+        error = self._next_error()
+        if error:
+            raise error
+        return self._result()
+
+    async def _agenerate(self, messages, **kwargs):
+        return self._generate(messages, **kwargs)
+
+    async def ainvoke(self, *args, **kwargs):
+        return self._generate(args)
+
+    async def _astream(self, messages, **kwargs):
+        error = self._next_error()
+        for index, text in enumerate(self.chunks):
+            if error and index == len(self.chunks) - 1:
+                raise error
+            yield ChatGenerationChunk(message=AIMessageChunk(content=text))
+        if error:
+            raise error
+
+
+@pytest.fixture
+def router():
+    return ModelRouter(
+        [_deployment("east"), _deployment("west"), _deployment("north")],
+        exploration=0.0,
+        cooldown_seconds=10.0,
+    )
+
+
+@pytest.fixture(autouse=True)
+def role_metrics(monkeypatch):
+    metrics = RoleMetrics()
+    monkeypatch.setitem(model_router._role_metrics, "answer", metrics)
+    return metrics
+
+
+def _serve(router, name, latency):
+    router.start(name)
+    router.record_success(name, latency)
+
+
+def _fail(router, name, error):
+    router.start(name)
+    router.record_failure(name, error)
+
+
+def _stats(router, name):
+    return next(s for s in router.stats() if s["name"] == name)
+
+
+def test_unmeasured_deployments_are_assumed_as_fast_as_the_best(router):
+    _serve(router, "east", 0.1)
+    _serve(router, "west", 0.2)
+    assert router.candidates() == ["east", "north", "west"]
+
+
+def test_candidates_prefer_the_lowest_latency(router):
+    _serve(router, "east", 0.8)
+    _serve(router, "west", 0.2)
+    _serve(router, "north", 0.5)
+    assert router.candidates() == ["west", "north", "east"]
+
+
+def test_latency_is_an_ewma(router):
+    _serve(router, "east", 1.0)
+    _serve(router, "east", 2.0)
+    assert _stats(router, "east")["latency_ewma_ms"] == pytest.approx(1200)
+
+
+def test_errors_penalise_a_fast_deployment(router):
+    _serve(router, "east", 0.1)
+    _serve(router, "west", 0.2)
+    _serve(router, "north", 0.25)
+    for _ in range(3):
+        _fail(router, "east", ValueError("boom"))
+    assert router.candidates()[-1] == "east"
+    assert _stats(router, "east")["error_ewma"] == pytest.approx(
+        1 - 0.8 ** 3, abs=1e-3
+    )
+
+
+def test_successes_decay_the_error_rate(router):
+    _fail(router, "east", ValueError("boom"))
+    _serve(router, "east", 0.1)
+    stats = _stats(router, "east")
+    assert stats["error_ewma"] == pytest.approx(0.16)
+    assert stats["last_error"] is None
+
+
+def test_calls_in_flight_spread_the_load(router):
+    for name in ("east", "west", "north"):
+        _serve(router, name, 0.2)
+    router.start("east")
+    router.start("west")
+    assert router.candidates()[0] == "north"
+
+
+def test_exhausted_quota_goes_last(router):
+    for name in ("east", "west", "north"):
+        _serve(router, name, 0.2)
+    router.start("east")
+    router.record_success(
+        "east", 0.1, {"x-ratelimit-remaining-requests": "0"}
+    )
+    assert router.candidates()[-1] == "east"
+
+
+def test_quota_fraction_is_relative_to_the_highest_seen(router):
+    router.start("east")
+    router.record_success(
+        "east", 0.1, {"x-ratelimit-remaining-tokens": "1000"}
+    )
+    router.start("east")
+    router.record_success(
+        "east", 0.1, {"X-RateLimit-Remaining-Tokens": "250"}
+    )
+    assert router._stats["east"].quota_fraction() == 0.25
+
+
+def test_throttled_deployment_cools_down_for_retry_after(router):
+    _serve(router, "east", 0.1)
+    _serve(router, "west", 0.5)
+    error = _status_error(
+        openai.RateLimitError, 429, headers={"retry-after": "7"}
+    )
+    _fail(router, "east", error)
+    stats = router._stats["east"]
+    assert stats.throttled == 1
+    assert stats.cooldown_until - time.monotonic() == pytest.approx(7, 0.1)
+    assert router.candidates()[-1] == "east"
+
+
+def test_throttle_without_retry_after_uses_the_default_cooldown(router):
+    _fail(router, "east", _status_error(openai.RateLimitError, 429))
+    remaining = router._stats["east"].cooldown_until - time.monotonic()
+    assert remaining == pytest.approx(10, 0.1)
+
+
+def test_exploration_moves_a_random_deployment_first(router, monkeypatch):
+    router.exploration = 1.0
+    _serve(router, "east", 0.1)
+    monkeypatch.setattr(model_router.random, "randrange", lambda a, b: 2)
+    assert router.candidates()[0] != "east"
+
+
+FAILOVER_ERRORS = [
+    _status_error(openai.RateLimitError, 429),
+    _status_error(openai.InternalServerError, 500),
+    openai.APIConnectionError(request=REQUEST),
+    openai.APITimeoutError(request=REQUEST),
+]
+
+
+@pytest.mark.parametrize("error", FAILOVER_ERRORS)
+def test_failover_to_the_next_deployment(router, role_metrics, error):
+    _serve(router, "east", 0.1)
+    _serve(router, "west", 0.2)
+    _serve(router, "north", 0.3)
+    router._clients = {
+        "east": FakeClient(error), "west": FakeClient(), "north": FakeClient()
+    }
+    model = RoutedChatModel(router=router, role="answer")
+
+    assert asyncio.run(model.ainvoke("hola")).content == "ok"
+    assert router._clients["east"].calls == 1
+    assert router._clients["west"].calls == 1
+    assert router._clients["north"].calls == 0
+    assert _stats(router, "east")["failures"] == 1
+    assert all(s["in_flight"] == 0 for s in router.stats())
+    assert role_metrics.failures == 1
+    assert role_metrics.deployments == {"west": 1}
+
+
+def test_other_errors_do_not_fail_over(router):
+    router._clients = {name: FakeClient() for name in router._clients}
+    router._clients["east"] = FakeClient(ValueError("bad request"))
+    _serve(router, "east", 0.1)
+    model = RoutedChatModel(router=router, role="answer")
+
+    with pytest.raises(ValueError):
+        model.invoke("hola")
+    assert router._clients["west"].calls == 0
+
+
+def test_the_last_error_is_raised_when_every_deployment_fails(router):
+    errors = [
+        _status_error(openai.InternalServerError, 500) for _ in range(3)
+    ]
+    router._clients = {
+        name: FakeClient(error)
+        for name, error in zip(router._clients, errors)
+    }
+    model = RoutedChatModel(router=router, role="answer")
+
+    with pytest.raises(openai.InternalServerError):
+        model.invoke("hola")
+    assert all(s["failures"] == 1 for s in router.stats())
+
+
+def test_stream_fails_over_before_the_first_token(router):
+    _serve(router, "east", 0.1)
+    _serve(router, "west", 0.2)
+    _serve(router, "north", 0.3)
+    router._clients = {
+        "east": FakeClient(
+            _status_error(openai.RateLimitError, 429), chunks=("x",)
+        ),
+        "west": FakeClient(),
+        "north": FakeClient(),
+    }
+    model = RoutedChatModel(router=router, role="answer")
+
+    async def collect():
+        return [chunk.content async for chunk in model.astream("hola")]
+
+    assert "".join(asyncio.run(collect())) == "ok"
+    assert router._clients["west"].calls == 1
+
+
+def test_stream_is_not_replayed_after_a_token(router):
+    _serve(router, "east", 0.1)
+    router._clients = {
+        "east": FakeClient(_status_error(openai.InternalServerError, 500)),
+        "west": FakeClient(),
+        "north": FakeClient(),
+    }
+    model = RoutedChatModel(router=router, role="answer")
+
+    async def collect():
+        return [chunk.content async for chunk in model.astream("hola")]
+
+    with pytest.raises(openai.InternalServerError):
+        asyncio.run(collect())
+    assert router._clients["west"].calls == 0
+    assert _stats(router, "east")["in_flight"] == 0
+
+
+def test_probe_records_the_outcome(router):
+    router._clients["east"] = FakeClient()
+    router._clients["west"] = FakeClient(ValueError("down"))
+    asyncio.run(router.probe("east"))
+    with pytest.raises(ValueError):
+        asyncio.run(router.probe("west"))
+    assert _stats(router, "east")["latency_ewma_ms"] is not None
+    assert _stats(router, "west")["last_error"] == "down"
+    assert router.idle_deployments(60) == ["north"]
+
+
+def test_cost_uses_the_configured_prices():
+    deployment = _deployment(
+        "east",
+        input_cost_per_1k=1.0,
+        cached_input_cost_per_1k=0.5,
+        output_cost_per_1k=2.0,
+    )
+    usage = Usage("gpt-4o", prompt_tokens=1000, completion_tokens=500,
+                  cached_tokens=400)
+    assert model_router._cost(deployment, usage) == pytest.approx(
+        (600 * 1.0 + 400 * 0.5 + 500 * 2.0) / 1000
+    )
+
+
+def test_cost_charges_cached_tokens_at_the_input_price_by_default():
+    deployment = _deployment("east", input_cost_per_1k=1.0)
+    usage = Usage(None, prompt_tokens=1000, cached_tokens=400)
+    assert model_router._cost(deployment, usage) == pytest.approx(1.0)
+
+
+def test_cost_of_an_unknown_model_is_zero():
+    assert model_router._cost(_deployment("east"), Usage()) == 0.0
+
+
+def test_pool_wait_is_bounded_by_the_request_budget():
+    settings = get_settings()
+    clients = model_router._http_clients(4)
+    assert clients["http_async_client"].timeout.pool == min(
+        settings.LLM_POOL_TIMEOUT_SECONDS, settings.REQUEST_BUDGET_SECONDS
+    )
+    assert model_router._http_clients(None) == {}
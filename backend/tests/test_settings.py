@@ -0,0 +1,44 @@
+import pytest
+from pydantic import ValidationError
+from pydantic_settings import SettingsError
+
+from backend.app.config.settings import Settings
+
+
+def test_unknown_condense_strategy_fails_at_startup(monkeypatch):
+    monkeypatch.setenv("RAG_CONDENSE_STRATEGY", "sometimes")
+    with pytest.raises(ValidationError, match="RAG_CONDENSE_STRATEGY"):
+        Settings()
+
+
+def test_condense_strategy_is_read_from_the_environment(monkeypatch):
+    monkeypatch.setenv("RAG_CONDENSE_STRATEGY", "parallel")
+    assert Settings().RAG_CONDENSE_STRATEGY == "parallel"
+
+
+def test_deployment_pools_are_parsed_from_json(monkeypatch):
+    monkeypatch.setenv(
+        "AZURE_LLM_ROLE_DEPLOYMENTS",
+        '{"condense": [{"endpoint": "https://a", "deployment": "mini"}]}',
+    )
+    monkeypatch.setenv("KB_SMOKE_QUERIES", '["inventario"]')
+    settings = Settings()
+    (deployment,) = settings.AZURE_LLM_ROLE_DEPLOYMENTS["condense"]
+    assert deployment.deployment == "mini"
+    assert settings.KB_SMOKE_QUERIES == ["inventario"]
+
+
+@pytest.mark.parametrize("variable", [
+    "AZURE_LLM_DEPLOYMENTS",
+    "AZURE_LLM_ROLE_DEPLOYMENTS",
+    "KB_SMOKE_QUERIES",
+])
+def test_malformed_json_names_the_variable(monkeypatch, variable):
+    monkeypatch.setenv(variable, '[{"endpoint":')
+    with pytest.raises(SettingsError, match=variable):
+        Settings()
+
+
+def test_empty_json_variable_means_the_default(monkeypatch):
+    monkeypatch.setenv("AZURE_LLM_DEPLOYMENTS", "")
+    assert Settings().AZURE_LLM_DEPLOYMENTS == []
@@ -0,0 +1,88 @@
+import json
+
+import pytest
+
+from backend.app.agents.supervisor_parser import (
+    SupervisorOutputError,
+    SupervisorStreamParser,
+)
+
+DECISION = {
+    "type": "FinalAnswer",
+    "data": {"answer": 'Sí: "Azure" \\ cómo está él', "notes": []},
+}
+
+
+def _feed(text, size):
+    parser = SupervisorStreamParser()
+    deltas = [
+        parser.feed(text[i:i + size]) for i in range(0, len(text), size)
+    ]
+    return parser, "".join(deltas)
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 1000])
+def test_answer_streams_whatever_the_chunk_size(size):
+    text = json.dumps(DECISION)
+    parser, streamed = _feed(text, size)
+    assert streamed == DECISION["data"]["answer"]
+    assert parser.decision_type == "FinalAnswer"
+    assert parser.result() == DECISION
+
+
+def test_unicode_escapes_are_decoded_across_chunks():
+    text = json.dumps(DECISION, ensure_ascii=True)
+    assert "\\u00e9" in text
+    _, streamed = _feed(text, 1)
+    assert streamed == DECISION["data"]["answer"]
+
+
+def test_answer_waits_for_the_decision_type():
+    decision = {"data": {"answer": "Hola"}, "type": "FinalAnswer"}
+    parser = SupervisorStreamParser()
+    text = json.dumps(decision)
+    split = text.index('"type"')
+    assert parser.feed(text[:split]) == ""
+    assert parser.feed(text[split:]) == "Hola"
+
+
+def test_search_query_and_code_fence():
+    decision = {
+        "type": "SearchWikipedia",
+        "data": {"search_query": "Azure OpenAI"},
+    }
+    text = "```json\n" + json.dumps(decision) + "\n```"
+    parser, streamed = _feed(text, 4)
+    assert streamed == ""
+    assert parser.search_query == "Azure OpenAI"
+    assert parser.result() == decision
+
+
+def test_nested_strings_are_not_taken_as_fields():
+    decision = {
+        "type": "CorrectAndRefine",
+        "data": {"extra": {"type": "FinalAnswer"}, "corrected_answer": "Ok"},
+    }
+    parser, streamed = _feed(json.dumps(decision), 5)
+    assert parser.decision_type == "CorrectAndRefine"
+    assert streamed == "Ok"
+
+
+@pytest.mark.parametrize("text", [
+    "no es JSON",
+    '{"type": "FinalAnswer"}',
+    '{"type": "FinalAnswer", "data": "texto"}',
+    '{"type": "FinalAnswer", "data": {"answer": "cortado',
+])
+def test_invalid_output_raises(text):
+    parser, _ = _feed(text, 3)
+    with pytest.raises(SupervisorOutputError):
+        parser.result()
+
+
+def test_nothing_streams_after_the_object_closes():
+    parser = SupervisorStreamParser()
+    assert parser.feed('{"type": "FinalAnswer"}]]') == ""
+    assert parser.feed(', "data": {"answer": "Hola"}}') == ""
+    with pytest.raises(SupervisorOutputError):
+        parser.result()
@@ -4,6 +4,8 @@ class ChatbotInterface {
         this.sessionId = this.generateSessionId();
         this.messages = [];
         this.isTyping = false;
+        this.socket = null;
+        this.pending = null;
         
         this.init();
     }
@@ -11,9 +13,66 @@ class ChatbotInterface {
     init() {
         this.setupEventListeners();
         this.checkAPIHealth();
+        this.connectWebSocket();
         this.setupPWA();
     }
 
+    connectWebSocket() {
+        const wsUrl = this.apiBaseUrl.replace(/^http/, 'ws');
+        const socket = new WebSocket(`${wsUrl}/api/ws/chat?session_id=${this.sessionId}`);
+
+        socket.onopen = () => {
+            this.socket = socket;
+        };
+        socket.onmessage = (event) => this.handleSocketEvent(JSON.parse(event.data));
+        socket.onclose = () => {
+            this.socket = null;
+            if (this.pending) {
+                this.pending.reject(new Error('Conexión cerrada'));
+                this.pending = null;
+            }
+            setTimeout(() => this.connectWebSocket(), 3000);
+        };
+    }
+
+    handleSocketEvent(event) {
+        if (!this.pending) return;
+
+        if (event.type === 'stage' && event.status === 'start') {
+            this.setTypingLabel(event.stage);
+        } else if (event.type === 'token') {
+            // Each stage streams a new draft that replaces the previous one.
+            if (event.stage !== this.pending.draftStage) {
+                this.pending.draftStage = event.stage;
+                this.pending.draft = '';
+            }
+            this.pending.draft += event.content;
+            this.updateDraft(this.pending.draft);
+        } else if (event.type === 'answer') {
+            this.pending.resolve(event.response);
+            this.pending = null;
+        } else if (event.type === 'cancelled') {
+            this.pending.resolve('Pregunta cancelada.');
+            this.pending = null;
+        } else if (event.type === 'error') {
+            this.pending.reject(new Error(event.detail));
+            this.pending = null;
+        }
+    }
+
+    askOverSocket(message) {
+        return new Promise((resolve, reject) => {
+            this.pending = { resolve, reject, draft: '', draftStage: null };
+            this.socket.send(JSON.stringify({ type: 'message', message: message }));
+        });
+    }
+
+    cancelQuestion() {
+        if (this.socket && this.pending) {
+            this.socket.send(JSON.stringify({ type: 'cancel' }));
+        }
+    }
+
     generateSessionId() {
         const timestamp = Date.now();
         const random = Math.random().toString(36).substr(2, 9);
@@ -24,6 +83,7 @@ class ChatbotInterface {
         document.addEventListener('keydown', (e) => {
             if (e.key === 'Escape' && document.getElementById('chatInterface').classList.contains('active')) {
                 document.getElementById('chatInput').value = '';
+                this.cancelQuestion();
             }
         });
 
@@ -80,7 +140,9 @@ class ChatbotInterface {
         this.showTypingIndicator();
 
         try {
-            const response = await this.callAPI(message);
+            const response = this.socket
+                ? await this.askOverSocket(message)
+                : await this.callAPI(message);
             this.hideTypingIndicator();
             this.addMessage(response, 'ai');
         } catch (error) {
@@ -185,11 +247,41 @@ class ChatbotInterface {
         this.isTyping = true;
     }
 
+    setTypingLabel(stage) {
+        const labels = {
+            call_rag_agent: 'Buscando en la base de conocimiento...',
+            call_supervisor_agent: 'Revisando la respuesta...',
+            enrich_with_wikipedia: 'Complementando con Wikipedia...',
+            prepare_final_response: 'Preparando la respuesta...'
+        };
+        const label = document.querySelector('#typingIndicator span');
+        if (label && labels[stage]) {
+            label.textContent = labels[stage];
+        }
+    }
+
+    updateDraft(text) {
+        const messagesContainer = document.getElementById('chatMessages');
+        let draft = document.getElementById('draftMessage');
+        if (!draft) {
+            draft = document.createElement('div');
+            draft.className = 'message ai';
+            draft.id = 'draftMessage';
+            messagesContainer.insertBefore(draft, document.getElementById('typingIndicator'));
+        }
+        draft.innerHTML = `<div class="message-content">${marked.parse(text)}</div>`;
+        messagesContainer.scrollTop = messagesContainer.scrollHeight;
+    }
+
     hideTypingIndicator() {
         const typingIndicator = document.getElementById('typingIndicator');
         if (typingIndicator) {
             typingIndicator.remove();
         }
+        const draft = document.getElementById('draftMessage');
+        if (draft) {
+            draft.remove();
+        }
         this.isTyping = false;
     }
 